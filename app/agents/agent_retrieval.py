@@ -1,13 +1,14 @@
 import threading
-from typing import Any, AsyncGenerator, Dict, Iterator, List, Optional
+from typing import Any, AsyncGenerator, Dict, Iterator, List, Literal, Optional
 from langchain_core.documents.base import Document
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain_core.prompts import PromptTemplate
-from app.services.sharepoint_service import set_gpt_model
+from app.services.service_container import services
 from pydantic import BaseModel, Field
 from langchain.output_parsers import PydanticOutputParser
 from app.utils.utils_openai_prompt import (
     DOCUMENT_RETRIEVAL_PROMPT,
+    BATCH_DOCUMENT_RETRIEVAL_PROMPT,
     FOLLOWUP_QUESTION_PROMPT,
     VECTOR_STORE_RETRIEVAL_PROMPT,
     CREATIVE_WRITING_PROMPT,
@@ -17,14 +18,12 @@ from app.utils.utils_openai_prompt import (
     FINAL_FOLLOWUP_QUESTION_PROMPT,
     QUERY_ROUTER,
     AMBIGUITY_FOLLOWUP_PROMPT,
+    QUERY_ANALYSIS_PROMPT,
 )
 from app.config.set_logger import set_logger
 
 logger = set_logger()
 
-llm_gpt4o_mini = set_gpt_model(AZURE_OPENAI_GPT4o_MODEL).create_llm_instance()
-llm_gpt4o = set_gpt_model(AZURE_OPENAI_GPT4o_MODEL).create_llm_instance()
-
 
 def extract_llm_text(text: str) -> str:
     """Extract Gremlin code from a text."""
@@ -36,10 +35,44 @@ def extract_llm_text(text: str) -> str:
     return text.replace("\n", "")
 
 
+class DocumentGrade(BaseModel):
+    """Relevance grade of a single retrieved document."""
+
+    index: int = Field(description="Index of the graded document as given in the prompt")
+    score: Literal["yes", "maybe", "no"] = Field(description="Relevance of the document to the query")
+    assessment: str = Field(description="Justification including specific matches or relationships found")
+    name: str = Field(description="Descriptive document title focusing on content type")
+
+
+class DocumentGradeBatch(BaseModel):
+    """Relevance grades of all retrieved documents."""
+
+    grades: List[DocumentGrade]
+
+
+def format_documents_for_grading(documents: List[Document]) -> str:
+    """
+    Numbers the documents so the batch grader can refer back to them by index. Like the
+    per-document grader, it sees each document's metadata (source, url, score) next to its content.
+    """
+    return "\n\n".join(
+        f"[Document {index}]\nMetadata: {document.metadata}\n{document.page_content}"
+        for index, document in enumerate(documents)
+    )
+
+
 class AgentRetrieval:
-    def __init__(self):
-        self.llm_gpt4o_mini = llm_gpt4o_mini
-        self.llm_gpt4o = llm_gpt4o
+    def __init__(self, gpt4o=None, gpt4o_mini=None):
+        self._llm_gpt4o = gpt4o
+        self._llm_gpt4o_mini = gpt4o_mini
+
+    @property
+    def llm_gpt4o(self):
+        return self._llm_gpt4o or services.llm_gpt4o
+
+    @property
+    def llm_gpt4o_mini(self):
+        return self._llm_gpt4o_mini or services.llm_gpt4o_mini
 
     def rephrase_user_query(self):  # -> RunnableSerializable[dict, str]:
         rephrase_query_generator = PromptTemplate(
@@ -62,6 +95,14 @@ class AgentRetrieval:
         )
         return query_router | self.llm_gpt4o | JsonOutputParser()
 
+    def query_analyzer(self):
+        """Rephrases, checks ambiguity and routes a query in one call."""
+        query_analysis = PromptTemplate(
+            input_variables=["chat_history", "raw_query"],
+            template=QUERY_ANALYSIS_PROMPT,
+        )
+        return query_analysis | self.llm_gpt4o | JsonOutputParser()
+
     def retrieved_documents_grader(self):
         prompt = PromptTemplate(
             template=DOCUMENT_RETRIEVAL_PROMPT,
@@ -70,6 +111,16 @@ class AgentRetrieval:
 
         return prompt | self.llm_gpt4o_mini | JsonOutputParser()
 
+    def retrieved_documents_batch_grader(self):
+        prompt = PromptTemplate(
+            template=BATCH_DOCUMENT_RETRIEVAL_PROMPT,
+            input_variables=["rephrased_query", "vector_doc"],
+        )
+
+        return prompt | self.llm_gpt4o_mini.with_structured_output(
+            DocumentGradeBatch, method="function_calling"
+        )
+
     def vector_based_final_answer_generation(self):
         final_answer_generation_prompt = PromptTemplate(
             input_variables=[
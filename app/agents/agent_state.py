@@ -1,63 +1,75 @@
 import asyncio
 import json
+from contextlib import contextmanager
+from contextvars import ContextVar
 from typing import Annotated, Any, List, Literal
 import uuid
 import openai
 import os
 import datetime
 from azure.core.exceptions import ServiceResponseError
-from app.agents.agent_retrieval import AgentRetrieval, extract_llm_text
+from app.agents.agent_retrieval import AgentRetrieval, extract_llm_text, format_documents_for_grading
 from typing_extensions import TypedDict
 from app.services.sharepoint_service import semantic_logic_multi_index_retrieval
 from app.config.set_logger import set_logger
 
-from app.services.cosmos_service import CosmosService
-from app.services.authentication_service import AuthenticationService
-from app.services.user_validation_service import UserValidationService
-from app.services.team_messaging_service import TeamsMessagingService
-from app.services.azure_blob_service import AzureBlobService
-from app.services.openai_service import OpenAIService
-from app.services.dalle3_service import DallE3Service
-from app.services.token_validation_service import TokenValidationService
-
-from app.services.dalle3_service import DallE3Service
-from app.utils.util_url_generator import UtilUrlGenerator
+from app.services.llm_cache_service import chain_version
+from app.services.service_container import services
 from app.utils.util_helper_methods import HelperMethods
 from app.config.constants import (
-    COSMOS_HOST, 
-    COSMOS_KEY, 
-    COSMOS_DATABASE, 
-    COSMOS_USER_INTERACTIONS_CONTAINER, 
-    COSMOS_IMAGES_INFO_CONTAINER, 
-    COSMOS_REPLY_TO_ID_CONTAINER,
-    MICROSOFT_TENANT_ID, 
-    MICROSOFT_APP_ID, 
-    MICROSOFT_APP_SECRET, 
-    BLOB_ACCOUNT_NAME, 
-    BLOB_ACCOUNT_KEY, 
-    BLOB_CONTAINER_NAME, 
-    OPEN_AI_BASE_URL, 
-    OPEN_AI_KEY, 
-    OPEN_AI_DEPLOYMENT_NAME, 
-    OPEN_AI_VERSION,
-    OPEN_AI_DALLE_DEPLOYMENT_NAME
+    DOCUMENT_GRADE_LOG_PREFIX,
+    GRADE_DOCUMENTS_BATCH_MODE,
+    LLM_CACHE_ENABLED,
+    LOCAL_ROUTER_ENABLED,
+    QUERY_ROUTE_LOG_PREFIX,
+    RERANKER_ACCEPT_SCORE,
+    RERANKER_REJECT_SCORE,
+    RERANKER_SCORE_BANDS_ENABLED,
+    SEMANTIC_CACHE_ENABLED,
+    SPECULATIVE_RETRIEVAL_ENABLED,
 )
 
 logger = set_logger()
 
+# set while a run must neither read nor fill the LLM and semantic caches, e.g. the startup warm-up
+_caches_bypassed = ContextVar("caches_bypassed", default=False)
+# set while a run must route every query with the LLM router, e.g. the startup warm-up
+_local_router_bypassed = ContextVar("local_router_bypassed", default=False)
+# chains used instead of `agent_retrieval` by the runs of one context, e.g. stub LLMs for the warm-up
+_agent_retrieval_override = ContextVar("agent_retrieval_override", default=None)
+
 agent_retrieval = AgentRetrieval()
 
-cosmos_service = CosmosService(os.getenv(COSMOS_HOST), os.getenv(COSMOS_KEY), os.getenv(COSMOS_DATABASE), os.getenv(COSMOS_USER_INTERACTIONS_CONTAINER), os.getenv(COSMOS_IMAGES_INFO_CONTAINER), os.getenv(COSMOS_REPLY_TO_ID_CONTAINER))
-token_validation_service = TokenValidationService(os.getenv(MICROSOFT_TENANT_ID))
-authentication_service = AuthenticationService(os.getenv(MICROSOFT_TENANT_ID), os.getenv(MICROSOFT_APP_ID), os.getenv(MICROSOFT_APP_SECRET), token_validation_service)
-user_validation_service = UserValidationService(os.getenv(MICROSOFT_TENANT_ID), os.getenv(MICROSOFT_APP_ID), os.getenv(MICROSOFT_APP_SECRET))
-team_messaging_service = TeamsMessagingService()
-azure_blob_service = AzureBlobService(os.getenv(BLOB_ACCOUNT_NAME), os.getenv(BLOB_ACCOUNT_KEY), os.getenv(BLOB_CONTAINER_NAME))
-openai_service = OpenAIService(UtilUrlGenerator.create_open_ai_url(os.getenv(OPEN_AI_BASE_URL), os.getenv(OPEN_AI_DEPLOYMENT_NAME)), os.getenv(OPEN_AI_KEY), os.getenv(OPEN_AI_DEPLOYMENT_NAME), os.getenv(OPEN_AI_VERSION))
-dalle3_service = DallE3Service(UtilUrlGenerator.create_open_ai_url(os.getenv(OPEN_AI_BASE_URL), os.getenv(OPEN_AI_DALLE_DEPLOYMENT_NAME)) , os.getenv(OPEN_AI_KEY), os.getenv(OPEN_AI_DALLE_DEPLOYMENT_NAME), os.getenv(OPEN_AI_VERSION))
+
+@contextmanager
+def _context_value(variable, value):
+    token = variable.set(value)
+    try:
+        yield
+    finally:
+        variable.reset(token)
+
+
+def bypass_caches():
+    """Skips the LLM and semantic caches for workflow runs started in this context."""
+    return _context_value(_caches_bypassed, True)
+
+
+def bypass_local_router():
+    """Routes every query with the LLM router for workflow runs started in this context."""
+    return _context_value(_local_router_bypassed, True)
+
+
+def use_agent_retrieval(retrieval):
+    """Builds the chains of workflow runs started in this context from `retrieval`; other runs are unaffected."""
+    return _context_value(_agent_retrieval_override, retrieval)
 
 
-async def robust_llm_call(llm_chain, input_data, max_retries=3, backoff_strategy=None):
+def get_agent_retrieval():
+    return _agent_retrieval_override.get() or agent_retrieval
+
+
+async def robust_llm_call(llm_chain, input_data, max_retries=3, backoff_strategy=None, cache_name=None):
     """
     Makes a call to the LLM with retry logic and error handling.
 
@@ -66,13 +78,24 @@ async def robust_llm_call(llm_chain, input_data, max_retries=3, backoff_strategy
         input_data: The input data for the LLM.
         max_retries: Maximum number of retry attempts.
         backoff_strategy: Function to determine backoff time based on attempt number.
+        cache_name: Name under which responses of this chain are cached, if caching is configured for it.
 
     Returns:
-        A dictionary with the response or error information.
+        A dictionary with the response or error information; `cached` is set when the response
+        came from the LLM cache.
     """
     if backoff_strategy is None:
         backoff_strategy = lambda attempt: 2**attempt
 
+    llm_cache = services.llm_cache if LLM_CACHE_ENABLED and cache_name and not _caches_bypassed.get() else None
+    if llm_cache is not None and llm_cache.is_cached_chain(cache_name):
+        version = chain_version(llm_chain)
+        cached_response = llm_cache.get(cache_name, input_data, version)
+        if cached_response is not None:
+            return {"success": True, "response": cached_response, "cached": True}
+    else:
+        llm_cache = None
+
     for attempt in range(max_retries):
         try:
             response = await llm_chain.ainvoke(
@@ -81,6 +104,8 @@ async def robust_llm_call(llm_chain, input_data, max_retries=3, backoff_strategy
             )
             logger.info(f"LLM call succeeded on attempt {attempt + 1}")
             logger.info(f"the response for the poetry prompt is as below: \n\n {response}")
+            if llm_cache is not None:
+                llm_cache.set(cache_name, input_data, response, version)
             return {"success": True, "response": response}
         except (openai.RateLimitError, ServiceResponseError) as e:
             logger.error(
@@ -113,6 +138,64 @@ async def grade_document(retrieval_grader, question, document):
     return score, document
 
 
+async def grade_documents_batch(batch_grader, question, documents):
+    """Helper function to grade all documents with a single LLM call."""
+
+    batch = await robust_llm_call(
+        llm_chain=batch_grader,
+        input_data={
+            "rephrased_query": question,
+            "vector_doc": format_documents_for_grading(documents),
+        },
+    )
+    if "error" in batch:
+        return [(batch, d) for d in documents]
+
+    grades = {grade.index: grade for grade in batch["response"].grades}
+    results = []
+    for index, d in enumerate(documents):
+        grade = grades.get(index)
+        if grade is None:
+            logger.warning("### Batch grader returned no grade for document %s", index)
+            response = {
+                "score": "maybe",
+                "assessment": "Document was not graded by the batch grader",
+                "name": d.metadata.get("source") or "",
+            }
+        else:
+            response = grade.model_dump(exclude={"index"})
+        results.append(({"success": True, "response": response}, d))
+    return results
+
+
+def reranker_band(document, accept_score, reject_score):
+    """
+    Places a document in the band of its semantic reranker score: "accept", "reject" or "grade".
+    Documents without a score are always graded.
+    """
+    score = document.metadata.get("score")
+    if score is None:
+        return "grade"
+    if score >= accept_score:
+        return "accept"
+    if score < reject_score:
+        return "reject"
+    return "grade"
+
+
+def reranker_grade(document, band):
+    """Builds the grader response for a document accepted or rejected by its reranker score."""
+    accepted = band == "accept"
+    return {
+        "success": True,
+        "response": {
+            "score": "yes" if accepted else "no",
+            "assessment": f"{'Accepted' if accepted else 'Rejected'} by semantic reranker score {document.metadata['score']:.2f}",
+            "name": document.metadata.get("source") or "",
+        },
+    }
+
+
 class ChatAgent(TypedDict):
     """
     Represents the state of our langraph chat agent.
@@ -139,6 +222,29 @@ class ChatAgent(TypedDict):
     error_occurred: bool
     data: dict
     image_answer: dict
+    query_embedding: List[float]
+    cache_hit: bool
+    speculation_id: str
+
+
+def start_speculative_retrieval(state: ChatAgent):
+    """
+    Starts retrieving documents for the raw query before it is rephrased and routed.
+    Returns the speculation id to keep in the state, or None when speculation is off.
+    """
+    if not SPECULATIVE_RETRIEVAL_ENABLED or not state.get("allowed_index"):
+        return None
+    try:
+        return services.speculative_retrieval.start(state["raw_query"], state["allowed_index"])
+    except Exception:
+        logger.exception("Failed to start speculative retrieval.")
+        return None
+
+
+def discard_speculative_retrieval(speculation_id, reason):
+    """Cancels a speculative retrieval whose documents will not be used."""
+    if speculation_id:
+        services.speculative_retrieval.discard(speculation_id, reason)
 
 
 async def handle_error(state: ChatAgent):
@@ -175,12 +281,15 @@ async def rephrase_query(state: ChatAgent):
     logger.info("---REPHRASE QUERY---")
     question = state["raw_query"]
     chat_history = state["chat_history"]
-    rephrase_chain = agent_retrieval.rephrase_user_query()
+    speculation_id = start_speculative_retrieval(state)
+    rephrase_chain = get_agent_retrieval().rephrase_user_query()
     rephrased_query = await robust_llm_call(
         llm_chain=rephrase_chain,
         input_data={"raw_query": question, "chat_history": chat_history},
+        cache_name="rephrase_query",
     )
     if "error" in rephrased_query:
+        discard_speculative_retrieval(speculation_id, "error")
         return {"final_answer": rephrased_query["error"], "error_occurred": True}
 
     if isinstance(rephrased_query, dict):
@@ -188,10 +297,14 @@ async def rephrase_query(state: ChatAgent):
     elif isinstance(rephrased_query, str):
         cleaned_output = json.loads(rephrased_query)
     logger.debug("### Rephrased query: %s", cleaned_output)
+    if cleaned_output["response"]["output"] == "ambiguous":
+        discard_speculative_retrieval(speculation_id, "ambiguous")
+        speculation_id = None
 
     return {
         "rephrased_query": cleaned_output["response"]["output"],
         "ambiguity_status": cleaned_output["response"]["output"],
+        "speculation_id": speculation_id or "",
         "error_occurred": False,
     }
 
@@ -199,10 +312,11 @@ async def rephrase_query(state: ChatAgent):
 async def followup_ambiguous_queries(state: ChatAgent):
     logger.info("---FOLLOWUP AMBIGUOUS QUESTION---")
     question = state["raw_query"]
-    followup_chain = agent_retrieval.ambiguity_resolver()
+    followup_chain = get_agent_retrieval().ambiguity_resolver()
     followup_query = await robust_llm_call(
         llm_chain=followup_chain,
         input_data={"raw_query": question},
+        cache_name="followup_ambiguous_queries",
     )
     if "error" in followup_query:
         return {"final_answer": followup_query["error"], "error_occurred": True}
@@ -212,25 +326,85 @@ async def followup_ambiguous_queries(state: ChatAgent):
 async def route_question(state: ChatAgent):
     logger.info("---ROUTE QUESTION---")
     question = state["rephrased_query"]
-    rephrase_chain = agent_retrieval.query_type_finder()
-    query_source = await robust_llm_call(
-        llm_chain=rephrase_chain,
-        input_data={"rephrased_query": question},
+    datasource = services.local_router.route(question) if LOCAL_ROUTER_ENABLED and not _local_router_bypassed.get() else None
+    if datasource is None:
+        rephrase_chain = get_agent_retrieval().query_type_finder()
+        query_source = await robust_llm_call(
+            llm_chain=rephrase_chain,
+            input_data={"rephrased_query": question},
+            cache_name="route_question",
+        )
+        if "error" in query_source:
+            discard_speculative_retrieval(state.get("speculation_id"), "error")
+            return {"final_answer": query_source["error"], "error_occurred": True}
+
+        datasource = query_source["response"]["datasource"]
+        # a cached route was logged when the LLM made it; logging it again would skew the training data
+        if not query_source.get("cached"):
+            logger.info("%s%s", QUERY_ROUTE_LOG_PREFIX, json.dumps({"query": question, "datasource": datasource}))
+    else:
+        logger.info("### Query routed locally to %s", datasource)
+    if datasource != "vectorstore":
+        discard_speculative_retrieval(state.get("speculation_id"), "route")
+    return {
+        "datasource": datasource,
+        "error_occurred": False,
+    }
+
+
+async def analyze_query(state: ChatAgent):
+    """
+    Rephrases, checks ambiguity and routes the query with a single LLM call.
+
+    Replaces rephrase_query, route_question and, when the model already wrote a follow-up
+    question, followup_ambiguous_queries in the fused workflow.
+    """
+    logger.info("---ANALYZE QUERY---")
+    speculation_id = start_speculative_retrieval(state)
+    analysis_chain = get_agent_retrieval().query_analyzer()
+    analysis = await robust_llm_call(
+        llm_chain=analysis_chain,
+        input_data={"raw_query": state["raw_query"], "chat_history": state["chat_history"]},
+        cache_name="analyze_query",
     )
-    if "error" in query_source:
-        return {"final_answer": query_source["error"], "error_occurred": True}
+    if "error" in analysis:
+        discard_speculative_retrieval(speculation_id, "error")
+        return {"final_answer": analysis["error"], "error_occurred": True}
+
+    response = analysis["response"]
+    if isinstance(response, str):
+        response = json.loads(response)
+    logger.debug("### Query analysis: %s", response)
+    if response.get("datasource") not in ("vectorstore", "web_search", "image_processing"):
+        logger.error("Query analysis returned an invalid datasource: %s", response)
+        discard_speculative_retrieval(speculation_id, "error")
+        return {
+            "final_answer": "An unexpected error occurred during LLM call. Please contact bot admin if this error persists",
+            "error_occurred": True,
+        }
 
-    return {
-        "datasource": query_source["response"]["datasource"],
+    result = {
+        "rephrased_query": response.get("rephrased_query") or state["raw_query"],
+        "ambiguity_status": "ambiguous" if response.get("ambiguity_status") == "ambiguous" else "proceed",
+        "datasource": response["datasource"],
         "error_occurred": False,
     }
+    if result["ambiguity_status"] == "ambiguous" and response.get("followup_question"):
+        result["final_answer"] = response["followup_question"]
+    if result["ambiguity_status"] == "ambiguous":
+        discard_speculative_retrieval(speculation_id, "ambiguous")
+    elif result["datasource"] != "vectorstore":
+        discard_speculative_retrieval(speculation_id, "route")
+    elif speculation_id:
+        result["speculation_id"] = speculation_id
+    return result
 
 
 async def web_based_answer(state: ChatAgent):
     logger.info("---WEB BASED ANSWERING---")
     rephrased_query = state["rephrased_query"]
     raw_query = state["raw_query"]
-    web_chain = agent_retrieval.web_based_final_answer_generation()
+    web_chain = get_agent_retrieval().web_based_final_answer_generation()
     web_answer = await robust_llm_call(
         llm_chain=web_chain,
         input_data={"rephrased_query": rephrased_query, "raw_query": raw_query},
@@ -241,6 +415,54 @@ async def web_based_answer(state: ChatAgent):
     return {"final_answer": web_answer["response"], "error_occurred": False}
 
 
+async def semantic_cache_lookup(state: ChatAgent):
+    """
+    Looks up a cached answer for a semantically equivalent rephrased query.
+
+    The query embedding is kept in the state so the answer can be cached after generation.
+    A failing lookup is treated as a miss.
+    """
+    logger.info("---SEMANTIC CACHE LOOKUP---")
+    if not SEMANTIC_CACHE_ENABLED or _caches_bypassed.get():
+        return {"cache_hit": False}
+    try:
+        query_embedding = await services.embedding_cache.aembed_query(state["rephrased_query"])
+        cached = services.semantic_cache.lookup(query_embedding, state["allowed_index"])
+    except Exception:
+        logger.exception("Semantic cache lookup failed, continuing with retrieval.")
+        return {"cache_hit": False}
+
+    if cached is None:
+        return {"query_embedding": query_embedding, "cache_hit": False}
+    discard_speculative_retrieval(state.get("speculation_id"), "cache_hit")
+    return {
+        "query_embedding": query_embedding,
+        "cache_hit": True,
+        "final_answer": cached["answer"],
+        "filenames": cached["sources"],
+        "awaiting_user_input": False,
+        "error_occurred": False,
+    }
+
+
+def route_semantic_cache(state: ChatAgent):
+    """Ends the workflow on a cache hit, otherwise continues with retrieval"""
+    return "hit" if state.get("cache_hit") else "miss"
+
+
+def store_semantic_cache(state: ChatAgent, answer: str):
+    """Caches a generated answer under the query embedding computed by semantic_cache_lookup."""
+    query_embedding = state.get("query_embedding")
+    if not SEMANTIC_CACHE_ENABLED or not query_embedding or _caches_bypassed.get():
+        return
+    try:
+        services.semantic_cache.store(
+            query_embedding, answer, state.get("filenames", []), state["allowed_index"]
+        )
+    except Exception:
+        logger.exception("Failed to store answer in the semantic cache.")
+
+
 async def vector_retrieve(state: ChatAgent) -> dict[str, Any]:
     """
     Retrieve documents from vectorstore
@@ -255,11 +477,16 @@ async def vector_retrieve(state: ChatAgent) -> dict[str, Any]:
     rephrased_query = state["rephrased_query"]
     user_id = state["user_id"]
     bool_upload_index = True
-    documents = await semantic_logic_multi_index_retrieval(
-        query=rephrased_query,
-        data_sources=state["allowed_index"],
-        upload_index=bool_upload_index,
-    )
+    documents = None
+    if state.get("speculation_id"):
+        documents = await services.speculative_retrieval.claim(state["speculation_id"], rephrased_query)
+    if documents is None:
+        documents = await semantic_logic_multi_index_retrieval(
+            query=rephrased_query,
+            data_sources=state["allowed_index"],
+            upload_index=bool_upload_index,
+            query_vector=state.get("query_embedding") or None,
+        )
     if "vector_doc" in state and documents:
         vector_doc = state["vector_doc"] + documents
     else:
@@ -277,11 +504,11 @@ async def image_based_answer(state: ChatAgent):
         extra=HelperMethods.add_logging_context(data)
     )
     try:
-        response = await dalle3_service.generate_image(rephrased_query)
+        response = await services.dalle3_service.generate_image(rephrased_query)
     except Exception as err:
         response = {"response": "Error occured while performing image based processing. Please contact your administrator"}
-    blob_name = azure_blob_service.upload_file(response["data"][0]["url"])
-    signed_url = azure_blob_service.generate_sas_url(blob_name)
+    blob_name = services.azure_blob_service.upload_file(response["data"][0]["url"])
+    signed_url = services.azure_blob_service.generate_sas_url(blob_name)
     logger.info(
         f"Image generated and uploaded to blob storage. Blob URL: {signed_url}", 
         extra=HelperMethods.add_logging_context(data)
@@ -316,10 +543,25 @@ async def grade_documents(state: ChatAgent):
     assessment_list = []
     filename_list = []
     awaiting_user_input = False
-    retrieval_grader = agent_retrieval.retrieved_documents_grader()
-    tasks = [grade_document(retrieval_grader, question, d) for d in documents]
-    results = await asyncio.gather(*tasks)
-    for score, d in results:
+    if RERANKER_SCORE_BANDS_ENABLED:
+        bands = [reranker_band(d, RERANKER_ACCEPT_SCORE, RERANKER_REJECT_SCORE) for d in documents]
+    else:
+        bands = ["grade"] * len(documents)
+    uncertain_docs = [d for d, band in zip(documents, bands) if band == "grade"]
+    logger.info("### Documents sent to the grader: %s of %s", len(uncertain_docs), len(documents))
+    if GRADE_DOCUMENTS_BATCH_MODE and uncertain_docs:
+        batch_grader = get_agent_retrieval().retrieved_documents_batch_grader()
+        graded = await grade_documents_batch(batch_grader, question, uncertain_docs)
+    else:
+        retrieval_grader = get_agent_retrieval().retrieved_documents_grader()
+        tasks = [grade_document(retrieval_grader, question, d) for d in uncertain_docs]
+        graded = await asyncio.gather(*tasks)
+    graded = iter(graded)
+    results = [
+        next(graded) if band == "grade" else (reranker_grade(d, band), d)
+        for d, band in zip(documents, bands)
+    ]
+    for (score, d), band in zip(results, bands):
 
         if "error" in score:
             state["error_occurred"] = True
@@ -327,6 +569,11 @@ async def grade_documents(state: ChatAgent):
             return {"final_answer": score["error"], "error_occurred": True}
         cleaned_response = score["response"]
         grade = cleaned_response["score"]
+        logger.info(
+            "%s%s",
+            DOCUMENT_GRADE_LOG_PREFIX,
+            json.dumps({"reranker_score": d.metadata.get("score"), "grade": grade.lower(), "band": band}),
+        )
         assessment_list.append(cleaned_response["assessment"])
         if grade.lower() == "yes" or grade.lower() == "maybe":
             logger.info("---GRADE: DOCUMENT RELEVANT---")
@@ -377,7 +624,7 @@ async def vector_generate(state: ChatAgent):
         logger.debug(
             "Number of documents for answer generation: %s", len(vector_documents)
         )
-        rag_chain = agent_retrieval.vector_based_final_answer_generation()
+        rag_chain = get_agent_retrieval().vector_based_final_answer_generation()
         generation = await robust_llm_call(
             llm_chain=rag_chain,
             input_data={
@@ -390,6 +637,7 @@ async def vector_generate(state: ChatAgent):
         if "error" in generation:
             return {"final_answer": generation["error"], "error_occurred": True}
 
+        store_semantic_cache(state, generation["response"])
         return {
             "final_answer": generation["response"],
             "error_occurred": False,
@@ -397,7 +645,7 @@ async def vector_generate(state: ChatAgent):
         }
     else:
         logger.info("## No relevant vector documents retrieved for the query")
-        final_followup_chain = agent_retrieval.response_when_no_document()
+        final_followup_chain = get_agent_retrieval().response_when_no_document()
         final_followup = await robust_llm_call(
             llm_chain=final_followup_chain, input_data={"raw_query": raw_query}
         )
@@ -423,7 +671,7 @@ async def generate_followup_question(state: ChatAgent):
     original_question = state["raw_query"]
     vector_documents = state["vector_doc"]
     logger.info("original_question %s", original_question)
-    llm_response_chain = agent_retrieval.followup_question_generator()
+    llm_response_chain = get_agent_retrieval().followup_question_generator()
     llm_response = await robust_llm_call(
         llm_chain=llm_response_chain,
         input_data={
@@ -1,5 +1,6 @@
 from app.agents.agent_state import (
     ChatAgent,
+    analyze_query,
     followup_ambiguous_queries,
     generate_followup_question,
     grade_documents,
@@ -7,6 +8,8 @@ from app.agents.agent_state import (
     rephrase_query,
     route_based_on_graded_document,
     route_question,
+    route_semantic_cache,
+    semantic_cache_lookup,
     route_vector_generation,
     vector_generate,
     vector_retrieve,
@@ -34,20 +37,26 @@ def decide_router_next_node(state):
     return "vectorstore"
 
 
-def error_handler(state: ChatAgent):
+def decide_analysis_next_node(state):
     if state.get("error_occurred"):
         return "handle_error"
+    if state.get("ambiguity_status") == "ambiguous":
+        # the analysis already wrote the follow-up question unless final_answer is empty
+        return "end" if state.get("final_answer") else "followup"
+    return decide_router_next_node(state)
 
 
-def define_agent_workflow() -> StateGraph:
-    workflow = StateGraph(ChatAgent)
+def error_handler(state: ChatAgent):
+    if state.get("error_occurred"):
+        return "handle_error"
 
-    # Define the nodes
-    workflow.add_node("rephrase_query", rephrase_query)
+
+def add_answer_nodes(workflow: StateGraph):
+    """Adds the nodes and edges shared by all topologies, from the routed query to the answer."""
     workflow.add_node("handle_error", handle_error)
-    workflow.add_node("route_question", route_question)
     workflow.add_node("image_based_answer", image_based_answer)
     workflow.add_node("web_based_answer", web_based_answer)
+    workflow.add_node("semantic_cache_lookup", semantic_cache_lookup)
     workflow.add_node("vector_retrieve", vector_retrieve)
     workflow.add_node("grade_documents", grade_documents)
     workflow.add_node("vector_generate", vector_generate)
@@ -55,6 +64,45 @@ def define_agent_workflow() -> StateGraph:
     workflow.add_node("generate_followup_question", generate_followup_question)
     workflow.add_node("route_vector_generation", route_vector_generation)
 
+    workflow.add_edge("image_based_answer", END)
+    workflow.add_edge("web_based_answer", END)
+    workflow.add_conditional_edges(
+        "semantic_cache_lookup",
+        route_semantic_cache,
+        {
+            "hit": END,
+            "miss": "vector_retrieve",
+        },
+    )
+    workflow.add_edge("vector_retrieve", "grade_documents")
+    workflow.add_conditional_edges(
+        "grade_documents",
+        route_based_on_graded_document,
+        {
+            "generate": "vector_generate",
+            "followup": "generate_followup_question",
+            "handle_error": "handle_error",
+        },
+    )
+    workflow.add_conditional_edges(
+        "vector_generate",
+        route_vector_generation,
+        {
+            "handle_error": "handle_error",
+            "generate_followup": "generate_followup_question",
+            "end": END,
+        },
+    )
+
+
+def define_agent_workflow() -> StateGraph:
+    workflow = StateGraph(ChatAgent)
+
+    # Define the nodes
+    workflow.add_node("rephrase_query", rephrase_query)
+    workflow.add_node("route_question", route_question)
+    add_answer_nodes(workflow)
+
     # Set the entry point
     workflow.set_entry_point("rephrase_query")
     workflow.add_edge(START, "rephrase_query")
@@ -71,31 +119,35 @@ def define_agent_workflow() -> StateGraph:
         "route_question",
         decide_router_next_node,
         {
-            "vectorstore": "vector_retrieve",
+            "vectorstore": "semantic_cache_lookup",
             "websearch": "web_based_answer",
             "handle_error": "handle_error",
             "image_processing": "image_based_answer"
         },
     )
-    workflow.add_edge("image_based_answer", END)
-    workflow.add_edge("web_based_answer", END)
-    workflow.add_edge("vector_retrieve", "grade_documents")
-    workflow.add_conditional_edges(
-        "grade_documents",
-        route_based_on_graded_document,
-        {
-            "generate": "vector_generate",
-            "followup": "generate_followup_question",
-            "handle_error": "handle_error",
-        },
-    )
+
+    return workflow
+
+
+def define_fused_agent_workflow() -> StateGraph:
+    """Same answer paths as define_agent_workflow, entered through one analyze_query call."""
+    workflow = StateGraph(ChatAgent)
+
+    workflow.add_node("analyze_query", analyze_query)
+    add_answer_nodes(workflow)
+
+    workflow.set_entry_point("analyze_query")
+    workflow.add_edge(START, "analyze_query")
     workflow.add_conditional_edges(
-        "vector_generate",
-        route_vector_generation,
+        "analyze_query",
+        decide_analysis_next_node,
         {
-            "handle_error": "handle_error",
-            "generate_followup": "generate_followup_question",
             "end": END,
+            "followup": "followup_ambiguous_queries",
+            "vectorstore": "semantic_cache_lookup",
+            "websearch": "web_based_answer",
+            "image_processing": "image_based_answer",
+            "handle_error": "handle_error",
         },
     )
 
@@ -0,0 +1,130 @@
+import threading
+import time
+from typing import Final
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langgraph.graph import END, START
+
+from app.agents import agent_state
+from app.agents.agent_retrieval import AgentRetrieval
+from app.agents.agent_workflow import define_agent_workflow, define_fused_agent_workflow
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+DEFAULT_WORKFLOW: Final = "default"
+FUSED_WORKFLOW: Final = "fused"
+
+# Builders for every workflow topology served by this process
+WORKFLOW_DEFINITIONS = {
+    DEFAULT_WORKFLOW: define_agent_workflow,
+    FUSED_WORKFLOW: define_fused_agent_workflow,
+}
+
+# Canned (gpt4o, gpt4o_mini) completions walking each topology down the web_search branch
+WARM_UP_RESPONSES = {
+    DEFAULT_WORKFLOW: (
+        ['{"output": "warm up"}', '{"datasource": "web_search"}'],
+        ["warm up"],
+    ),
+    FUSED_WORKFLOW: (
+        ['{"rephrased_query": "warm up", "ambiguity_status": "proceed", "datasource": "web_search", "followup_question": ""}'],
+        ["warm up"],
+    ),
+}
+
+WARM_UP_INPUTS: Final = {
+    "user_id": "warm-up",
+    "raw_query": "warm up",
+    "ambiguity_status": "",
+    "datasource": "",
+    "chat_history": [],
+    "bool_upload_index": True,
+    "allowed_index": [],
+    "vector_doc": [],
+    "assessment": [],
+    "rephrased_query": "",
+    "filenames": [],
+    "final_answer": "",
+    "awaiting_user_input": False,
+    "error_occurred": False,
+    "image_answer": {},
+    "data": {},
+    "query_embedding": [],
+    "cache_hit": False,
+    "speculation_id": "",
+}
+
+_compiled_workflows = {}
+_lock = threading.Lock()
+
+
+def compile_agent_workflow(name: str = DEFAULT_WORKFLOW):
+    """
+    Builds, compiles and validates a workflow topology.
+
+    Raises:
+        ValueError: If the topology is unknown or the compiled graph is not connected to START and END.
+    """
+    if name not in WORKFLOW_DEFINITIONS:
+        raise ValueError(f"Unknown agent workflow: {name}")
+    compiled = WORKFLOW_DEFINITIONS[name]().compile()
+    graph = compiled.get_graph()
+    if START not in graph.nodes or END not in graph.nodes:
+        raise ValueError(f"Agent workflow {name} is not connected to START and END")
+    return compiled
+
+
+def get_agent_workflow(name: str = DEFAULT_WORKFLOW):
+    """Returns the process-wide compiled workflow, compiling it on first use."""
+    compiled = _compiled_workflows.get(name)
+    if compiled is None:
+        with _lock:
+            compiled = _compiled_workflows.get(name)
+            if compiled is None:
+                compiled = compile_agent_workflow(name)
+                _compiled_workflows[name] = compiled
+    return compiled
+
+
+def build_agent_workflows(warm_up: bool = False, timeout: float = 60):
+    """
+    Compiles every registered workflow once at startup and optionally runs a warm-up
+    invocation of each against stub LLMs.
+    """
+    for name in WORKFLOW_DEFINITIONS:
+        start = time.perf_counter()
+        compiled = compile_agent_workflow(name)
+        with _lock:
+            _compiled_workflows[name] = compiled
+        logger.info(f"Agent workflow {name} compiled in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if warm_up:
+        for name in WORKFLOW_DEFINITIONS:
+            start = time.perf_counter()
+            try:
+                io_loop.submit(warm_up_agent_workflow(name)).result(timeout)
+                logger.info(f"Agent workflow {name} warmed up in {(time.perf_counter() - start) * 1000:.1f} ms")
+            except Exception:
+                logger.warning(f"Warm-up of agent workflow {name} failed", exc_info=True)
+
+
+def stub_agent_retrieval(gpt4o_responses, gpt4o_mini_responses):
+    """Runs the workflows started in this context against stub LLMs; concurrent requests keep the real ones."""
+    return agent_state.use_agent_retrieval(AgentRetrieval(
+        gpt4o=FakeListChatModel(responses=gpt4o_responses),
+        gpt4o_mini=FakeListChatModel(responses=gpt4o_mini_responses),
+    ))
+
+
+async def warm_up_agent_workflow(name: str = DEFAULT_WORKFLOW):
+    gpt4o_responses, gpt4o_mini_responses = WARM_UP_RESPONSES[name]
+    # the stub outputs must not end up in, or be counted by, the real caches, and the canned
+    # responses assume every LLM call is made, so the local router must not answer the routing one
+    with stub_agent_retrieval(gpt4o_responses, gpt4o_mini_responses), agent_state.bypass_caches(), \
+            agent_state.bypass_local_router():
+        result = await get_agent_workflow(name).ainvoke(dict(WARM_UP_INPUTS), {"recursion_limit": 8})
+    if result.get("error_occurred"):
+        raise RuntimeError(f"Warm-up of agent workflow {name} ended in error: {result.get('final_answer')}")
+    return result
@@ -4,48 +4,79 @@ import traceback
 import re
 import uuid
 import os
+import jwt
 
-from app.services.cosmos_service import CosmosService
-from app.services.authentication_service import AuthenticationService
-from app.services.user_validation_service import UserValidationService
-from app.services.team_messaging_service import TeamsMessagingService
-from app.services.azure_blob_service import AzureBlobService
-from app.services.openai_service import OpenAIService
-from app.services.dalle3_service import DallE3Service
-from app.services.token_validation_service import TokenValidationService
+from app.services.service_container import services
+from app.services.background_task_service import BackgroundTaskService
+from app.services.message_stream_service import ThrottledMessageUpdater
+from app.services.write_behind_service import interaction_document_id
 from app.agents.agent_state import get_llm_response_from_state
-from app.agents.agent_workflow import define_agent_workflow
+from app.agents.agent_workflow_registry import get_agent_workflow
 from app.exceptions.custom_exceptions import DataAgreementException, InvalidVectorIndex, DefaultInteractionException
 
 from app.config.set_logger import set_logger
 
-from app.utils.util_url_generator import UtilUrlGenerator
 from app.utils.util_helper_methods import HelperMethods
 
-from app.config.constants import (COSMOS_HOST, COSMOS_KEY, COSMOS_DATABASE, COSMOS_USER_INTERACTIONS_CONTAINER, COSMOS_IMAGES_INFO_CONTAINER, COSMOS_REPLY_TO_ID_CONTAINER,
-                              MICROSOFT_APP_TYPE, MICROSOFT_TENANT_ID, MICROSOFT_APP_ID, MICROSOFT_APP_SECRET, 
-                              BLOB_ACCOUNT_NAME, BLOB_ACCOUNT_KEY, BLOB_CONTAINER_NAME, 
-                              OPEN_AI_BASE_URL, OPEN_AI_KEY, OPEN_AI_DEPLOYMENT_NAME, OPEN_AI_VERSION, OPENAI_INTERACTION_LIST,
-                              OPEN_AI_DALLE_DEPLOYMENT_NAME, ENTITY_INDEX_LIST, TOP_CHAT_HISTORY)
+from app.config.constants import (ENTITY_INDEX_LIST, TOP_CHAT_HISTORY,
+                              BOT_HANDLER_ACK_MODE, BOT_WORKER_CONCURRENCY, BOT_WORKER_MAX_QUEUE_SIZE,
+                              STREAM_ANSWERS, STREAM_UPDATE_INTERVAL_SECONDS, STREAM_UPDATE_MIN_CHARS,
+                              BOT_FRAMEWORK_AUTH_ENABLED, MICROSOFT_APP_ID, AGENT_WORKFLOW)
 from app.utils.utils_openai_prompt import GENERAL_OPENAI_ERROR, INVALID_INDEX_ERROR_MESSAGE
 
 bot_handler = Blueprint('teams', __name__)
 
 logger = set_logger(name=__name__)
-# Initialize services
-cosmos_service = CosmosService(os.getenv(COSMOS_HOST), os.getenv(COSMOS_KEY), os.getenv(COSMOS_DATABASE), os.getenv(COSMOS_USER_INTERACTIONS_CONTAINER), os.getenv(COSMOS_IMAGES_INFO_CONTAINER), os.getenv(COSMOS_REPLY_TO_ID_CONTAINER))
-token_validation_service = TokenValidationService(os.getenv(MICROSOFT_TENANT_ID))
-authentication_service = AuthenticationService(os.getenv(MICROSOFT_TENANT_ID), os.getenv(MICROSOFT_APP_ID), os.getenv(MICROSOFT_APP_SECRET), token_validation_service)
-user_validation_service = UserValidationService(os.getenv(MICROSOFT_TENANT_ID), os.getenv(MICROSOFT_APP_ID), os.getenv(MICROSOFT_APP_SECRET))
-team_messaging_service = TeamsMessagingService()
-azure_blob_service = AzureBlobService(os.getenv(BLOB_ACCOUNT_NAME), os.getenv(BLOB_ACCOUNT_KEY), os.getenv(BLOB_CONTAINER_NAME))
-openai_service = OpenAIService(UtilUrlGenerator.create_open_ai_url(os.getenv(OPEN_AI_BASE_URL), os.getenv(OPEN_AI_DEPLOYMENT_NAME)), os.getenv(OPEN_AI_KEY), os.getenv(OPEN_AI_DEPLOYMENT_NAME), os.getenv(OPEN_AI_VERSION))
-dalle3_service = DallE3Service(UtilUrlGenerator.create_open_ai_url(os.getenv(OPEN_AI_BASE_URL), os.getenv(OPEN_AI_DALLE_DEPLOYMENT_NAME)) , os.getenv(OPEN_AI_KEY), os.getenv(OPEN_AI_DALLE_DEPLOYMENT_NAME), os.getenv(OPEN_AI_VERSION))
+
+# nodes whose LLM output is the final answer shown to the user
+STREAMED_ANSWER_NODES = ("vector_generate", "web_based_answer")
+
+background_task_service = BackgroundTaskService(BOT_WORKER_CONCURRENCY, BOT_WORKER_MAX_QUEUE_SIZE)
+
+@bot_handler.route('/bot_handler/queue', methods=['GET'])
+def queue_status():
+    return jsonify(background_task_service.stats())
+
+@bot_handler.route('/bot_handler/metrics', methods=['GET'])
+def cache_metrics():
+    metrics = {}
+    if services.is_initialized("semantic_cache"):
+        metrics["semantic_cache"] = services.semantic_cache.stats()
+    if services.is_initialized("interaction_writer"):
+        metrics["interaction_writer"] = services.interaction_writer.stats()
+    if services.is_initialized("llm_cache"):
+        metrics["llm_cache"] = services.llm_cache.stats()
+    if services.is_initialized("embedding_cache"):
+        metrics["embedding_cache"] = services.embedding_cache.stats()
+    if services.is_initialized("query_embeddings") and hasattr(services.query_embeddings, "stats"):
+        metrics["embedding_batches"] = services.query_embeddings.stats()
+    if services.is_initialized("search_index_catalog"):
+        metrics["search_index_catalog"] = services.search_index_catalog.stats()
+    if services.is_initialized("search_client_pool"):
+        metrics["search_client_pool"] = services.search_client_pool.stats()
+    if services.is_initialized("speculative_retrieval"):
+        metrics["speculative_retrieval"] = services.speculative_retrieval.stats()
+    if services.is_initialized("local_router"):
+        metrics["local_router"] = services.local_router.stats()
+    if services.is_initialized("user_validation_service"):
+        metrics["user_validation"] = services.user_validation_service.stats()
+    if services.is_initialized("http_session"):
+        metrics["http_session"] = services.http_session.stats()
+    if services.is_initialized("token_validation_service"):
+        metrics["bot_framework_keys"] = services.token_validation_service.bot_framework_key_store.stats()
+        metrics["tenant_keys"] = services.token_validation_service.tenant_key_store.stats()
+    return jsonify(metrics)
 
 @bot_handler.route('/bot_handler', methods=['POST'])
 async def incoming_handler():
     data = request.get_json()
     logger.info(f"Incoming data: {data}", extra=HelperMethods.add_logging_context(data))
+    if BOT_FRAMEWORK_AUTH_ENABLED:
+        try:
+            await services.token_validation_service.validate_bot_framework_token(request.headers.get("Authorization"), os.getenv(MICROSOFT_APP_ID), data.get("serviceUrl"), data.get("channelId"))
+        except jwt.InvalidTokenError as e:
+            logger.error(f"Rejected activity with invalid Bot Framework token: {str(e)}", extra=HelperMethods.add_logging_context(data))
+            return "Unauthorized", 401
     reply_to_id = data.get("replyToId", "")
     chat_scope = data.get("type", "")
     aad_object_id = data['from']['aadObjectId']
@@ -57,28 +88,27 @@ async def incoming_handler():
         image_prompt = ""
         if "value" in data and "prompt-input" in data["value"] :
             image_prompt = data["value"]["prompt-input"]
-        check_reply_to_id = cosmos_service.get_reply_to_id(reply_to_id, aad_object_id, image_prompt)
+        check_reply_to_id = await services.cosmos_service.get_reply_to_id(reply_to_id, aad_object_id, image_prompt)
         if check_reply_to_id : 
             return ""
         else :
-            cosmos_service.insert_reply_to_id({"id": str(uuid.uuid4()),
-                                               "user_id": aad_object_id,
-                                               "reply_to_id": reply_to_id,
-                                               "prompt_input" : image_prompt,
-                                               "timestamp": datetime.datetime.utcnow().isoformat()})
+            await services.cosmos_service.insert_reply_to_id({"id": str(uuid.uuid4()),
+                                                        "user_id": aad_object_id,
+                                                        "reply_to_id": reply_to_id,
+                                                        "prompt_input" : image_prompt,
+                                                        "timestamp": datetime.datetime.utcnow().isoformat()})
 
-    if not user_validation_service.validate_tenant_id(tenant_id) or not user_validation_service.validate_user(aad_object_id):
+    if not services.user_validation_service.validate_tenant_id(tenant_id) or not await services.user_validation_service.validate_user_async(aad_object_id):
         logger.error(f"Unauthorized access attempt. User ID: {aad_object_id}, Tenant ID: {tenant_id}", extra=HelperMethods.add_logging_context(data))
         return "Unauthorized access attempt", 403
 
     text = data.get("text", "")
-    interaction_state = cosmos_service.get_interaction_state(aad_object_id)
-    authentication_service.refresh_token_if_needed()
-    jwt_token = authentication_service.get_current_token()
+    interaction_state = await services.cosmos_service.get_interaction_state(aad_object_id)
+    services.authentication_service.refresh_token_if_needed()
+    jwt_token = services.authentication_service.get_current_token()
     logger.info(f"Interaction state fetched for user ID {aad_object_id} is {interaction_state}", extra=HelperMethods.add_logging_context(data))
 
-    user_interaction_data = {
-        "id": str(uuid.uuid4()),
+    user_profile = {
         "conversation_id" : data["conversation"]["id"],
         "user_id": aad_object_id,
         "timestamp": datetime.datetime.utcnow().isoformat(),
@@ -89,9 +119,9 @@ async def incoming_handler():
     }
 
     if not interaction_state and chat_scope != "event" and chat_scope != "conversationUpdate" :
-        await team_messaging_service.send_welcome_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
+        await services.team_messaging_service.send_welcome_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
         logger.info(f"Welcome message sent for user ID {aad_object_id}", extra=HelperMethods.add_logging_context(data))
-        cosmos_service.insert_prompt_response_info(user_interaction_data)
+        await services.cosmos_service.upsert_user_profile(user_profile)
         logger.info(f"Interaction data written into DB for user ID {aad_object_id}", extra=HelperMethods.add_logging_context(data))
     elif chat_scope == "message":
         await bot_messaging_handler(data, text, aad_object_id, chat_scope, jwt_token)
@@ -111,6 +141,8 @@ async def bot_messaging_handler(data, text, aad_object_id, chat_scope, jwt_token
             await handle_delete(data, jwt_token)
         elif action == "confirm_delete":
             await handle_confirm_delete(data, aad_object_id, jwt_token)
+        elif BOT_HANDLER_ACK_MODE and background_task_service.submit(handle_default_interaction, data, aad_object_id, text, chat_scope, jwt_token):
+            logger.info(f"Default interaction queued for user ID {aad_object_id}, queue depth: {background_task_service.queue_depth()}", extra=HelperMethods.add_logging_context(data))
         else:
             await handle_default_interaction(data, aad_object_id, text, chat_scope, jwt_token)
     except Exception as error:
@@ -122,25 +154,25 @@ def get_action_from_data(data):
 
 async def handle_confirm_accept(data, aad_object_id, jwt_token):
     logger.info(f"Handling confirm_accept for user ID {aad_object_id}", extra=HelperMethods.add_logging_context(data))
-    await team_messaging_service.send_initial_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
-    cosmos_service.update_data_agreement_state(aad_object_id, accepted=True)
+    await services.team_messaging_service.send_initial_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
+    await services.cosmos_service.update_data_agreement_state(aad_object_id, accepted=True)
 
 async def handle_confirm_decline(data, aad_object_id, jwt_token):
     logger.info(f"Handling confirm_decline for user ID {aad_object_id}", extra=HelperMethods.add_logging_context(data))
-    await team_messaging_service.send_decline_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
-    cosmos_service.update_data_agreement_state(aad_object_id, declined=True)
+    await services.team_messaging_service.send_decline_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
+    await services.cosmos_service.update_data_agreement_state(aad_object_id, declined=True)
 
 async def handle_delete(data, jwt_token):
     logger.info("Handling delete action", extra=HelperMethods.add_logging_context(data))
-    await team_messaging_service.send_confirm_delete_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
+    await services.team_messaging_service.send_confirm_delete_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
 
 async def handle_default_interaction(data, aad_object_id, input_text, chat_scope, jwt_token):
     logger.debug("Handling default interaction", extra=HelperMethods.add_logging_context(data))
-    data_agreement_state = cosmos_service.get_data_agreement_state(aad_object_id) #"accepted"#
+    data_agreement_state = await services.cosmos_service.get_data_agreement_state(aad_object_id) #"accepted"#
     if data_agreement_state == "accepted":
-        activity_id = await team_messaging_service.send_loading_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
+        activity_id = await services.team_messaging_service.send_loading_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
         logger.debug(f"the provided object id is as below: {aad_object_id}")
-        chathistory = cosmos_service.get_latest_conversations(aad_object_id, top_n=TOP_CHAT_HISTORY)
+        chathistory = await services.cosmos_service.get_conversation_history(aad_object_id, data["conversation"]["id"], top_n=TOP_CHAT_HISTORY)
         logger.debug(f"The chat history is as below: {chathistory}")
         ####################################################################
 
@@ -154,7 +186,7 @@ async def handle_default_interaction(data, aad_object_id, input_text, chat_scope
 
             user_query_cleaned = re.sub(r"\s+", " ", user_query)
             try:
-                agentic_app = define_agent_workflow().compile()
+                agentic_app = get_agent_workflow(AGENT_WORKFLOW)
                 # graph_img = agentic_app.get_graph().draw_mermaid_png()
                 # with open("graph_image.png", "wb") as f:
                 #     f.write(graph_img)
@@ -174,14 +206,17 @@ async def handle_default_interaction(data, aad_object_id, input_text, chat_scope
                     "awaiting_user_input": False,
                     "error_occurred": False,
                     "image_answer": {},
-                    "data": data
+                    "data": data,
+                    "query_embedding": [],
+                    "cache_hit": False,
+                    "speculation_id": "",
                 }
                 response_message_id, message_text = await stream_updates(
                     agentic_app, inputs, data, loading_message_id, jwt_token, activity_id
                 )
 
                 prompt_response_document = {
-                    "id": str(uuid.uuid4()),
+                    "id": interaction_document_id(data["id"], "prompt_response"),
                     "user_id": data['from']['aadObjectId'],
                     "timestamp_prompted": data["timestamp"],
                     "timestamp": datetime.datetime.utcnow().isoformat(),
@@ -191,15 +226,15 @@ async def handle_default_interaction(data, aad_object_id, input_text, chat_scope
                     "conversation_type": data["type"],
                     "conversation_id" : data["conversation"]["id"]
                 }
-                logger.info(f"started update of prompt response")
-                cosmos_service.insert_prompt_response_info(prompt_response_document)
-                logger.info(f"Prompt response information inserted into Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
+                services.interaction_writer.enqueue("interactions_container", prompt_response_document)
+                await record_conversation_turn(data, user_query_cleaned, message_text)
+                logger.info(f"Prompt response information queued for Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
 
             except Exception as error:
                 logger.error("### Error in fetching llm response for query: %s", user_query, traceback.format_exception(error))
                 logger.error("Exception: %s", traceback.format_exc())
                 llm_response = GENERAL_OPENAI_ERROR
-                await team_messaging_service.send_openai_response(
+                await services.team_messaging_service.send_openai_response(
                     data["serviceUrl"],
                     data["conversation"]["id"],
                     loading_message_id,
@@ -209,12 +244,12 @@ async def handle_default_interaction(data, aad_object_id, input_text, chat_scope
 
         except DataAgreementException as error:
             logger.warning("### Data agreement exception: %s", str(error))
-            await team_messaging_service.send_decline_message(
+            await services.team_messaging_service.send_decline_message(
                 data["serviceUrl"], data["conversation"]["id"], jwt_token
             )
 
         except InvalidVectorIndex:
-            await team_messaging_service.send_openai_response(
+            await services.team_messaging_service.send_openai_response(
                 data["serviceUrl"],
                 data["conversation"]["id"],
                 loading_message_id,
@@ -231,14 +266,14 @@ async def handle_default_interaction(data, aad_object_id, input_text, chat_scope
         ####### not needed ###### await get_openai_response(data, input_text, activity_id, aad_object_id, chat_scope, jwt_token)
         ####################################################################
     elif data_agreement_state == "declined":
-        await team_messaging_service.send_decline_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
+        await services.team_messaging_service.send_decline_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
     else:
-        await team_messaging_service.send_pending_reminder_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
+        await services.team_messaging_service.send_pending_reminder_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
 
 async def handle_confirm_delete(data, aad_object_id, jwt_token):
     logger.info(f"Handling confirm_delete for user ID {aad_object_id}", extra=HelperMethods.add_logging_context(data))
-    cosmos_service.delete_conversation(aad_object_id)
-    await team_messaging_service.send_deleted_confirmation_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
+    await services.cosmos_service.delete_conversation(aad_object_id)
+    await services.team_messaging_service.send_deleted_confirmation_message(data["serviceUrl"], data["conversation"]["id"], jwt_token)
 
 async def get_openai_response(data, text, activity_id, aad_object_id, chat_scope, jwt_token):
     logger.debug("Handling get_openai_response", extra=HelperMethods.add_logging_context(data))
@@ -246,7 +281,7 @@ async def get_openai_response(data, text, activity_id, aad_object_id, chat_scope
     if text == '' and "value" in data and "prompt-input" in data["value"] :
         text = data["value"]["prompt-input"]
     try:
-        input_type = await openai_service.determine_input_type(text)
+        input_type = await services.openai_service.determine_input_type(text)
     except Exception as ex:
         await print_error_message_to_user(ex, data, activity_id)
     if input_type == "text" :
@@ -260,19 +295,19 @@ async def process_image_query(data, text, activity_id):
     service_url = data["serviceUrl"]
     conversation_id = data["conversation"]["id"]
     try:
-        response = await dalle3_service.generate_image(text)
-        blob_name = azure_blob_service.upload_file(response["data"][0]["url"])
-        signed_url = azure_blob_service.generate_sas_url(blob_name)
+        response = await services.dalle3_service.generate_image(text)
+        blob_name = services.azure_blob_service.upload_file(response["data"][0]["url"])
+        signed_url = services.azure_blob_service.generate_sas_url(blob_name)
         revised_prompt = response["data"][0]["revised_prompt"]
         logger.info(f"Image generated and uploaded to blob storage. Blob URL: {signed_url}", extra=HelperMethods.add_logging_context(data))
 
-        authentication_service.refresh_token_if_needed()
-        jwt_token = authentication_service.get_current_token()
+        services.authentication_service.refresh_token_if_needed()
+        jwt_token = services.authentication_service.get_current_token()
 
-        await team_messaging_service.send_image_card_response(service_url, conversation_id, activity_id, signed_url, text, revised_prompt, jwt_token)
+        await services.team_messaging_service.send_image_card_response(service_url, conversation_id, activity_id, signed_url, text, revised_prompt, jwt_token)
 
         prompt_response_document = {
-            "id": str(uuid.uuid4()),
+            "id": interaction_document_id(data["id"], "generated_image"),
             "user_id": data['from']['aadObjectId'],
             "timestamp_prompted": data["timestamp"],
             "timestamp": datetime.datetime.utcnow().isoformat(),
@@ -284,8 +319,8 @@ async def process_image_query(data, text, activity_id):
             "conversation_id" : conversation_id
         }
 
-        cosmos_service.insert_generated_image_info(prompt_response_document)
-        logger.info(f"Generated image information inserted into Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
+        services.interaction_writer.enqueue("images_info_container", prompt_response_document)
+        logger.info(f"Generated image information queued for Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
 
     except Exception as ex:
        await print_error_message_to_user(ex, data, activity_id)
@@ -293,7 +328,7 @@ async def process_image_query(data, text, activity_id):
 async def process_conversation_query(data, activity_id):
     logger.info("Processing conversation query", extra=HelperMethods.add_logging_context(data))
     user_id = data['from']['aadObjectId']
-    latest_conversations = cosmos_service.get_latest_conversations(user_id, top_n=3)
+    latest_conversations = await services.cosmos_service.get_conversation_history(user_id, data["conversation"]["id"], top_n=3)
     reversed_conversations = list(reversed(latest_conversations))
     if "text" in data :
         text = data["text"]
@@ -301,7 +336,7 @@ async def process_conversation_query(data, activity_id):
         text = data["value"]["prompt-input"]
         reply_to_id = data.get("replyToId", "")
         if (reply_to_id != ""):
-            cosmos_service.delete_reply_to_id(reply_to_id, user_id)
+            await services.cosmos_service.delete_reply_to_id(reply_to_id, user_id)
 
     latest_conversation = reversed_conversations.pop() if reversed_conversations else None
 
@@ -316,12 +351,12 @@ async def process_conversation_query(data, activity_id):
     service_url = data["serviceUrl"]
     conversation_id = data["conversation"]["id"]
     try:
-        openai_response = await openai_service.answer_query(messages)
-        authentication_service.refresh_token_if_needed()
-        jwt_token = authentication_service.get_current_token()
-        await team_messaging_service.send_openai_response(service_url, conversation_id, activity_id, openai_response.choices[0].message.content, jwt_token)
+        openai_response = await services.openai_service.answer_query(messages)
+        services.authentication_service.refresh_token_if_needed()
+        jwt_token = services.authentication_service.get_current_token()
+        await services.team_messaging_service.send_openai_response(service_url, conversation_id, activity_id, openai_response.choices[0].message.content, jwt_token)
         prompt_response_document = {
-        "id": str(uuid.uuid4()),
+        "id": interaction_document_id(data["id"], "prompt_response"),
         "user_id": data['from']['aadObjectId'],
         "timestamp_prompted": data["timestamp"],
         "timestamp": datetime.datetime.utcnow().isoformat(),
@@ -334,17 +369,22 @@ async def process_conversation_query(data, activity_id):
         "conversation_type": data["type"],
         "conversation_id" : conversation_id
         }
-        cosmos_service.insert_prompt_response_info(prompt_response_document)
-        logger.info(f"Prompt response information inserted into Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
+        services.interaction_writer.enqueue("interactions_container", prompt_response_document)
+        await record_conversation_turn(data, text, openai_response.choices[0].message.content)
+        logger.info(f"Prompt response information queued for Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
 
     except Exception as ex:
         await print_error_message_to_user(ex, data, activity_id)
 
+async def record_conversation_turn(data, prompt, response):
+    # written directly rather than queued: the append is conditional on the stored version of the document
+    await services.cosmos_service.add_conversation_turn(data['from']['aadObjectId'], data["conversation"]["id"], prompt, response)
+
 async def print_error_message_to_user(ex, data, activity_id):
     service_url = data["serviceUrl"]
     conversation_id = data["conversation"]["id"]
-    authentication_service.refresh_token_if_needed()
-    jwt_token = authentication_service.get_current_token()
+    services.authentication_service.refresh_token_if_needed()
+    jwt_token = services.authentication_service.get_current_token()
     logger.error(f"An error occurred in process_image_query: {ex}", exc_info=True, extra=HelperMethods.add_logging_context(data))
     error_message = ""
     if hasattr(ex, 'type') and ex.type == 'ResponsibleAIPolicyViolation':
@@ -356,36 +396,63 @@ async def print_error_message_to_user(ex, data, activity_id):
                 <br/><br/>
                 Please try again 🤖 🤖 🤖"""
 
-    await team_messaging_service.send_openai_response(service_url, conversation_id, activity_id, error_message, jwt_token)
+    await services.team_messaging_service.send_openai_response(service_url, conversation_id, activity_id, error_message, jwt_token)
 
 async def stream_updates(agentic_app, inputs, data, message_id, jwt_token, activity_id):
     last_valid_response = None
     last_valid_node = None
-    async for output in agentic_app.astream(
-        inputs, {"recursion_limit": 8}, stream_mode="updates"
+    partial_answer = ""
+    partial_answer_id = None
+    partial_updater = ThrottledMessageUpdater(
+        lambda text: services.team_messaging_service.send_openai_response(
+            data["serviceUrl"], data["conversation"]["id"], activity_id, text, jwt_token
+        ),
+        min_interval=STREAM_UPDATE_INTERVAL_SECONDS,
+        min_chars=STREAM_UPDATE_MIN_CHARS,
+    )
+    stream_mode = ["updates", "messages"] if STREAM_ANSWERS else ["updates"]
+    async for mode, output in agentic_app.astream(
+        inputs, {"recursion_limit": 8}, stream_mode=stream_mode
     ):
+        if mode == "messages":
+            message_chunk, metadata = output
+            if metadata.get("langgraph_node") in STREAMED_ANSWER_NODES and message_chunk.content:
+                # a retried LLM call starts a new message, so the partial answer starts over
+                if message_chunk.id != partial_answer_id:
+                    partial_answer_id = message_chunk.id
+                    partial_answer = ""
+                partial_answer += message_chunk.content
+                await partial_updater.push(partial_answer)
+            continue
+
         for key, value in output.items():
             logger.debug(f"Processing node: {key}")
 
-            if key in (
-                "vector_generate",
-                "web_based_answer",
-            ):
+            if key in STREAMED_ANSWER_NODES:
                 message_text = get_llm_response_from_state(value)
 
                 if message_text:
                     last_valid_response = message_text
                     last_valid_node = key
 
+            if key == "semantic_cache_lookup" and value.get("cache_hit"):
+                last_valid_response = get_llm_response_from_state(value)
+                last_valid_node = key
+
+            fused_followup = key == "analyze_query" and value.get("ambiguity_status") == "ambiguous" and value.get("final_answer")
             if key in (
                 "followup_ambiguous_queries",
                 "generate_followup_question",
-            ):
+            ) or fused_followup:
                 message_text = get_llm_response_from_state(value)
 
-                followup_questions_list = re.findall(r'`([^`]*)`', message_text)
+                if fused_followup:
+                    followup_questions_list = [message_text]
+                else:
+                    followup_questions_list = re.findall(r'`([^`]*)`', message_text)
+                await partial_updater.close()
 
-                final_answer_id = await team_messaging_service.send_followup_card_response(
+                final_answer_id = await services.team_messaging_service.send_followup_card_response(
                     data["serviceUrl"], 
                     data["conversation"]["id"], 
                     activity_id, 
@@ -397,8 +464,9 @@ async def stream_updates(agentic_app, inputs, data, message_id, jwt_token, activ
             if key in ("image_based_answer", ):
                 logger.info(f"The value provided for this node is as below: {value}")
                 revised_prompt = value["final_answer"]["revised_prompt"]
+                await partial_updater.close()
                 prompt_response_document = {
-                    "id": str(uuid.uuid4()),
+                    "id": interaction_document_id(data["id"], "generated_image"),
                     "user_id": data['from']['aadObjectId'],
                     "timestamp_prompted": data["timestamp"],
                     "timestamp": datetime.datetime.utcnow().isoformat(),
@@ -410,10 +478,10 @@ async def stream_updates(agentic_app, inputs, data, message_id, jwt_token, activ
                     "conversation_id" : data["conversation"]["id"]
                 }
 
-                cosmos_service.insert_generated_image_info(prompt_response_document)
-                logger.info(f"Generated image information inserted into Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
+                services.interaction_writer.enqueue("images_info_container", prompt_response_document)
+                logger.info(f"Generated image information queued for Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
 
-                final_answer_id = await team_messaging_service.send_image_card_response(
+                final_answer_id = await services.team_messaging_service.send_image_card_response(
                     data["serviceUrl"], 
                     data["conversation"]["id"], 
                     activity_id, 
@@ -431,7 +499,8 @@ async def stream_updates(agentic_app, inputs, data, message_id, jwt_token, activ
                     error_message = value["final_answer"]
                 else:
                     error_message = "An error occurred while processing your request. Would you like to try again or ask something else?"
-                final_answer_id = await team_messaging_service.send_openai_response(
+                await partial_updater.close()
+                final_answer_id = await services.team_messaging_service.send_openai_response(
                     data["serviceUrl"], 
                     data["conversation"]["id"], 
                     activity_id, 
@@ -440,24 +509,11 @@ async def stream_updates(agentic_app, inputs, data, message_id, jwt_token, activ
                 )
                 return final_answer_id, error_message
 
+    await partial_updater.close()
     if last_valid_response:
-
-        prompt_response_document = {
-            "id": str(uuid.uuid4()),
-            "user_id": data['from']['aadObjectId'],
-            "timestamp_prompted": data["timestamp"],
-            "timestamp": datetime.datetime.utcnow().isoformat(),
-            "teams_message_id": data["id"],
-            "prompt": data["text"]  if data.get("text") else data["value"]["follow_up_question"],
-            "response": last_valid_response,
-            "conversation_type": data["type"],
-            "conversation_id" : data["conversation"]["id"]
-        }
-        cosmos_service.insert_prompt_response_info(prompt_response_document)
-        logger.info(f"Prompt response information inserted into Cosmos DB for user ID {data['from']['aadObjectId']}", extra=HelperMethods.add_logging_context(data))
-
+        # the prompt/response record is persisted once by the caller
         logger.info(f"Sending final response from node: {last_valid_node}")
-        final_answer_id = await team_messaging_service.send_openai_response(
+        final_answer_id = await services.team_messaging_service.send_openai_response(
             data["serviceUrl"], 
             data["conversation"]["id"], 
             activity_id, 
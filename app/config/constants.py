@@ -72,6 +72,86 @@ OPEN_AI_SHAREPOINT_PROMPT_EN: Final = """
 
 SELECT_DOCUMENT_COUNT: Final = os.getenv("SELECT_DOCUMENT_COUNT", 4)
 ENTITY_INDEX_LIST =  ["dev-common", "dev"]
+GRADE_DOCUMENTS_BATCH_MODE: Final = os.getenv("GRADE_DOCUMENTS_BATCH_MODE", "false").lower() == "true"
+# documents with a semantic reranker score (0-4) at or above the accept score skip LLM grading,
+# those below the reject score are dropped; suggest both with tools/calibrate_reranker_bands.py
+RERANKER_SCORE_BANDS_ENABLED: Final = os.getenv("RERANKER_SCORE_BANDS_ENABLED", "false").lower() == "true"
+RERANKER_ACCEPT_SCORE: Final = float(os.getenv("RERANKER_ACCEPT_SCORE", 3.0))
+RERANKER_REJECT_SCORE: Final = float(os.getenv("RERANKER_REJECT_SCORE", 1.0))
+# prefix of the per-document grade log lines read by tools/calibrate_reranker_bands.py
+DOCUMENT_GRADE_LOG_PREFIX: Final = "### Document grade: "
 
 # bot config
-TOP_CHAT_HISTORY: Final = int(os.getenv("TOP_CHAT_HISTORY", 1))
\ No newline at end of file
+TOP_CHAT_HISTORY: Final = int(os.getenv("TOP_CHAT_HISTORY", 1))
+BOT_HANDLER_ACK_MODE: Final = os.getenv("BOT_HANDLER_ACK_MODE", "false").lower() == "true"
+BOT_WORKER_CONCURRENCY: Final = int(os.getenv("BOT_WORKER_CONCURRENCY", 8))
+BOT_WORKER_MAX_QUEUE_SIZE: Final = int(os.getenv("BOT_WORKER_MAX_QUEUE_SIZE", 100))
+STREAM_ANSWERS: Final = os.getenv("STREAM_ANSWERS", "false").lower() == "true"
+STREAM_UPDATE_INTERVAL_SECONDS: Final = float(os.getenv("STREAM_UPDATE_INTERVAL_SECONDS", 1.0))
+STREAM_UPDATE_MIN_CHARS: Final = int(os.getenv("STREAM_UPDATE_MIN_CHARS", 20))
+SERVICE_CONTAINER_EAGER_INIT: Final = os.getenv("SERVICE_CONTAINER_EAGER_INIT", "false").lower() == "true"
+AGENT_WORKFLOW_WARMUP: Final = os.getenv("AGENT_WORKFLOW_WARMUP", "false").lower() == "true"
+# "default" (rephrase, then route) or "fused" (one analyze_query call)
+AGENT_WORKFLOW: Final = os.getenv("AGENT_WORKFLOW", "default")
+# rules and a centroid classifier route obvious queries before the LLM router is asked;
+# train the model with tools/train_local_router.py, without it only the rules are used
+LOCAL_ROUTER_ENABLED: Final = os.getenv("LOCAL_ROUTER_ENABLED", "false").lower() == "true"
+LOCAL_ROUTER_MODEL_PATH: Final = os.getenv("LOCAL_ROUTER_MODEL_PATH", "local_router_model.json")
+LOCAL_ROUTER_MIN_SIMILARITY: Final = float(os.getenv("LOCAL_ROUTER_MIN_SIMILARITY", 0.3))
+LOCAL_ROUTER_MIN_MARGIN: Final = float(os.getenv("LOCAL_ROUTER_MIN_MARGIN", 0.1))
+# prefix of the LLM route log lines read by tools/train_local_router.py
+QUERY_ROUTE_LOG_PREFIX: Final = "### Query route: "
+
+# semantic answer cache
+SEMANTIC_CACHE_ENABLED: Final = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_BACKEND: Final = os.getenv("SEMANTIC_CACHE_BACKEND", "memory")
+SEMANTIC_CACHE_SQLITE_PATH: Final = os.getenv("SEMANTIC_CACHE_SQLITE_PATH", "semantic_cache.db")
+SEMANTIC_CACHE_SIMILARITY_THRESHOLD: Final = float(os.getenv("SEMANTIC_CACHE_SIMILARITY_THRESHOLD", 0.95))
+SEMANTIC_CACHE_TTL_SECONDS: Final = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", 86400))
+SEMANTIC_CACHE_MAX_ENTRIES: Final = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 1000))
+
+# exact-match LLM cache
+LLM_CACHE_ENABLED: Final = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_BACKEND: Final = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_SQLITE_PATH: Final = os.getenv("LLM_CACHE_SQLITE_PATH", "llm_cache.db")
+LLM_CACHE_MAX_ENTRIES: Final = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+LLM_CACHE_CHAIN_TTLS: Final = os.getenv(
+    "LLM_CACHE_CHAIN_TTLS", "rephrase_query=600,route_question=3600,followup_ambiguous_queries=3600,analyze_query=600"
+)
+
+# query embedding cache
+EMBEDDING_CACHE_MAX_ENTRIES: Final = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 1024))
+EMBEDDING_CACHE_DIR: Final = os.getenv("EMBEDDING_CACHE_DIR", "")
+EMBEDDING_CACHE_DISK_ENTRIES: Final = int(os.getenv("EMBEDDING_CACHE_DISK_ENTRIES", 10000))
+EMBEDDING_CACHE_DISK_FLUSH_SECONDS: Final = float(os.getenv("EMBEDDING_CACHE_DISK_FLUSH_SECONDS", 5))
+EMBEDDING_BATCH_ENABLED: Final = os.getenv("EMBEDDING_BATCH_ENABLED", "false").lower() == "true"
+EMBEDDING_BATCH_MAX_SIZE: Final = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 16))
+EMBEDDING_BATCH_MAX_DELAY_MS: Final = float(os.getenv("EMBEDDING_BATCH_MAX_DELAY_MS", 5))
+SEARCH_INDEX_CATALOG_TTL_SECONDS: Final = int(os.getenv("SEARCH_INDEX_CATALOG_TTL_SECONDS", 300))
+
+# speculative retrieval on the raw query while it is rephrased and routed
+SPECULATIVE_RETRIEVAL_ENABLED: Final = os.getenv("SPECULATIVE_RETRIEVAL_ENABLED", "false").lower() == "true"
+SPECULATIVE_RETRIEVAL_MIN_SIMILARITY: Final = float(os.getenv("SPECULATIVE_RETRIEVAL_MIN_SIMILARITY", 0.9))
+SPECULATIVE_RETRIEVAL_MAX_PENDING: Final = int(os.getenv("SPECULATIVE_RETRIEVAL_MAX_PENDING", 100))
+
+# cosmos
+USER_PROFILE_CACHE_TTL_SECONDS: Final = int(os.getenv("USER_PROFILE_CACHE_TTL_SECONDS", 60))
+WRITE_BEHIND_FLUSH_INTERVAL_MS: Final = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", 200))
+WRITE_BEHIND_MAX_QUEUE_SIZE: Final = int(os.getenv("WRITE_BEHIND_MAX_QUEUE_SIZE", 10000))
+CONVERSATION_HISTORY_MAX_TURNS: Final = int(os.getenv("CONVERSATION_HISTORY_MAX_TURNS", 10))
+CONVERSATION_HISTORY_MAX_RESPONSE_CHARS: Final = int(os.getenv("CONVERSATION_HISTORY_MAX_RESPONSE_CHARS", 2000))
+
+# authentication
+TOKEN_REFRESH_MARGIN_SECONDS: Final = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", 300))
+BOT_FRAMEWORK_AUTH_ENABLED: Final = os.getenv("BOT_FRAMEWORK_AUTH_ENABLED", "false").lower() == "true"
+JWKS_REFRESH_INTERVAL_SECONDS: Final = int(os.getenv("JWKS_REFRESH_INTERVAL_SECONDS", 86400))
+JWKS_MIN_REFETCH_SECONDS: Final = int(os.getenv("JWKS_MIN_REFETCH_SECONDS", 300))
+USER_VALIDATION_CACHE_TTL_SECONDS: Final = int(os.getenv("USER_VALIDATION_CACHE_TTL_SECONDS", 3600))
+USER_VALIDATION_NEGATIVE_TTL_SECONDS: Final = int(os.getenv("USER_VALIDATION_NEGATIVE_TTL_SECONDS", 60))
+USER_VALIDATION_BATCH_WINDOW_MS: Final = float(os.getenv("USER_VALIDATION_BATCH_WINDOW_MS", 10))
+
+# outbound http
+HTTP_POOL_LIMIT: Final = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST: Final = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 20))
+HTTP_KEEPALIVE_TIMEOUT_SECONDS: Final = int(os.getenv("HTTP_KEEPALIVE_TIMEOUT_SECONDS", 60))
+HTTP_REQUEST_TIMEOUT_SECONDS: Final = int(os.getenv("HTTP_REQUEST_TIMEOUT_SECONDS", 60))
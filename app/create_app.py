@@ -1,13 +1,23 @@
+import atexit
 import os
 from dotenv import find_dotenv, load_dotenv
 from flask import Flask
 import json
 
 from app.config.set_logger import set_logger
+from app.config.constants import AGENT_WORKFLOW_WARMUP, SERVICE_CONTAINER_EAGER_INIT
+from app.services.service_container import services
+from app.utils.util_background_loop import io_loop
+from app.agents.agent_workflow_registry import build_agent_workflows
 
 from .api.bot_handler import bot_handler as core_blueprint
 
 
+def shutdown_app():
+    # flushes queued records and closes pooled clients before the loop they live on stops
+    services.shutdown()
+    io_loop.stop()
+
 
 def create_app():
 
@@ -18,4 +28,11 @@ def create_app():
         url_prefix = '/api/v1/core'
     )
 
+    if SERVICE_CONTAINER_EAGER_INIT:
+        services.initialize()
+    build_agent_workflows(warm_up=AGENT_WORKFLOW_WARMUP)
+    # fetch the signing keys before the first request needs them
+    services.token_validation_service.prefetch_keys()
+    atexit.register(shutdown_app)
+
     return app
\ No newline at end of file
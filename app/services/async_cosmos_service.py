@@ -0,0 +1,423 @@
+import asyncio
+import datetime
+import functools
+
+from azure.core import MatchConditions
+from azure.cosmos.aio import CosmosClient
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceExistsError, CosmosResourceNotFoundError
+from cachetools import LRUCache, TTLCache
+
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+# doc_type of the per-user profile document stored next to the interactions
+PROFILE_DOC_TYPE = "profile"
+# doc_type of the rolling history document kept per conversation
+HISTORY_DOC_TYPE = "history"
+
+
+def history_document_id(conversation_id):
+    return f"{HISTORY_DOC_TYPE}:{conversation_id}"
+
+
+def append_history_turn(turns, prompt, response, max_turns, max_response_chars):
+    """Returns the turns with the new one appended, keeping the last `max_turns` and truncating the response."""
+    response = response or ""
+    if len(response) > max_response_chars:
+        response = response[:max_response_chars]
+    turns = list(turns) + [{"prompt": prompt, "response": response}]
+    return turns[-max_turns:]
+
+
+def on_event_loop(method):
+    """Runs a coroutine method on the service's event loop, where the shared Cosmos client lives."""
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await self.event_loop.run(method(self, *args, **kwargs))
+
+    return wrapper
+
+
+class AsyncCosmosService:
+    """
+    Async counterpart of CosmosService built on azure.cosmos.aio.
+
+    Exposes the same methods as coroutines. A single client is opened on the background loop on
+    first use and every call is executed there, so the connection pool is shared by all requests
+    regardless of the event loop they run on.
+
+    The welcome message and data agreement states live in a profile document per user
+    (id = user id), which is point read and cached for `profile_cache_ttl` seconds.
+
+    The chat history of a conversation lives in a history document holding the last
+    `history_max_turns` turns, so it is loaded with one point read whatever the length of the
+    user's history. It is cached like the profile for reading. A turn is appended to a fresh point
+    read and written conditionally on its `_etag`, so pods handling the same conversation cannot
+    drop each other's turns; on a conflict the turn is appended again, up to
+    `history_write_attempts` times.
+    """
+
+    def __init__(self, endpoint, key, database_name, user_interactions_container_name, images_info_container_name, reply_to_id_container_name, event_loop=io_loop, profile_cache_ttl=60, profile_cache_size=10000, history_max_turns=10, history_max_response_chars=2000, history_write_attempts=5):
+        self.endpoint = endpoint
+        self.key = key
+        self.database_name = database_name
+        self.user_interactions_container_name = user_interactions_container_name
+        self.images_info_container_name = images_info_container_name
+        self.reply_to_id_container_name = reply_to_id_container_name
+        self.event_loop = event_loop
+        self.client = None
+        self.interactions_container = None
+        self.images_info_container = None
+        self.reply_to_id_container = None
+        self._open_lock = None
+        # only touched on the background loop, so it needs no lock
+        self.profile_cache = TTLCache(maxsize=profile_cache_size, ttl=profile_cache_ttl)
+        self.history_cache = TTLCache(maxsize=profile_cache_size, ttl=profile_cache_ttl)
+        # histories built from legacy interactions, kept until the history document is first written
+        self.seeded_histories = LRUCache(maxsize=profile_cache_size)
+        self.history_max_turns = history_max_turns
+        self.history_max_response_chars = history_max_response_chars
+        self.history_write_attempts = history_write_attempts
+        logger.info(f"AsyncCosmosService initialized for database: {database_name}")
+
+    async def _open(self):
+        if self.client is not None:
+            return
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self.client is not None:
+                return
+            client = CosmosClient(self.endpoint, self.key)
+            await client.__aenter__()
+            database = client.get_database_client(self.database_name)
+            self.interactions_container = database.get_container_client(self.user_interactions_container_name)
+            self.images_info_container = database.get_container_client(self.images_info_container_name)
+            self.reply_to_id_container = database.get_container_client(self.reply_to_id_container_name)
+            self.client = client
+            logger.info(f"Async Cosmos client opened for database: {self.database_name}")
+
+    async def _query(self, container, query, parameters, partition_key):
+        await self._open()
+        return [item async for item in getattr(self, container).query_items(query, parameters=parameters, partition_key=partition_key)]
+
+    # Methods for user_interactions_container
+
+    async def _read_user_profile(self, user_id):
+        await self._open()
+        try:
+            return await self.interactions_container.read_item(item=user_id, partition_key=user_id)
+        except CosmosResourceNotFoundError:
+            pass
+
+        # users onboarded before profile documents existed keep their state on an interaction document
+        query = "SELECT TOP 1 c.conversation_id, c.state_of_welcome_message_sent, c.state_of_data_agreement FROM c WHERE c.user_id = @user_id AND IS_DEFINED(c.state_of_welcome_message_sent)"
+        result = await self._query("interactions_container", query, [{"name": "@user_id", "value": user_id}], user_id)
+        if not result:
+            return None
+        profile = {
+            "id": user_id,
+            "doc_type": PROFILE_DOC_TYPE,
+            "user_id": user_id,
+            "conversation_id": result[0].get("conversation_id"),
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "state_of_welcome_message_sent": result[0].get("state_of_welcome_message_sent"),
+            "state_of_data_agreement": result[0].get("state_of_data_agreement"),
+        }
+        await self.interactions_container.upsert_item(body=profile)
+        logger.info(f"Created profile document for user_id {user_id} from interaction history")
+        return profile
+
+    @on_event_loop
+    async def get_user_profile(self, user_id):
+        if user_id in self.profile_cache:
+            return self.profile_cache[user_id]
+        profile = await self._read_user_profile(user_id)
+        self.profile_cache[user_id] = profile
+        return profile
+
+    @on_event_loop
+    async def upsert_user_profile(self, profile):
+        try:
+            await self._open()
+            profile = dict(profile, id=profile["user_id"], doc_type=PROFILE_DOC_TYPE)
+            await self.interactions_container.upsert_item(body=profile)
+            self.profile_cache[profile["user_id"]] = profile
+            logger.info(f"Upserted profile for user_id: {profile['user_id']}")
+            return True
+        except Exception as e:
+            logger.error(f"Error upserting profile for user_id {profile['user_id']}: {str(e)}")
+            return False
+
+    @on_event_loop
+    async def get_interaction_state(self, user_id):
+        try:
+            profile = await self.get_user_profile(user_id)
+            if profile:
+                state = profile.get("state_of_welcome_message_sent")
+                logger.debug(f"Interaction state for user_id {user_id}: {state}")
+                return state
+            else:
+                logger.debug(f"No interaction state found for user_id {user_id}")
+                return None
+        except Exception as e:
+            logger.error(f"Error fetching interaction state for user_id {user_id}: {str(e)}")
+            return None
+
+    @on_event_loop
+    async def get_data_agreement_state(self, user_id):
+        try:
+            profile = await self.get_user_profile(user_id)
+            if profile:
+                state = profile.get("state_of_data_agreement")
+                logger.debug(f"Data agreement state for user_id {user_id}: {state}")
+                return state
+            else:
+                logger.debug(f"No data agreement state found for user_id {user_id}")
+                return None
+        except Exception as e:
+            logger.error(f"Error fetching data agreement state for user_id {user_id}: {str(e)}")
+            return None
+
+    @on_event_loop
+    async def get_message_ids(self, user_id):
+        try:
+            query = "SELECT c.teams_message_id FROM c WHERE c.user_id = @user_id"
+            message_id_list = await self._query("interactions_container", query, [{"name": "@user_id", "value": user_id}], user_id)
+            message_ids = [item.get('teams_message_id') for item in message_id_list]
+            logger.debug(f"Message IDs for user_id {user_id}: {message_ids}")
+            return message_ids
+        except Exception as e:
+            logger.error(f"Error fetching message IDs for user_id {user_id}: {str(e)}")
+            return []
+
+    @on_event_loop
+    async def get_interaction_type(self, user_id):
+        try:
+            query = "SELECT TOP 1 c.interaction_type FROM c WHERE c.user_id = @user_id ORDER BY c.timestamp DESC"
+            interaction_type_list = await self._query("interactions_container", query, [{"name": "@user_id", "value": user_id}], user_id)
+            if interaction_type_list:
+                interaction_type = interaction_type_list[0].get('interaction_type')
+                logger.debug(f"Latest interaction type for user_id {user_id}: {interaction_type}")
+                return interaction_type
+            else:
+                logger.debug(f"No interaction type found for user_id {user_id}")
+                return None
+        except Exception as e:
+            logger.error(f"Error fetching interaction type for user_id {user_id}: {str(e)}")
+            return None
+
+    @on_event_loop
+    async def delete_conversation(self, user_id):
+        try:
+            await self._open()
+            self.profile_cache.pop(user_id, None)
+            for cache in (self.history_cache, self.seeded_histories):
+                for key in [key for key in cache if key[0] == user_id]:
+                    cache.pop(key, None)
+            response = await self.interactions_container.delete_all_items_by_partition_key(user_id)
+            logger.info(f"Deleted conversation history for user_id: {user_id}")
+            return response
+        except Exception as e:
+            logger.error(f"Error deleting conversation history for user_id {user_id}: {str(e)}")
+            return None
+
+    @on_event_loop
+    async def update_data_agreement_state(self, user_id, accepted=False, declined=False, deleted=False):
+        try:
+            if accepted:
+                new_state = "accepted"
+            elif declined:
+                new_state = "declined"
+            elif deleted:
+                new_state = "deleted"
+            else:
+                raise ValueError("At least one state flag (accepted, declined, deleted) must be True")
+
+            self.profile_cache.pop(user_id, None)
+            profile = await self._read_user_profile(user_id)
+
+            if profile:
+                profile["timestamp"] = datetime.datetime.utcnow().isoformat()
+                profile["state_of_data_agreement"] = new_state
+                await self.interactions_container.upsert_item(body=profile)
+                self.profile_cache[user_id] = profile
+                logger.info(f"Updated data agreement state for user_id {user_id} to {new_state}")
+            else:
+                logger.debug(f"No item found to update for user_id {user_id}")
+        except ValueError as ve:
+            logger.error(f"Value error in updating data agreement state for user_id {user_id}: {str(ve)}")
+        except Exception as e:
+            logger.error(f"Error updating data agreement state for user_id {user_id}: {str(e)}")
+
+    @on_event_loop
+    async def insert_prompt_response_info(self, item):
+        try:
+            await self._open()
+            await self.interactions_container.create_item(body=item)
+            logger.info(f"Inserted prompt-response interaction for user_id: {item['user_id']}")
+            return True
+        except Exception as e:
+            logger.error(f"Error inserting prompt-response interaction for user_id {item['user_id']}: {str(e)}")
+            return False
+
+    @on_event_loop
+    async def upsert_items_batch(self, container_name, partition_key, items):
+        """Upserts items of one partition in a single transactional batch; raises if the batch fails."""
+        await self._open()
+        container = getattr(self, container_name)
+        return await container.execute_item_batch([("upsert", (item,)) for item in items], partition_key=partition_key)
+
+    @on_event_loop
+    async def insert_generated_image_info(self, item):
+        try:
+            await self._open()
+            await self.images_info_container.create_item(body=item)
+            logger.info(f"Inserted generated image info for user_id: {item['user_id']}")
+            return True
+        except Exception as e:
+            logger.error(f"Error inserting generated image info for user_id {item['user_id']}: {str(e)}")
+            return False
+
+    @on_event_loop
+    async def get_latest_conversations(self, user_id, top_n=3):
+        try:
+            query = "SELECT TOP @top_n c.prompt, c.response FROM c WHERE c.user_id = @user_id AND NOT IS_DEFINED(c.doc_type) ORDER BY c.timestamp DESC"
+            parameters = [{"name": "@top_n", "value": int(top_n)}, {"name": "@user_id", "value": user_id}]
+            result = await self._query("interactions_container", query, parameters, user_id)
+            logger.debug(f"Latest {top_n} conversations for user_id {user_id}: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"Error fetching latest conversations for user_id {user_id}: {str(e)}")
+            return []
+
+    async def _read_history_document(self, user_id, conversation_id):
+        await self._open()
+        try:
+            return await self.interactions_container.read_item(item=history_document_id(conversation_id), partition_key=user_id)
+        except CosmosResourceNotFoundError:
+            pass
+
+        key = (user_id, conversation_id)
+        if key not in self.seeded_histories:
+            self.seeded_histories[key] = await self._seed_history_document(user_id, conversation_id)
+        return dict(self.seeded_histories[key])
+
+    async def _seed_history_document(self, user_id, conversation_id):
+        # conversations started before history documents existed are seeded from their interactions
+        query = "SELECT TOP @top_n c.prompt, c.response FROM c WHERE c.user_id = @user_id AND c.conversation_id = @conversation_id AND NOT IS_DEFINED(c.doc_type) ORDER BY c.timestamp DESC"
+        parameters = [{"name": "@top_n", "value": self.history_max_turns}, {"name": "@user_id", "value": user_id},
+                      {"name": "@conversation_id", "value": conversation_id}]
+        turns = []
+        for item in reversed(await self._query("interactions_container", query, parameters, user_id)):
+            turns = append_history_turn(turns, item.get("prompt"), item.get("response"), self.history_max_turns, self.history_max_response_chars)
+        return {
+            "id": history_document_id(conversation_id),
+            "doc_type": HISTORY_DOC_TYPE,
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "turns": turns,
+        }
+
+    async def _get_history_document(self, user_id, conversation_id):
+        key = (user_id, conversation_id)
+        if key not in self.history_cache:
+            self.history_cache[key] = await self._read_history_document(user_id, conversation_id)
+        return self.history_cache[key]
+
+    @on_event_loop
+    async def get_conversation_history(self, user_id, conversation_id, top_n=3):
+        """Returns the last `top_n` turns of the conversation, latest first, like get_latest_conversations."""
+        try:
+            document = await self._get_history_document(user_id, conversation_id)
+            result = list(reversed(document["turns"]))[:top_n]
+            logger.debug(f"Latest {top_n} turns of conversation {conversation_id} for user_id {user_id}: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"Error fetching conversation history for user_id {user_id}: {str(e)}")
+            return []
+
+    async def _write_history_document(self, document):
+        if "_etag" not in document:
+            return await self.interactions_container.create_item(body=document)
+        return await self.interactions_container.replace_item(item=document["id"], body=document, etag=document["_etag"],
+                                                              match_condition=MatchConditions.IfNotModified)
+
+    @on_event_loop
+    async def add_conversation_turn(self, user_id, conversation_id, prompt, response):
+        """Appends a turn to the history document and returns the stored document, or None if that failed."""
+        key = (user_id, conversation_id)
+        try:
+            for attempt in range(self.history_write_attempts):
+                document = await self._read_history_document(user_id, conversation_id)
+                document["turns"] = append_history_turn(document["turns"], prompt, response, self.history_max_turns, self.history_max_response_chars)
+                document["timestamp"] = datetime.datetime.utcnow().isoformat()
+                try:
+                    stored = await self._write_history_document(document)
+                except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+                    logger.info(f"History of conversation {conversation_id} was updated concurrently, appending again (attempt {attempt + 1})")
+                    continue
+                self.seeded_histories.pop(key, None)
+                self.history_cache[key] = stored
+                return stored
+            logger.error(f"Giving up on appending to the history of conversation {conversation_id} for user_id {user_id} after {self.history_write_attempts} conflicts")
+            return None
+        except Exception as e:
+            logger.error(f"Error updating conversation history for user_id {user_id}: {str(e)}")
+            return None
+
+    # Methods for reply_to_id_container
+
+    @on_event_loop
+    async def insert_reply_to_id(self, item):
+        try:
+            await self._open()
+            await self.reply_to_id_container.create_item(body=item)
+            logger.info(f"Inserted reply_to_id info for user_id: {item['user_id']}")
+            return True
+        except Exception as e:
+            logger.error(f"Error inserting reply_to_id  info for user_id {item['user_id']}: {str(e)}")
+            return False
+
+    @on_event_loop
+    async def get_reply_to_id(self, reply_to_id, user_id, prompt_input):
+        try:
+            query = "SELECT c.id FROM c WHERE c.reply_to_id = @reply_to_id and c.prompt_input = @prompt_input"
+            parameters = [{"name": "@reply_to_id", "value": reply_to_id},
+                          {"name": "@prompt_input", "value": prompt_input}]
+            result = await self._query("reply_to_id_container", query, parameters, user_id)
+            return bool(result)
+        except Exception as e:
+            logger.error(f"Error fetching reply_to_id {reply_to_id} for user_id {user_id}: {str(e)}")
+            return None
+
+    @on_event_loop
+    async def delete_reply_to_id(self, reply_to_id, user_id):
+        try:
+            query = "SELECT c.id FROM c WHERE c.reply_to_id = @reply_to_id"
+            parameters = [{"name": "@reply_to_id", "value": reply_to_id}]
+            result = await self._query("reply_to_id_container", query, parameters, user_id)
+
+            if result:
+                await self.reply_to_id_container.delete_item(item=result[0]['id'], partition_key=user_id)
+                return True
+            else:
+                return False
+        except Exception as e:
+            logger.error(f"Error deleting reply_to_id {reply_to_id} for user_id {user_id}: {str(e)}")
+            return None
+
+    @on_event_loop
+    async def close(self):
+        if self.client is not None:
+            client, self.client = self.client, None
+            await client.close()
+            logger.info(f"Async Cosmos client closed for database: {self.database_name}")
+
+    def shutdown(self, timeout=5):
+        """Closes the shared client from a synchronous context, e.g. at process exit."""
+        if self.client is not None:
+            self.event_loop.submit(self.close()).result(timeout)
@@ -1,26 +1,47 @@
+import asyncio
+import threading
+import time
 import requests
 import jwt
 from retrying import retry
 from datetime import datetime
+from app.utils.util_background_loop import io_loop
 from app.config.set_logger import set_logger
 
 logger = set_logger(name=__name__)
 
 class AuthenticationService:
-    def __init__(self, microsoft_tenant_id, microsoft_app_id, microsoft_app_secret, token_validation_service):
+    """
+    Acquires and caches the outbound Bot Framework token.
+
+    The token is stored with its expiry, taken from `expires_in` of the token response or, failing
+    that, from the unverified `exp` claim, so checking it costs a clock read. Within
+    `refresh_margin_seconds` of expiry a single refresh runs in the background while callers keep
+    using the still valid token; only a missing or expired token is refreshed inline.
+
+    `http_post` sends the token request and defaults to `requests.post`.
+    """
+
+    def __init__(self, microsoft_tenant_id, microsoft_app_id, microsoft_app_secret, token_validation_service, refresh_margin_seconds=300, event_loop=io_loop, clock=time.time, http_post=None):
         self.token_store = {}
         self.microsoft_tenant_id = microsoft_tenant_id
         self.microsoft_app_id = microsoft_app_id
         self.microsoft_app_secret = microsoft_app_secret
         self.token_validation_service = token_validation_service
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.event_loop = event_loop
+        self.clock = clock
+        self.http_post = http_post
+        self._refresh_lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._background_refresh = None
         logger.info("AuthenticationService initialized.")
 
     def is_jwt_token_expired(self, token):
-        jkws = self.token_validation_service.fetch_azure_jkws()
         try:
             unverified_header = jwt.get_unverified_header(token)
             kid = unverified_header['kid']
-            public_key = self.token_validation_service.get_public_key(jkws, kid)
+            public_key = self.token_validation_service.get_public_key(kid)
             if public_key is None:
                 logger.error("Public key not found in JWKS")
                 raise Exception('Public key not found in JWKS')
@@ -63,12 +84,15 @@ class AuthenticationService:
         }
 
         try:
-            response = requests.post(url, headers=headers, data=data)
+            post = self.http_post or requests.post
+            response = post(url, headers=headers, data=data)
             response.raise_for_status()
             response_data = response.json()
             bearer_token = response_data.get("access_token")
             if bearer_token:
-                self.store_current_token(bearer_token)
+                expires_in = response_data.get("expires_in")
+                expires_at = self.clock() + int(expires_in) if expires_in else None
+                self.store_current_token(bearer_token, expires_at)
                 logger.info("Bearer token acquired and stored.")
                 return bearer_token
             else:
@@ -86,33 +110,74 @@ class AuthenticationService:
     def get_current_token(self):
         return self.token_store.get("current_token")
 
-    def store_current_token(self, token):
+    def get_token_expiry(self):
+        return self.token_store.get("expires_at")
+
+    def store_current_token(self, token, expires_at=None):
+        if expires_at is None:
+            expires_at = self.read_token_expiry(token)
         self.token_store["current_token"] = token
+        self.token_store["expires_at"] = expires_at
         logger.debug("Token stored in token storage.")
 
+    @staticmethod
+    def read_token_expiry(token):
+        """Reads `exp` without verifying the signature; the token was received from Azure AD over TLS."""
+        try:
+            expires_at = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        except jwt.PyJWTError as e:
+            logger.warning(f"Could not read the expiry of the bearer token: {e}")
+            return None
+        return expires_at if isinstance(expires_at, (int, float)) else None
+
     @retry(wait_exponential_multiplier=1000, wait_exponential_max=10000, stop_max_attempt_number=3)
     def get_token_with_retry(self):
         """Retry token fetch up to a maximum of 3 times starting at 1 second delay to a maximum of 10 second delay to retry token fetch"""
         logger.debug("Attempting to fetch token with retry.")
         return self.get_bearer_token()
 
+    def _seconds_to_expiry(self):
+        expires_at = self.get_token_expiry()
+        if not self.get_current_token() or expires_at is None:
+            return None
+        return expires_at - self.clock()
+
     def refresh_token_if_needed(self):
-        current_token = self.get_current_token()
-        if current_token and self.is_jwt_token_expired(current_token):
-            logger.debug("Existing token has expired! Creating a new token.")
-            try:
-                new_token = self.get_token_with_retry()  # Retry token acquisition
-                if new_token:
-                    self.store_current_token(new_token)
-                    logger.debug("New token stored in token storage.")
-            except Exception as e:
-                logger.error(f"Failed to refresh token: {str(e)}")
-        elif not current_token:
-            logger.debug("No current token found, acquiring new token.")
-            try:
-                new_token = self.get_token_with_retry()  # Retry token acquisition for initial token
-                if new_token:
-                    self.store_current_token(new_token)
-                    logger.debug("No current token so created a new token and stored it in token storage.")
-            except Exception as e:
-                logger.error(f"Failed to acquire initial token: {str(e)}")
+        seconds_to_expiry = self._seconds_to_expiry()
+        if seconds_to_expiry is not None and seconds_to_expiry > self.refresh_margin_seconds:
+            return
+        if seconds_to_expiry is not None and seconds_to_expiry > 0:
+            self._refresh_in_background()
+            return
+
+        # a missing or expired token has to be replaced before the caller can use it
+        with self._refresh_lock:
+            seconds_to_expiry = self._seconds_to_expiry()
+            if seconds_to_expiry is not None and seconds_to_expiry > 0:
+                return  # refreshed by a concurrent caller while waiting for the lock
+            if self.get_current_token():
+                logger.debug("Existing token has expired! Creating a new token.")
+            else:
+                logger.debug("No current token found, acquiring new token.")
+            self._acquire_token()
+
+    def _acquire_token(self):
+        try:
+            if self.get_token_with_retry():
+                logger.debug("New token stored in token storage.")
+        except Exception as e:
+            logger.error(f"Failed to refresh token: {str(e)}")
+
+    def _refresh_in_background(self):
+        with self._background_lock:
+            if self._background_refresh is not None and not self._background_refresh.done():
+                return
+            logger.debug("Token expires soon, refreshing it in the background.")
+            self._background_refresh = self.event_loop.submit(asyncio.to_thread(self._refresh_expiring_token))
+
+    def _refresh_expiring_token(self):
+        with self._refresh_lock:
+            seconds_to_expiry = self._seconds_to_expiry()
+            if seconds_to_expiry is not None and seconds_to_expiry > self.refresh_margin_seconds:
+                return
+            self._acquire_token()
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+class BackgroundTaskService:
+    """
+    In-process worker pool for interactions acknowledged before they are processed.
+
+    At most `concurrency` tasks run at the same time on the shared background loop; up to
+    `max_queue_size` further tasks wait for a free slot. `submit` returns False once the queue
+    is full so the caller can process the work inline instead.
+    """
+
+    def __init__(self, concurrency, max_queue_size, event_loop=io_loop):
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        self.event_loop = event_loop
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        logger.info(f"BackgroundTaskService initialized with concurrency: {concurrency}, max_queue_size: {max_queue_size}")
+
+    def submit(self, coroutine_function, *args, **kwargs):
+        with self._lock:
+            if self._pending - self._active >= self.max_queue_size:
+                self._rejected += 1
+                logger.warning(f"Background queue is full ({self.max_queue_size} waiting), task rejected")
+                return False
+            self._pending += 1
+            queue_depth = self._pending - self._active
+        logger.debug(f"Task {coroutine_function.__name__} queued, queue depth: {queue_depth}")
+        self.event_loop.submit(self._run(coroutine_function, args, kwargs))
+        return True
+
+    async def _run(self, coroutine_function, args, kwargs):
+        succeeded = False
+        started = False
+        try:
+            async with self._semaphore:
+                with self._lock:
+                    self._active += 1
+                started = True
+                await coroutine_function(*args, **kwargs)
+                succeeded = True
+        except Exception:
+            logger.error(f"Background task {coroutine_function.__name__} failed", exc_info=True)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if started:
+                    self._active -= 1
+                if succeeded:
+                    self._processed += 1
+                else:
+                    self._failed += 1
+
+    def queue_depth(self):
+        with self._lock:
+            return self._pending - self._active
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._pending - self._active,
+                "active": self._active,
+                "concurrency": self.concurrency,
+                "max_queue_size": self.max_queue_size,
+                "processed": self._processed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
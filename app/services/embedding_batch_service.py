@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Collects concurrent `aembed_query` calls from all requests into batched `aembed_documents` calls.
+
+    A batch is sent once `max_batch_size` distinct texts are waiting or `max_delay` seconds after its
+    first text arrived, whichever comes first. Batching happens on the shared background loop, so
+    requests running on different Flask event loops end up in the same batch. Identical texts in one
+    batch are embedded once.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size=16, max_delay=0.005, event_loop=io_loop):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.event_loop = event_loop
+        self._pending = {}
+        self._flush_handle = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._embedded_texts = 0
+        self._max_batch_size_seen = 0
+        self._batch_sizes = {}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.event_loop.run(self._enqueue(text))
+
+    async def _enqueue(self, text):
+        with self._lock:
+            self._requests += 1
+        future = self._pending.get(text)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[text] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.get_running_loop().create_task(self._embed_batch(batch))
+
+    async def _embed_batch(self, batch):
+        texts = list(batch)
+        with self._lock:
+            self._batches += 1
+            self._embedded_texts += len(texts)
+            self._max_batch_size_seen = max(self._max_batch_size_seen, len(texts))
+            self._batch_sizes[len(texts)] = self._batch_sizes.get(len(texts), 0) + 1
+        try:
+            vectors = await self.embeddings.aembed_documents(texts)
+        except Exception as ex:
+            logger.warning(f"Batched embedding of {len(texts)} texts failed: {ex}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(ex)
+            return
+        for text, vector in zip(texts, vectors):
+            if not batch[text].done():
+                batch[text].set_result(vector)
+        for future in batch.values():
+            if not future.done():
+                future.set_exception(ValueError("Embeddings response is missing vectors for the batch"))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "batches": self._batches,
+                "embedded_texts": self._embedded_texts,
+                "average_batch_size": self._embedded_texts / self._batches if self._batches else 0.0,
+                "max_batch_size": self._max_batch_size_seen,
+                "batch_sizes": dict(self._batch_sizes),
+            }
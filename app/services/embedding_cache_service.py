@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from cachetools import LRUCache
+
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+class DiskEmbeddingStore:
+    """
+    Fixed-capacity store of float32 vectors in a memory-mapped file.
+
+    Rows are reused in insertion order once `capacity` is reached. The key of every written row is
+    appended to a small log next to the vectors, which is replayed on start-up and compacted when it
+    grows well beyond `capacity` lines.
+
+    `put` only writes to the mapped pages and buffers the log line. `flush` syncs the vectors and then
+    appends the buffered keys; it runs from `put` at most every `flush_interval` seconds and should be
+    called at shutdown. Keys written after the last flush are lost if the process dies.
+    """
+
+    def __init__(self, directory, capacity=10000, flush_interval=5, clock=time.monotonic):
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._meta_path = os.path.join(directory, "embeddings.json")
+        self._vectors_path = os.path.join(directory, "embeddings.f32")
+        self._keys_path = os.path.join(directory, "embeddings.keys")
+        self._vectors = None
+        self._dimensions = None
+        self._rows = {}
+        self._keys = {}
+        self._next_row = 0
+        self._log_lines = 0
+        self._unflushed_lines = []
+        self._flushed_at = clock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta["capacity"] != self.capacity or not os.path.exists(self._vectors_path):
+            logger.warning(f"Discarding incompatible embedding store at {self.directory}")
+            return
+        self._open(meta["dimensions"], mode="r+")
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path) as keys_file:
+                for line in keys_file:
+                    row, _, key = line.rstrip("\n").partition(" ")
+                    if key:
+                        self._assign(int(row), key)
+                        self._log_lines += 1
+        logger.info(f"Loaded {len(self._rows)} embeddings from {self.directory}")
+
+    def _open(self, dimensions, mode):
+        self._dimensions = dimensions
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, dimensions))
+
+    def _assign(self, row, key):
+        previous_key = self._keys.get(row)
+        if previous_key is not None:
+            self._rows.pop(previous_key, None)
+        self._keys[row] = key
+        self._rows[key] = row
+        self._next_row = (row + 1) % self.capacity
+
+    def get(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        return np.array(self._vectors[row])
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if self._vectors is None:
+            self._open(len(vector), mode="w+")
+            with open(self._meta_path, "w") as meta_file:
+                json.dump({"dimensions": self._dimensions, "capacity": self.capacity}, meta_file)
+            open(self._keys_path, "w").close()
+        if len(vector) != self._dimensions:
+            logger.warning(f"Embedding with {len(vector)} dimensions not stored, expected {self._dimensions}")
+            return
+        if key in self._rows:
+            return
+        row = self._next_row
+        self._vectors[row] = vector
+        self._assign(row, key)
+        self._unflushed_lines.append(f"{row} {key}\n")
+        self._log_lines += 1
+        if self.clock() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Syncs the vectors to disk, then appends the keys written since the last flush to the log."""
+        self._flushed_at = self.clock()
+        if not self._unflushed_lines:
+            return
+        self._vectors.flush()
+        if self._log_lines > 4 * self.capacity:
+            self._compact()
+        else:
+            with open(self._keys_path, "a") as keys_file:
+                keys_file.writelines(self._unflushed_lines)
+        self._unflushed_lines = []
+
+    def _compact(self):
+        # rows are rewritten oldest first so replaying the log restores the insertion order
+        rows = sorted(self._keys, key=lambda row: (row - self._next_row) % self.capacity)
+        with open(self._keys_path, "w") as keys_file:
+            keys_file.writelines(f"{row} {self._keys[row]}\n" for row in rows)
+        self._log_lines = len(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class EmbeddingCacheService:
+    """
+    Embeds queries through the async embeddings API and caches the vectors.
+
+    Vectors are kept in an in-memory LRU and, when a `disk_store` is configured, in a memory-mapped
+    file so they survive restarts. `namespace` should identify the embedding model, so vectors of
+    different models never mix.
+    """
+
+    def __init__(self, embeddings, namespace="", max_entries=1024, disk_store=None):
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.disk_store = disk_store
+        self._memory = LRUCache(maxsize=max_entries)
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def make_key(self, text):
+        return hashlib.sha256(f"{self.namespace}\n{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        """Returns the cached vector for the text or None."""
+        key = self.make_key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._counters["memory_hits"] += 1
+                return vector
+            if self.disk_store is not None:
+                vector = self.disk_store.get(key)
+                if vector is not None:
+                    self._counters["disk_hits"] += 1
+                    self._memory[key] = vector
+                    return vector
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, text, vector):
+        key = self.make_key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._memory[key] = vector
+            if self.disk_store is not None:
+                self.disk_store.put(key, vector)
+
+    def shutdown(self):
+        """Writes the buffered disk store keys."""
+        if self.disk_store is not None:
+            with self._lock:
+                self.disk_store.flush()
+
+    async def aembed_query(self, text):
+        vector = self.get(text)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.put(text, vector)
+        return np.asarray(vector, dtype=np.float32).tolist()
+
+    def stats(self):
+        with self._lock:
+            lookups = sum(self._counters.values())
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            return dict(
+                self._counters,
+                hit_rate=hits / lookups if lookups else 0.0,
+                memory_entries=len(self._memory),
+                disk_entries=len(self.disk_store) if self.disk_store is not None else 0,
+            )
@@ -0,0 +1,121 @@
+import aiohttp
+
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+class PooledHttpSession:
+    """
+    Process-wide aiohttp session with a keep-alive connection pool, living on the background loop.
+
+    Requests to the same host (e.g. a Bot Framework serviceUrl) reuse established TLS connections
+    instead of paying for DNS, TCP and TLS setup each time. At most `limit_per_host` connections are
+    kept per host. Like the pooled search clients, the session is bound to the background loop, so
+    `run` executes the whole request there and only the result travels back to the caller's loop.
+
+    Connection reuse and request latency are recorded per origin (scheme, host and port).
+    """
+
+    def __init__(self, limit=100, limit_per_host=20, keepalive_timeout=60, timeout_seconds=60, event_loop=io_loop):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout_seconds = timeout_seconds
+        self.event_loop = event_loop
+        self._session = None
+        # only touched on the background loop, so it needs no lock
+        self._origins = {}
+
+    def _create_session(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300,
+        )
+        logger.info(f"HTTP session created with limit: {self.limit}, limit_per_host: {self.limit_per_host}")
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+            trace_configs=[trace_config],
+        )
+
+    def get_session(self):
+        """Returns the shared session. Must be called on the background loop."""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    async def run(self, request):
+        """Runs `request(session)` with the shared session on the background loop."""
+
+        async def run_request():
+            return await request(self.get_session())
+
+        return await self.event_loop.run(run_request())
+
+    def _origin_stats(self, origin):
+        stats = self._origins.get(origin)
+        if stats is None:
+            stats = {"requests": 0, "errors": 0, "new_connections": 0, "reused_connections": 0,
+                     "total_latency_ms": 0.0, "max_latency_ms": 0.0}
+            self._origins[origin] = stats
+        return stats
+
+    async def _on_request_start(self, session, context, params):
+        context.origin = str(params.url.origin())
+        context.started_at = self.event_loop.loop.time()
+
+    async def _on_connection_create_end(self, session, context, params):
+        self._origin_stats(context.origin)["new_connections"] += 1
+
+    async def _on_connection_reuseconn(self, session, context, params):
+        self._origin_stats(context.origin)["reused_connections"] += 1
+
+    def _record_request(self, context, failed):
+        stats = self._origin_stats(context.origin)
+        latency_ms = (self.event_loop.loop.time() - context.started_at) * 1000
+        stats["requests"] += 1
+        stats["errors"] += int(failed)
+        stats["total_latency_ms"] += latency_ms
+        stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
+
+    async def _on_request_end(self, session, context, params):
+        self._record_request(context, failed=params.response.status >= 400)
+
+    async def _on_request_exception(self, session, context, params):
+        self._record_request(context, failed=True)
+
+    async def close(self):
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+            logger.info("HTTP session closed")
+
+    def shutdown(self, timeout=5):
+        """Closes the session from a synchronous context, e.g. at process exit."""
+        if self._session is not None:
+            self.event_loop.submit(self.close()).result(timeout)
+
+    def stats(self):
+        origins = {}
+        for origin, stats in list(self._origins.items()):
+            connections = stats["new_connections"] + stats["reused_connections"]
+            origins[origin] = {
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "new_connections": stats["new_connections"],
+                "reused_connections": stats["reused_connections"],
+                "reuse_rate": stats["reused_connections"] / connections if connections else 0.0,
+                "avg_latency_ms": stats["total_latency_ms"] / stats["requests"] if stats["requests"] else 0.0,
+                "max_latency_ms": stats["max_latency_ms"],
+            }
+        return {"origins": origins}
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+def chain_version(llm_chain):
+    """
+    Hashes the prompt templates and model deployments of a chain, so cached responses of an older
+    prompt or model are not served after a deploy.
+    """
+    parts = []
+    for step in getattr(llm_chain, "steps", None) or [llm_chain]:
+        template = getattr(step, "template", None)
+        if isinstance(template, str):
+            parts.append(template)
+        model = getattr(step, "deployment_name", None) or getattr(step, "model_name", None)
+        if isinstance(model, str):
+            parts.append(model)
+        parts.append(type(step).__name__)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def parse_chain_ttls(spec):
+    """Parses a `chain=seconds,chain=seconds` setting into a dict."""
+    ttls = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, seconds = item.partition("=")
+        ttls[name.strip()] = int(seconds)
+    return ttls
+
+
+class InMemoryLLMCacheBackend:
+    """Keeps cached responses in a dict ordered by last access."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def evict(self, count):
+        for _ in range(min(count, len(self._entries))):
+            self._entries.popitem(last=False)
+
+    def count(self):
+        return len(self._entries)
+
+    def flush(self):
+        pass
+
+
+class SQLiteLLMCacheBackend:
+    """
+    Persists cached responses as JSON in a SQLite database.
+
+    A hit only records its access time in memory. The times are written in the transaction of the
+    next `put`, before an eviction picks the least recently used entries, and on `flush`.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_accessed REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_lru ON llm_cache (last_accessed)")
+        self._connection.commit()
+        self._accessed = {}
+
+    def get(self, key):
+        row = self._connection.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._accessed[key] = time.time()
+        return json.loads(row[0]), row[1]
+
+    def _write_accessed(self):
+        if self._accessed:
+            accessed, self._accessed = self._accessed, {}
+            self._connection.executemany(
+                "UPDATE llm_cache SET last_accessed = ? WHERE key = ?", [(accessed_at, key) for key, accessed_at in accessed.items()]
+            )
+
+    def put(self, key, value, expires_at):
+        self._accessed.pop(key, None)
+        self._write_accessed()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)", (key, json.dumps(value), expires_at, time.time())
+        )
+        self._connection.commit()
+
+    def delete(self, key):
+        self._accessed.pop(key, None)
+        self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        self._connection.commit()
+
+    def evict(self, count):
+        self._write_accessed()
+        self._connection.execute(
+            "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_accessed ASC LIMIT ?)",
+            (count,),
+        )
+        self._connection.commit()
+
+    def count(self):
+        return self._connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def flush(self):
+        """Writes the access times recorded since the last write."""
+        self._write_accessed()
+        self._connection.commit()
+
+
+class LLMCacheService:
+    """
+    Exact-match cache for LLM chain responses.
+
+    Entries are keyed by a hash of the chain name, the chain version (see `chain_version`) and its
+    input. Only chains with a TTL in `chain_ttls` are cached, so a chain is opted in through
+    configuration. Once more than `max_entries` are stored, the least recently used entries are
+    evicted.
+    """
+
+    def __init__(self, backend, chain_ttls, max_entries=10000, clock=time.time):
+        self.backend = backend
+        self.chain_ttls = dict(chain_ttls)
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._counters = {}
+        logger.info(f"LLMCacheService initialized with {type(backend).__name__}, chains: {self.chain_ttls}")
+
+    @staticmethod
+    def make_key(chain_name, input_data, version=""):
+        payload = json.dumps(input_data, sort_keys=True, default=str)
+        return hashlib.sha256(f"{chain_name}\n{version}\n{payload}".encode("utf-8")).hexdigest()
+
+    def is_cached_chain(self, chain_name):
+        return self.chain_ttls.get(chain_name, 0) > 0
+
+    def _count(self, chain_name, outcome):
+        counters = self._counters.setdefault(chain_name, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def get(self, chain_name, input_data, version=""):
+        """Returns the cached response or None."""
+        key = self.make_key(chain_name, input_data, version)
+        with self._lock:
+            entry = self.backend.get(key)
+            if entry is not None and entry[1] <= self.clock():
+                self.backend.delete(key)
+                entry = None
+            self._count(chain_name, "misses" if entry is None else "hits")
+        if entry is None:
+            return None
+        logger.debug(f"LLM cache hit for chain {chain_name}")
+        return entry[0]
+
+    def set(self, chain_name, input_data, response, version=""):
+        ttl = self.chain_ttls.get(chain_name, 0)
+        if ttl <= 0:
+            return
+        try:
+            json.dumps(response)
+        except TypeError:
+            logger.warning(f"Response of chain {chain_name} is not JSON serializable and was not cached")
+            return
+        key = self.make_key(chain_name, input_data, version)
+        with self._lock:
+            self.backend.put(key, response, self.clock() + ttl)
+            overflow = self.backend.count() - self.max_entries
+            if overflow > 0:
+                self.backend.evict(overflow)
+
+    def shutdown(self):
+        """Writes pending access times to the backend."""
+        with self._lock:
+            self.backend.flush()
+
+    def stats(self):
+        with self._lock:
+            chains = {}
+            for chain_name, counters in self._counters.items():
+                lookups = counters["hits"] + counters["misses"]
+                chains[chain_name] = dict(counters, hit_rate=counters["hits"] / lookups if lookups else 0.0)
+            return {"entries": self.backend.count(), "chains": chains}
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+class ThrottledMessageUpdater:
+    """
+    Pushes partially generated answers into an existing Teams activity.
+
+    Edits are throttled to one every `min_interval` seconds and only sent once at least `min_chars`
+    new characters arrived. While an edit is in flight, newer text is coalesced and only the latest
+    version is sent with the next edit. The first edit goes out as soon as `min_chars` are available.
+    """
+
+    def __init__(self, send_update, min_interval=1.0, min_chars=20, clock=time.monotonic):
+        self.send_update = send_update
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self.clock = clock
+        self.updates_sent = 0
+        self._latest_text = ""
+        self._sent_text = ""
+        self._last_sent_at = None
+        self._in_flight = None
+        self._closed = False
+
+    async def push(self, text):
+        """Records the latest partial text and sends it if the throttle allows."""
+        if self._closed:
+            return
+        self._latest_text = text
+        if self._in_flight is not None and not self._in_flight.done():
+            return
+        if len(text) - len(self._sent_text) < self.min_chars:
+            return
+        now = self.clock()
+        if self._last_sent_at is not None and now - self._last_sent_at < self.min_interval:
+            return
+        self._last_sent_at = now
+        self._sent_text = text
+        self._in_flight = asyncio.create_task(self._send(text))
+
+    async def _send(self, text):
+        try:
+            await self.send_update(text)
+            self.updates_sent += 1
+        except Exception as ex:
+            logger.warning(f"Partial answer update failed, streaming disabled for this message: {ex}")
+            self._closed = True
+
+    async def close(self):
+        """Stops streaming and waits for an in-flight edit so it cannot overwrite the final answer."""
+        self._closed = True
+        if self._in_flight is not None and not self._in_flight.done():
+            await asyncio.gather(self._in_flight, return_exceptions=True)
@@ -0,0 +1,134 @@
+import json
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+ROUTES = ("vectorstore", "web_search", "image_processing")
+
+# start of a request; rules anchored to it do not fire on questions that merely mention the verb
+IMPERATIVE_PREFIX = r"^(please |can you |could you |bitte )?"
+
+# Unambiguous requests, checked in order. Translations come first because they always go to
+# web_search, even when they mention images or company topics.
+ROUTING_RULES = (
+    (re.compile(IMPERATIVE_PREFIX + r"(translate|übersetze?n?)\b"), "web_search"),
+    (re.compile(IMPERATIVE_PREFIX + r"(draw|paint|sketch|zeichne)\b"), "image_processing"),
+    (re.compile(
+        r"\b(generate|create|make|design|erstelle|generiere)\b.{0,40}\b(image|picture|photo|illustration|logo|icon|bild|foto)\b"
+    ), "image_processing"),
+    (re.compile(r"\b(remove|change|replace|blur)\b.{0,20}\bbackground\b"), "image_processing"),
+    # creative formats only: proposals or messages usually draw on internal documents
+    (re.compile(
+        IMPERATIVE_PREFIX + r"(write|draft|compose|schreibe?|verfasse)\b.{0,40}"
+        r"\b(e-?mail|mail|blog|post|letter|poem|speech|brief|gedicht)\b"
+    ), "web_search"),
+    (re.compile(IMPERATIVE_PREFIX + r"(correct|proofread|rewrite|korrigiere)\b"), "web_search"),
+)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def hash_features(text: str, dimensions: int = 4096) -> np.ndarray:
+    """
+    L2-normalised bag of hashed word unigrams and bigrams. crc32 keeps the hashes stable across
+    processes, so vectors match the centroids trained offline.
+    """
+    tokens = TOKEN_PATTERN.findall(text.casefold())
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]:
+        vector[zlib.crc32(feature.encode("utf-8")) % dimensions] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def train_centroids(samples, dimensions: int = 4096):
+    """Returns the normalised mean feature vector of every route in `samples` of (query, route)."""
+    sums = {}
+    for query, route in samples:
+        sums.setdefault(route, np.zeros(dimensions, dtype=np.float32))
+        sums[route] += hash_features(query, dimensions)
+    centroids = {}
+    for route, vector in sums.items():
+        norm = np.linalg.norm(vector)
+        centroids[route] = vector / norm if norm else vector
+    return centroids
+
+
+class LocalQueryRouter:
+    """
+    Routes obvious queries on the CPU before falling back to the LLM router.
+
+    Regex rules catch unambiguous requests such as image generation or translation. Other queries
+    are compared with per-route centroids of hashed word features, trained offline from logged LLM
+    routes by tools/train_local_router.py. The classifier only answers when the best route is at
+    least `min_similarity` similar to the query and ahead of the runner-up by `min_margin`;
+    otherwise `route` returns None and the caller asks the LLM.
+    """
+
+    def __init__(self, centroids=None, dimensions=4096, min_similarity=0.3, min_margin=0.1):
+        self.dimensions = dimensions
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        centroids = centroids or {}
+        self.routes = [route for route in ROUTES if route in centroids]
+        self.centroid_matrix = np.stack([centroids[route] for route in self.routes]) if self.routes else None
+        self._lock = threading.Lock()
+        self._counts = {"rules": 0, "classifier": 0, "fallback": 0}
+        self._total_us = 0.0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding="utf-8") as model_file:
+            model = json.load(model_file)
+        centroids = {route: np.asarray(vector, dtype=np.float32) for route, vector in model["centroids"].items()}
+        return cls(centroids, dimensions=model["dimensions"], **kwargs)
+
+    def classify(self, query):
+        """Returns (route, source) where source is "rules" or "classifier", or (None, "fallback")."""
+        text = query.strip().casefold()
+        for pattern, route in ROUTING_RULES:
+            if pattern.search(text):
+                return route, "rules"
+        if self.centroid_matrix is None or len(self.routes) < 2:
+            return None, "fallback"
+        similarities = self.centroid_matrix @ hash_features(text, self.dimensions)
+        best, runner_up = np.argsort(similarities)[::-1][:2]
+        if similarities[best] >= self.min_similarity and similarities[best] - similarities[runner_up] >= self.min_margin:
+            return self.routes[best], "classifier"
+        return None, "fallback"
+
+    def route(self, query):
+        """Returns the route of `query`, or None when the LLM router has to decide."""
+        start = time.perf_counter()
+        route, source = self.classify(query)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        with self._lock:
+            self._counts[source] += 1
+            self._total_us += elapsed_us
+        return route
+
+    def stats(self):
+        with self._lock:
+            requests = sum(self._counts.values())
+            return {
+                "requests": requests,
+                "rules": self._counts["rules"],
+                "classifier": self._counts["classifier"],
+                "fallback": self._counts["fallback"],
+                "local_rate": (requests - self._counts["fallback"]) / requests if requests else 0.0,
+                "avg_latency_us": self._total_us / requests if requests else 0.0,
+            }
+
+
+def save_router_model(path, centroids, dimensions):
+    with open(path, "w", encoding="utf-8") as model_file:
+        json.dump(
+            {
+                "dimensions": dimensions,
+                "centroids": {route: [round(float(value), 6) for value in vector] for route, vector in centroids.items()},
+            },
+            model_file,
+        )
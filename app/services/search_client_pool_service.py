@@ -0,0 +1,68 @@
+import asyncio
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+class SearchClientPool:
+    """
+    Keeps one long-lived AsyncSearchClient per index on the background loop.
+
+    The clients hold their HTTP connections open between requests, so searches reuse established
+    TLS connections. Clients are bound to the background loop, which is why `run` executes the
+    whole search there and only the parsed result travels back to the caller's loop.
+    """
+
+    def __init__(self, endpoint, key, event_loop=io_loop, client_factory=None):
+        self.endpoint = endpoint
+        self.key = key
+        self.event_loop = event_loop
+        self.client_factory = client_factory or self._create_client
+        self._clients = {}
+        self._searches = {}
+
+    def _create_client(self, index_name):
+        return AsyncSearchClient(
+            endpoint=self.endpoint,
+            index_name=index_name,
+            credential=AzureKeyCredential(self.key),
+        )
+
+    def get_client(self, index_name):
+        """Returns the pooled client of an index. Must be called on the background loop."""
+        client = self._clients.get(index_name)
+        if client is None:
+            client = self.client_factory(index_name)
+            self._clients[index_name] = client
+            logger.info(f"Search client for index {index_name} created")
+        return client
+
+    async def run(self, index_name, search):
+        """Runs `search(client)` with the pooled client of the index on the background loop."""
+
+        async def run_search():
+            self._searches[index_name] = self._searches.get(index_name, 0) + 1
+            return await search(self.get_client(index_name))
+
+        return await self.event_loop.run(run_search())
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        results = await asyncio.gather(*(client.close() for client in clients.values()), return_exceptions=True)
+        for index_name, result in zip(clients, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Closing search client for index {index_name} failed: {result}")
+        logger.info(f"Closed {len(clients)} search clients")
+
+    def shutdown(self, timeout=5):
+        """Closes all clients from a synchronous context, e.g. at process exit."""
+        if self._clients:
+            self.event_loop.submit(self.close()).result(timeout)
+
+    def stats(self):
+        return {"clients": len(self._clients), "searches": dict(self._searches)}
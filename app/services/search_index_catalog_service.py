@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.indexes.aio import SearchIndexClient
+
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+def describe_index(index):
+    """
+    Reduces a SearchIndex to the settings retrieval needs.
+
+    The scoring profile and semantic configuration named after the index are preferred, which is the
+    naming convention of our indexes; otherwise the index defaults are used.
+    """
+    scoring_profiles = [profile.name for profile in index.scoring_profiles or []]
+    scoring_profile = f"{index.name}-score"
+    if scoring_profile not in scoring_profiles:
+        scoring_profile = index.default_scoring_profile
+
+    semantic_configurations = []
+    default_semantic_configuration = None
+    if index.semantic_search is not None:
+        semantic_configurations = [configuration.name for configuration in index.semantic_search.configurations or []]
+        default_semantic_configuration = index.semantic_search.default_configuration_name
+    semantic_configuration = index.name
+    if semantic_configuration not in semantic_configurations:
+        semantic_configuration = default_semantic_configuration or next(iter(semantic_configurations), None)
+
+    return {
+        "name": index.name,
+        "scoring_profile": scoring_profile,
+        "semantic_configuration": semantic_configuration,
+        "fields": [field.name for field in index.fields or []],
+    }
+
+
+class SearchIndexCatalog:
+    """
+    Cached catalog of the Azure AI Search indexes and their retrieval settings.
+
+    The first call loads the catalog. Afterwards the cached snapshot is always returned immediately;
+    once it is older than `ttl_seconds` a single refresh is started on the background loop and the
+    stale snapshot keeps being served until it completes. A failed refresh keeps the old snapshot
+    and is retried after `retry_seconds`.
+    """
+
+    def __init__(self, endpoint, key, ttl_seconds=300, retry_seconds=30, event_loop=io_loop,
+                 index_client_factory=None, clock=time.monotonic):
+        self.endpoint = endpoint
+        self.key = key
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.event_loop = event_loop
+        self.index_client_factory = index_client_factory or self._create_index_client
+        self.clock = clock
+        self._indexes = None
+        self._refreshed_at = None
+        self._next_attempt_at = 0.0
+        self._refresh_task = None
+        self.refresh_count = 0
+        self.failed_refresh_count = 0
+
+    def _create_index_client(self):
+        return SearchIndexClient(endpoint=self.endpoint, credential=AzureKeyCredential(self.key))
+
+    async def get_indexes(self):
+        """Returns a dict of index name to index settings."""
+        indexes = self._indexes
+        if indexes is None:
+            await self.event_loop.run(self._refresh_once())
+            if self._indexes is None:
+                raise RuntimeError("Azure AI Search index catalog could not be loaded")
+            return self._indexes
+
+        now = self.clock()
+        if now - self._refreshed_at > self.ttl_seconds and now >= self._next_attempt_at:
+            self.refresh_in_background()
+        return indexes
+
+    def refresh_in_background(self):
+        self.event_loop.submit(self._refresh_once())
+
+    async def _refresh_once(self):
+        # runs on the background loop, so concurrent callers share one refresh
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh())
+        await asyncio.shield(self._refresh_task)
+
+    async def _refresh(self):
+        start = time.perf_counter()
+        try:
+            async with self.index_client_factory() as index_client:
+                indexes = {}
+                async for index in index_client.list_indexes():
+                    indexes[index.name] = describe_index(index)
+        except Exception as ex:
+            self.failed_refresh_count += 1
+            self._next_attempt_at = self.clock() + self.retry_seconds
+            logger.warning(f"Refreshing the search index catalog failed, serving the cached catalog: {ex}")
+            return
+        self._indexes = indexes
+        self._refreshed_at = self.clock()
+        self.refresh_count += 1
+        logger.info(f"Search index catalog refreshed with {len(indexes)} indexes in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def stats(self):
+        return {
+            "indexes": len(self._indexes or {}),
+            "age_seconds": self.clock() - self._refreshed_at if self._refreshed_at is not None else None,
+            "refreshes": self.refresh_count,
+            "failed_refreshes": self.failed_refresh_count,
+        }
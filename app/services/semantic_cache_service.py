@@ -0,0 +1,227 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+class InMemorySemanticCacheBackend:
+    """Persists nothing; the entries only live in the service's in-memory index."""
+
+    def load(self):
+        return []
+
+    def put(self, entry):
+        pass
+
+    def touch(self, accessed):
+        pass
+
+    def delete(self, entry_ids):
+        pass
+
+
+class SQLiteSemanticCacheBackend:
+    """Persists cache entries in a SQLite database, with embeddings stored as float32 blobs."""
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_cache ("
+            "id TEXT PRIMARY KEY, embedding BLOB NOT NULL, answer TEXT NOT NULL, sources TEXT NOT NULL, "
+            "indexes TEXT NOT NULL, created_at REAL NOT NULL, last_accessed REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS semantic_cache_lru ON semantic_cache (last_accessed)")
+        self._connection.commit()
+
+    def load(self):
+        """Returns every stored entry, least recently used first."""
+        rows = self._connection.execute(
+            "SELECT id, embedding, answer, sources, indexes, created_at, last_accessed FROM semantic_cache ORDER BY last_accessed ASC"
+        ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "embedding": np.frombuffer(row[1], dtype=np.float32),
+                "answer": row[2],
+                "sources": json.loads(row[3]),
+                "indexes": json.loads(row[4]),
+                "created_at": row[5],
+                "last_accessed": row[6],
+            }
+            for row in rows
+        ]
+
+    def put(self, entry):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO semantic_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry["id"],
+                np.asarray(entry["embedding"], dtype=np.float32).tobytes(),
+                entry["answer"],
+                json.dumps(entry["sources"]),
+                json.dumps(entry["indexes"]),
+                entry["created_at"],
+                entry["last_accessed"],
+            ),
+        )
+        self._connection.commit()
+
+    def touch(self, accessed):
+        """Records the access times of `accessed` ({entry id: timestamp}) in one transaction."""
+        self._connection.executemany(
+            "UPDATE semantic_cache SET last_accessed = ? WHERE id = ?", [(accessed_at, entry_id) for entry_id, accessed_at in accessed.items()]
+        )
+        self._connection.commit()
+
+    def delete(self, entry_ids):
+        self._connection.executemany("DELETE FROM semantic_cache WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+        self._connection.commit()
+
+
+class SemanticCacheService:
+    """
+    Caches final answers keyed by the embedding of the rephrased query.
+
+    A lookup hits when the cosine similarity to a stored query reaches `similarity_threshold`, the entry
+    is younger than `ttl_seconds` and every index the answer was produced from is still allowed for the
+    caller. Once more than `max_entries` are stored, the least recently used entries are evicted.
+
+    Entries and the matrix of their normalised embeddings are kept in memory, loaded from the backend
+    once at startup, so a lookup is one matrix-vector product without I/O. The backend is written
+    through on `store` and eviction; access times of hits are written with the next `store` or at
+    `shutdown`.
+    """
+
+    def __init__(self, backend, similarity_threshold=0.95, ttl_seconds=86400, max_entries=1000, clock=time.time):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        # least recently used first
+        self._entries = OrderedDict()
+        for entry in backend.load():
+            entry["embedding"] = self._normalize(entry["embedding"])
+            self._entries[entry["id"]] = entry
+        # (ids, matrix) of the entries, rebuilt on the first lookup after they change
+        self._index = None
+        self._accessed = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        logger.info(f"SemanticCacheService initialized with {type(backend).__name__} ({len(self._entries)} entries), threshold: {similarity_threshold}")
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _similarities(self, query):
+        """Returns the ids of the entries with embeddings of the query's size and their similarities."""
+        if self._index is None or self._index[1].shape[1:] != query.shape:
+            entries = [entry for entry in self._entries.values() if entry["embedding"].shape == query.shape]
+            matrix = np.stack([entry["embedding"] for entry in entries]) if entries else np.empty((0,) + query.shape, dtype=np.float32)
+            self._index = ([entry["id"] for entry in entries], matrix)
+        ids, matrix = self._index
+        return ids, matrix @ query
+
+    def _delete(self, entry_ids):
+        for entry_id in entry_ids:
+            self._entries.pop(entry_id, None)
+            self._accessed.pop(entry_id, None)
+        self._index = None
+        self.backend.delete(entry_ids)
+
+    def lookup(self, embedding, allowed_index):
+        query = self._normalize(embedding)
+        allowed = set(allowed_index)
+        now = self.clock()
+        with self._lock:
+            ids, similarities = self._similarities(query)
+            best_entry, best_similarity = None, float(similarities.max()) if len(ids) else -1.0
+            expired = []
+            # the most similar entries first, until one is usable or the rest are below the threshold
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.similarity_threshold:
+                    break
+                entry = self._entries[ids[position]]
+                if now - entry["created_at"] > self.ttl_seconds:
+                    expired.append(entry["id"])
+                elif set(entry["indexes"]) <= allowed:
+                    best_entry, best_similarity = entry, float(similarities[position])
+                    break
+            if expired:
+                self._delete(expired)
+
+            if best_entry is None:
+                self._misses += 1
+                logger.debug(f"Semantic cache miss, best similarity: {best_similarity:.3f}")
+                return None
+
+            self._hits += 1
+            best_entry["last_accessed"] = now
+            self._entries.move_to_end(best_entry["id"])
+            self._accessed[best_entry["id"]] = now
+        logger.info(f"Semantic cache hit with similarity {best_similarity:.3f}")
+        return {
+            "answer": best_entry["answer"],
+            "sources": list(best_entry["sources"]),
+            "similarity": best_similarity,
+        }
+
+    def _flush_accessed(self):
+        if self._accessed:
+            accessed, self._accessed = self._accessed, {}
+            self.backend.touch(accessed)
+
+    def store(self, embedding, answer, sources, indexes):
+        now = self.clock()
+        entry = {
+            "id": str(uuid.uuid4()),
+            "embedding": self._normalize(embedding),
+            "answer": answer,
+            "sources": list(sources),
+            "indexes": list(indexes),
+            "created_at": now,
+            "last_accessed": now,
+        }
+        with self._lock:
+            self._flush_accessed()
+            self.backend.put(entry)
+            self._entries[entry["id"]] = entry
+            self._index = None
+            expired = [entry_id for entry_id, stored in self._entries.items() if now - stored["created_at"] > self.ttl_seconds]
+            if expired:
+                self._delete(expired)
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._delete([entry_id for entry_id, _ in zip(self._entries, range(overflow))])
+                self._evictions += overflow
+        return entry["id"]
+
+    def shutdown(self):
+        """Writes the access times of recent hits to the backend."""
+        with self._lock:
+            self._flush_accessed()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+            }
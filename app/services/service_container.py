@@ -0,0 +1,347 @@
+import os
+import threading
+import time
+
+from app.services.async_cosmos_service import AsyncCosmosService
+from app.services.authentication_service import AuthenticationService
+from app.services.user_validation_service import UserValidationService
+from app.services.team_messaging_service import TeamsMessagingService
+from app.services.http_session_service import PooledHttpSession
+from app.services.azure_blob_service import AzureBlobService
+from app.services.openai_service import OpenAIService
+from app.services.dalle3_service import DallE3Service
+from app.services.token_validation_service import BOT_FRAMEWORK_JWKS_URL, JWKSKeyStore, TokenValidationService, tenant_jwks_url
+from app.services.embedding_batch_service import MicroBatchingEmbeddings
+from app.services.embedding_cache_service import DiskEmbeddingStore, EmbeddingCacheService
+from app.services.llm_cache_service import (
+    InMemoryLLMCacheBackend,
+    LLMCacheService,
+    SQLiteLLMCacheBackend,
+    parse_chain_ttls,
+)
+from app.services.search_client_pool_service import SearchClientPool
+from app.services.search_index_catalog_service import SearchIndexCatalog
+from app.services.query_router_service import LocalQueryRouter
+from app.services.speculative_retrieval_service import SpeculativeRetrievalService
+from app.services.write_behind_service import WriteBehindQueue
+from app.services.semantic_cache_service import (
+    InMemorySemanticCacheBackend,
+    SemanticCacheService,
+    SQLiteSemanticCacheBackend,
+)
+from app.utils.util_url_generator import UtilUrlGenerator
+from app.config.set_logger import set_logger
+from app.config.constants import (
+    COSMOS_HOST,
+    COSMOS_KEY,
+    COSMOS_DATABASE,
+    COSMOS_USER_INTERACTIONS_CONTAINER,
+    COSMOS_IMAGES_INFO_CONTAINER,
+    COSMOS_REPLY_TO_ID_CONTAINER,
+    MICROSOFT_TENANT_ID,
+    MICROSOFT_APP_ID,
+    MICROSOFT_APP_SECRET,
+    BLOB_ACCOUNT_NAME,
+    BLOB_ACCOUNT_KEY,
+    BLOB_CONTAINER_NAME,
+    OPEN_AI_BASE_URL,
+    OPEN_AI_KEY,
+    OPEN_AI_DEPLOYMENT_NAME,
+    OPEN_AI_VERSION,
+    OPEN_AI_DALLE_DEPLOYMENT_NAME,
+    AZURE_OPENAI_GPT4o_MODEL,
+    SEMANTIC_CACHE_BACKEND,
+    SEMANTIC_CACHE_SQLITE_PATH,
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+    SEMANTIC_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    LLM_CACHE_BACKEND,
+    LLM_CACHE_SQLITE_PATH,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_CHAIN_TTLS,
+    OPEN_AI_EMBEDDING_DEPLOYED_MODEL,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_DISK_ENTRIES,
+    EMBEDDING_CACHE_DISK_FLUSH_SECONDS,
+    EMBEDDING_BATCH_ENABLED,
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_DELAY_MS,
+    AZURE_SEARCH_SERVICE_ENDPOINT,
+    AZURE_SEARCH_ADMIN_KEY,
+    SEARCH_INDEX_CATALOG_TTL_SECONDS,
+    SPECULATIVE_RETRIEVAL_MIN_SIMILARITY,
+    LOCAL_ROUTER_MODEL_PATH,
+    LOCAL_ROUTER_MIN_SIMILARITY,
+    LOCAL_ROUTER_MIN_MARGIN,
+    SPECULATIVE_RETRIEVAL_MAX_PENDING,
+    USER_PROFILE_CACHE_TTL_SECONDS,
+    WRITE_BEHIND_FLUSH_INTERVAL_MS,
+    WRITE_BEHIND_MAX_QUEUE_SIZE,
+    CONVERSATION_HISTORY_MAX_TURNS,
+    CONVERSATION_HISTORY_MAX_RESPONSE_CHARS,
+    TOKEN_REFRESH_MARGIN_SECONDS,
+    JWKS_REFRESH_INTERVAL_SECONDS,
+    JWKS_MIN_REFETCH_SECONDS,
+    USER_VALIDATION_CACHE_TTL_SECONDS,
+    USER_VALIDATION_NEGATIVE_TTL_SECONDS,
+    USER_VALIDATION_BATCH_WINDOW_MS,
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT_SECONDS,
+    HTTP_REQUEST_TIMEOUT_SECONDS,
+)
+
+logger = set_logger(name=__name__)
+
+
+class ServiceContainer:
+    """
+    Lazily constructs every shared service on first access and hands the same instance to all modules.
+
+    Each factory receives the container so it can resolve its own dependencies. The time spent in
+    every factory is recorded and exposed through `startup_report`; a service that builds a
+    dependency includes the dependency's construction time in its own entry.
+    """
+
+    def __init__(self, factories):
+        self._factories = dict(factories)
+        self._instances = {}
+        self._startup_timings = {}
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name not in self._factories:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        return self.get(name)
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = self._factories[name](self)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self._instances[name] = instance
+                self._startup_timings[name] = elapsed_ms
+                logger.info(f"Service {name} initialized in {elapsed_ms:.1f} ms")
+        return instance
+
+    def register(self, name, instance):
+        """Replaces a service instance, e.g. with a test double."""
+        with self._lock:
+            self._instances[name] = instance
+
+    def is_initialized(self, name):
+        return name in self._instances
+
+    def initialize(self, names=None):
+        """Eagerly constructs the given services (all by default) and returns the startup report."""
+        for name in names or self._factories:
+            self.get(name)
+        report = self.startup_report()
+        logger.info(f"Service startup breakdown (ms): {report}")
+        return report
+
+    def startup_report(self):
+        return {name: round(elapsed_ms, 1) for name, elapsed_ms in self._startup_timings.items()}
+
+    def shutdown(self):
+        """Calls `shutdown` on every constructed service that has one, in reverse construction order."""
+        with self._lock:
+            instances = list(self._instances.items())
+        for name, instance in reversed(instances):
+            shutdown = getattr(instance, "shutdown", None)
+            if not callable(shutdown):
+                continue
+            try:
+                shutdown()
+                logger.info(f"Service {name} shut down")
+            except Exception as ex:
+                logger.warning(f"Shutting down service {name} failed: {ex}")
+
+
+def _create_cosmos_service(container):
+    return AsyncCosmosService(os.getenv(COSMOS_HOST), os.getenv(COSMOS_KEY), os.getenv(COSMOS_DATABASE), os.getenv(COSMOS_USER_INTERACTIONS_CONTAINER), os.getenv(COSMOS_IMAGES_INFO_CONTAINER), os.getenv(COSMOS_REPLY_TO_ID_CONTAINER), profile_cache_ttl=USER_PROFILE_CACHE_TTL_SECONDS, history_max_turns=CONVERSATION_HISTORY_MAX_TURNS, history_max_response_chars=CONVERSATION_HISTORY_MAX_RESPONSE_CHARS)
+
+
+def _create_interaction_writer(container):
+    return WriteBehindQueue(
+        container.cosmos_service,
+        flush_interval=WRITE_BEHIND_FLUSH_INTERVAL_MS / 1000,
+        max_queue_size=WRITE_BEHIND_MAX_QUEUE_SIZE,
+    )
+
+
+def _create_token_validation_service(container):
+    tenant_id = os.getenv(MICROSOFT_TENANT_ID)
+    key_store_options = {"refresh_interval": JWKS_REFRESH_INTERVAL_SECONDS, "min_refetch_interval": JWKS_MIN_REFETCH_SECONDS}
+    return TokenValidationService(
+        tenant_id,
+        bot_framework_key_store=JWKSKeyStore(BOT_FRAMEWORK_JWKS_URL, **key_store_options),
+        tenant_key_store=JWKSKeyStore(tenant_jwks_url(tenant_id), **key_store_options),
+    )
+
+
+def _create_authentication_service(container):
+    return AuthenticationService(os.getenv(MICROSOFT_TENANT_ID), os.getenv(MICROSOFT_APP_ID), os.getenv(MICROSOFT_APP_SECRET), container.token_validation_service, refresh_margin_seconds=TOKEN_REFRESH_MARGIN_SECONDS)
+
+
+def _create_user_validation_service(container):
+    return UserValidationService(
+        os.getenv(MICROSOFT_TENANT_ID),
+        os.getenv(MICROSOFT_APP_ID),
+        os.getenv(MICROSOFT_APP_SECRET),
+        valid_ttl=USER_VALIDATION_CACHE_TTL_SECONDS,
+        invalid_ttl=USER_VALIDATION_NEGATIVE_TTL_SECONDS,
+        batch_window=USER_VALIDATION_BATCH_WINDOW_MS / 1000,
+        http_session=container.http_session,
+    )
+
+
+def _create_http_session(container):
+    return PooledHttpSession(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT_SECONDS,
+        timeout_seconds=HTTP_REQUEST_TIMEOUT_SECONDS,
+    )
+
+
+def _create_team_messaging_service(container):
+    return TeamsMessagingService(container.http_session)
+
+
+def _create_azure_blob_service(container):
+    return AzureBlobService(os.getenv(BLOB_ACCOUNT_NAME), os.getenv(BLOB_ACCOUNT_KEY), os.getenv(BLOB_CONTAINER_NAME))
+
+
+def _create_openai_service(container):
+    return OpenAIService(UtilUrlGenerator.create_open_ai_url(os.getenv(OPEN_AI_BASE_URL), os.getenv(OPEN_AI_DEPLOYMENT_NAME)), os.getenv(OPEN_AI_KEY), os.getenv(OPEN_AI_DEPLOYMENT_NAME), os.getenv(OPEN_AI_VERSION))
+
+
+def _create_dalle3_service(container):
+    return DallE3Service(UtilUrlGenerator.create_open_ai_url(os.getenv(OPEN_AI_BASE_URL), os.getenv(OPEN_AI_DALLE_DEPLOYMENT_NAME)), os.getenv(OPEN_AI_KEY), os.getenv(OPEN_AI_DALLE_DEPLOYMENT_NAME), os.getenv(OPEN_AI_VERSION))
+
+
+def _create_llm_gpt4o(container):
+    # imported here because sharepoint_service itself resolves its clients through the container
+    from app.services.sharepoint_service import set_gpt_model
+    return set_gpt_model(AZURE_OPENAI_GPT4o_MODEL).create_llm_instance()
+
+
+def _create_llm_gpt4o_mini(container):
+    # no gpt-4o-mini deployment is configured yet, so both chains share the gpt-4o client
+    return container.llm_gpt4o
+
+
+def _create_embeddings(container):
+    from app.services.sharepoint_service import set_embeddings_model
+    return set_embeddings_model()
+
+
+def _create_query_embeddings(container):
+    if not EMBEDDING_BATCH_ENABLED:
+        return container.embeddings
+    return MicroBatchingEmbeddings(
+        container.embeddings,
+        max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+        max_delay=EMBEDDING_BATCH_MAX_DELAY_MS / 1000,
+    )
+
+
+def _create_embedding_cache(container):
+    disk_store = None
+    if EMBEDDING_CACHE_DIR:
+        disk_store = DiskEmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DISK_ENTRIES, flush_interval=EMBEDDING_CACHE_DISK_FLUSH_SECONDS)
+    return EmbeddingCacheService(
+        container.query_embeddings,
+        namespace=OPEN_AI_EMBEDDING_DEPLOYED_MODEL,
+        max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+        disk_store=disk_store,
+    )
+
+
+def _create_search_index_catalog(container):
+    catalog = SearchIndexCatalog(
+        AZURE_SEARCH_SERVICE_ENDPOINT, AZURE_SEARCH_ADMIN_KEY, ttl_seconds=SEARCH_INDEX_CATALOG_TTL_SECONDS
+    )
+    # start loading so the first retrieval finds the catalog ready
+    catalog.refresh_in_background()
+    return catalog
+
+
+def _create_search_client_pool(container):
+    return SearchClientPool(AZURE_SEARCH_SERVICE_ENDPOINT, AZURE_SEARCH_ADMIN_KEY)
+
+
+def _create_speculative_retrieval(container):
+    from app.services.sharepoint_service import semantic_logic_multi_index_retrieval
+
+    async def retrieve(query, data_sources):
+        return await semantic_logic_multi_index_retrieval(query=query, data_sources=data_sources, upload_index=True)
+
+    return SpeculativeRetrievalService(
+        retrieve,
+        min_similarity=SPECULATIVE_RETRIEVAL_MIN_SIMILARITY,
+        max_pending=SPECULATIVE_RETRIEVAL_MAX_PENDING,
+    )
+
+
+def _create_local_router(container):
+    thresholds = {"min_similarity": LOCAL_ROUTER_MIN_SIMILARITY, "min_margin": LOCAL_ROUTER_MIN_MARGIN}
+    if os.path.exists(LOCAL_ROUTER_MODEL_PATH):
+        router = LocalQueryRouter.from_file(LOCAL_ROUTER_MODEL_PATH, **thresholds)
+        logger.info(f"Local router model loaded from {LOCAL_ROUTER_MODEL_PATH} with routes {router.routes}")
+        return router
+    logger.warning(f"Local router model {LOCAL_ROUTER_MODEL_PATH} not found, routing with rules only")
+    return LocalQueryRouter(**thresholds)
+
+
+def _create_semantic_cache(container):
+    if SEMANTIC_CACHE_BACKEND == "sqlite":
+        backend = SQLiteSemanticCacheBackend(SEMANTIC_CACHE_SQLITE_PATH)
+    else:
+        backend = InMemorySemanticCacheBackend()
+    return SemanticCacheService(
+        backend,
+        similarity_threshold=SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    )
+
+
+def _create_llm_cache(container):
+    if LLM_CACHE_BACKEND == "sqlite":
+        backend = SQLiteLLMCacheBackend(LLM_CACHE_SQLITE_PATH)
+    else:
+        backend = InMemoryLLMCacheBackend()
+    return LLMCacheService(backend, parse_chain_ttls(LLM_CACHE_CHAIN_TTLS), max_entries=LLM_CACHE_MAX_ENTRIES)
+
+
+services = ServiceContainer({
+    "http_session": _create_http_session,
+    "cosmos_service": _create_cosmos_service,
+    "interaction_writer": _create_interaction_writer,
+    "token_validation_service": _create_token_validation_service,
+    "authentication_service": _create_authentication_service,
+    "user_validation_service": _create_user_validation_service,
+    "team_messaging_service": _create_team_messaging_service,
+    "azure_blob_service": _create_azure_blob_service,
+    "openai_service": _create_openai_service,
+    "dalle3_service": _create_dalle3_service,
+    "llm_gpt4o": _create_llm_gpt4o,
+    "llm_gpt4o_mini": _create_llm_gpt4o_mini,
+    "embeddings": _create_embeddings,
+    "query_embeddings": _create_query_embeddings,
+    "embedding_cache": _create_embedding_cache,
+    "search_index_catalog": _create_search_index_catalog,
+    "search_client_pool": _create_search_client_pool,
+    "speculative_retrieval": _create_speculative_retrieval,
+    "local_router": _create_local_router,
+    "semantic_cache": _create_semantic_cache,
+    "llm_cache": _create_llm_cache,
+})
@@ -41,6 +41,8 @@ from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from azure.search.documents.indexes import SearchIndexClient
 from app.config.set_logger import set_logger
+from app.services.service_container import services
+from app.services.search_client_pool_service import SearchClientPool
 
 logger = set_logger(name=__name__)
 
@@ -72,6 +74,9 @@ from app.config.constants import (
     UPLOAD_INDEX
 )
 
+# fields read from search results, everything else is left out of the response
+SEARCH_RESULT_FIELDS = [FIELDS_CONTENT, FIELDS_HEADER, FIELDS_METADATA, FIELDS_METADATA_UPLOAD, FIELDS_URL]
+
 
 class GPTModel:
     def __init__(
@@ -160,11 +165,6 @@ def set_embeddings_model() -> AzureOpenAIEmbeddings:
     )
 
 
-embeddings: AzureOpenAIEmbeddings = set_embeddings_model()
-
-llm_gpt4o = set_gpt_model(AZURE_OPENAI_GPT4o_MODEL).create_llm_instance()
-
-
 
 def get_indexes(search_endpoint, search_key):
     index_client = SearchIndexClient(
@@ -204,6 +204,10 @@ class CustomAzureSearch:
         azure_search_key: str,
         content_index_name: str,
         embedding_function: Union[Callable, Embeddings],
+        scoring_profile: Optional[str] = None,
+        semantic_configuration_name: Optional[str] = None,
+        select_fields: Optional[List[str]] = None,
+        search_client_pool: Optional[SearchClientPool] = None,
         **kwargs: Any,
     ):
         """Initialize with necessary components."""
@@ -219,8 +223,10 @@ class CustomAzureSearch:
         self.azure_search_key = azure_search_key
 
         self.content_index_name = content_index_name
-
-        self.content_search_client = self.set_content_search_client()
+        self.scoring_profile = scoring_profile
+        self.semantic_configuration_name = semantic_configuration_name or content_index_name
+        self.select_fields = select_fields
+        self.search_client_pool = search_client_pool
 
     @property
     def embeddings(self) -> Optional[Embeddings]:
@@ -249,18 +255,19 @@ class CustomAzureSearch:
             endpoint=self.azure_search_endpoint,
             key=self.azure_search_key,
             index_name=self.content_index_name,
-            semantic_configuration_name=self.content_index_name,
+            semantic_configuration_name=self.semantic_configuration_name,
             async_=True,
         )
 
     async def content_semantic_hybrid_search_with_score_and_rerank(
-        self, query="*", k: int = 4
+        self, query="*", k: int = 4, vector: Optional[List[float]] = None
     ) -> Tuple[Document, float, float]:
         """Return docs most similar to query with an hybrid query.
 
         Args:
             query: Text to look up documents similar to.
             k: Number of Documents to return. Defaults to 4.
+            vector: Precomputed embedding of the query. Embedded here when not given.
 
         Returns:
             List of Documents most similar to the query and score for each
@@ -268,8 +275,10 @@ class CustomAzureSearch:
         logger.debug(
             "### Incoming details for search: index: %s", self.content_index_name
         )
-        vector = await self._aembed_query(query)
-        async with self.set_content_search_client() as async_client:
+        if vector is None:
+            vector = await self._aembed_query(query)
+
+        async def search(async_client):
             results = await async_client.search(
                 search_text=query,
                 vector_queries=[
@@ -279,12 +288,13 @@ class CustomAzureSearch:
                         fields=FIELDS_CONTENT_VECTOR,
                     )
                 ],
-                scoring_profile=f"{self.content_index_name}-score",
+                scoring_profile=self.scoring_profile,
                 query_type="semantic",
-                semantic_configuration_name=self.content_index_name,
+                semantic_configuration_name=self.semantic_configuration_name,
                 query_caption="extractive",
                 query_answer="extractive",
                 top=k,
+                select=self.select_fields,
             )
             semantic_answers = (await results.get_answers()) or []
             semantic_answers_dict: Dict = {}
@@ -314,6 +324,11 @@ class CustomAzureSearch:
             ]
             return docs
 
+        if self.search_client_pool is None:
+            async with self.set_content_search_client() as async_client:
+                return await search(async_client)
+        return await self.search_client_pool.run(self.content_index_name, search)
+
     def add_texts():
         "Abstract methods filled with nothing"
         return
@@ -325,12 +340,22 @@ class CustomAzureSearch:
     
 
 
-def set_vector_store(index_name: str, location: str = "ch") -> CustomAzureSearch:
+def set_vector_store(index_name: str, location: str = "ch", index_metadata: Optional[dict] = None) -> CustomAzureSearch:
+    # without catalog settings, fall back to the profile and configuration named after the index
+    index_metadata = index_metadata or {
+        "scoring_profile": f"{index_name}-score",
+        "semantic_configuration": index_name,
+    }
     vector_store: CustomAzureSearch = CustomAzureSearch(
         azure_search_endpoint=AZURE_SEARCH_SERVICE_ENDPOINT,
         azure_search_key=AZURE_SEARCH_ADMIN_KEY,
         content_index_name=index_name,
-        embedding_function=embeddings.embed_query
+        embedding_function=services.query_embeddings,
+        scoring_profile=index_metadata.get("scoring_profile"),
+        semantic_configuration_name=index_metadata.get("semantic_configuration"),
+        select_fields=[field for field in SEARCH_RESULT_FIELDS if field in index_metadata["fields"]]
+        if "fields" in index_metadata else None,
+        search_client_pool=services.search_client_pool,
     )
     return vector_store
 
@@ -345,27 +370,30 @@ def set_document_retrievel_count(upload_index: bool) -> int | None:
 async def semantic_logic_multi_index_retrieval(
     query: str,
     data_sources: list,
-    upload_index: bool
+    upload_index: bool,
+    query_vector: Optional[List[float]] = None,
 ):
     """Main retrieval function -- get semantic answers from Azure AI search based on rephrased query"""
     total_retrieved_documents = []
 
-    available_indices = get_indexes(
-        search_endpoint=AZURE_SEARCH_SERVICE_ENDPOINT, search_key=AZURE_SEARCH_ADMIN_KEY
-    )
+    available_indices = await services.search_index_catalog.get_indexes()
 
-    logger.debug(f"Indexes available at Vector Store: {available_indices}")
+    logger.debug(f"Indexes available at Vector Store: {list(available_indices)}")
 
     indices = list(filter(lambda x: x in available_indices, data_sources))
 
     logger.debug(f"Indexes used to fetch data: {indices}")
     documents_count = set_document_retrievel_count(upload_index)
 
+    # the query is embedded once and the vector shared by all index searches
+    if query_vector is None and indices:
+        query_vector = await services.embedding_cache.aembed_query(query)
+
     tasks = [
         set_vector_store(
-            index,
+            index, index_metadata=available_indices[index]
         ).content_semantic_hybrid_search_with_score_and_rerank(
-            query=query, k=int(documents_count)
+            query=query, k=int(documents_count), vector=query_vector
         )
         for index in indices
     ]
@@ -0,0 +1,149 @@
+import asyncio
+import re
+import threading
+import time
+import uuid
+from difflib import SequenceMatcher
+
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Cheap local rewrite of a raw query used for speculation: collapses whitespace."""
+    return re.sub(r"\s+", " ", query or "").strip()
+
+
+def query_similarity(first: str, second: str) -> float:
+    """Case-insensitive character similarity of two queries in [0, 1]."""
+    return SequenceMatcher(None, normalize_query(first).casefold(), normalize_query(second).casefold()).ratio()
+
+
+class SpeculativeRetrievalService:
+    """
+    Starts vector retrieval on the raw query while the LLM is still rephrasing and routing it.
+
+    `start` schedules `retrieve(query, data_sources)` on the background loop and returns an id the
+    workflow keeps in its state. Once the query is routed to the vector store, `claim` hands out the
+    speculative documents if the rephrased query is at least `min_similarity` similar to the
+    speculated one; otherwise, or when the query is routed elsewhere (`discard`), the retrieval is
+    cancelled. Speculations nobody resolves are cancelled after `ttl_seconds`.
+
+    The hit rate and the retrieval latency saved by hits are recorded for the metrics endpoint.
+    """
+
+    def __init__(self, retrieve, min_similarity=0.9, max_pending=100, ttl_seconds=60, event_loop=io_loop,
+                 clock=time.perf_counter):
+        self.retrieve = retrieve
+        self.min_similarity = min_similarity
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.event_loop = event_loop
+        self.clock = clock
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._started = 0
+        self._skipped = 0
+        self._hits = 0
+        self._misses = {}
+        self._saved_ms = 0.0
+
+    def start(self, query, data_sources):
+        """Starts a speculative retrieval and returns its id, or None when too many are pending."""
+        query = normalize_query(query)
+        with self._lock:
+            self._expire()
+            if not query or len(self._pending) >= self.max_pending:
+                self._skipped += 1
+                return None
+            self._started += 1
+        speculation = {"query": query, "started_at": self.clock(), "finished_at": None}
+        speculation["future"] = self.event_loop.submit(self._run(speculation, query, list(data_sources)))
+        speculation_id = str(uuid.uuid4())
+        with self._lock:
+            self._pending[speculation_id] = speculation
+        return speculation_id
+
+    async def _run(self, speculation, query, data_sources):
+        try:
+            return await self.retrieve(query, data_sources)
+        finally:
+            speculation["finished_at"] = self.clock()
+
+    def _expire(self):
+        """Cancels speculations older than the ttl. Must be called with the lock held."""
+        deadline = self.clock() - self.ttl_seconds
+        for speculation_id in [key for key, value in self._pending.items() if value["started_at"] < deadline]:
+            self._pending.pop(speculation_id)["future"].cancel()
+            self._misses["expired"] = self._misses.get("expired", 0) + 1
+
+    def _record_miss(self, reason):
+        with self._lock:
+            self._misses[reason] = self._misses.get(reason, 0) + 1
+
+    def discard(self, speculation_id, reason):
+        """Cancels a speculation whose documents will not be used, e.g. because of the route taken."""
+        with self._lock:
+            speculation = self._pending.pop(speculation_id, None)
+        if speculation is None:
+            return
+        speculation["future"].cancel()
+        self._record_miss(reason)
+
+    async def claim(self, speculation_id, query):
+        """
+        Returns the speculative documents for `query`, or None when the speculation does not match,
+        failed or is unknown. The caller then retrieves the documents itself.
+        """
+        with self._lock:
+            speculation = self._pending.pop(speculation_id, None)
+        if speculation is None:
+            return None
+        similarity = query_similarity(speculation["query"], query)
+        if similarity < self.min_similarity:
+            speculation["future"].cancel()
+            self._record_miss("mismatch")
+            logger.debug(f"Speculative retrieval discarded, query similarity {similarity:.2f}")
+            return None
+
+        claimed_at = self.clock()
+        try:
+            documents = await asyncio.wrap_future(speculation["future"])
+        except asyncio.CancelledError:
+            speculation["future"].cancel()
+            raise
+        except Exception as ex:
+            logger.warning(f"Speculative retrieval failed, retrieving again: {ex}")
+            self._record_miss("failed")
+            return None
+
+        # without speculation the retrieval would have started now and taken its full duration
+        duration = speculation["finished_at"] - speculation["started_at"]
+        saved_seconds = min(duration, claimed_at - speculation["started_at"])
+        with self._lock:
+            self._hits += 1
+            self._saved_ms += saved_seconds * 1000
+        return documents
+
+    def shutdown(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for speculation in pending.values():
+            speculation["future"].cancel()
+
+    def stats(self):
+        with self._lock:
+            misses = sum(self._misses.values())
+            resolved = self._hits + misses
+            return {
+                "started": self._started,
+                "skipped": self._skipped,
+                "pending": len(self._pending),
+                "hits": self._hits,
+                "misses": dict(self._misses),
+                "hit_rate": self._hits / resolved if resolved else 0.0,
+                "saved_ms_total": self._saved_ms,
+                "saved_ms_per_hit": self._saved_ms / self._hits if self._hits else 0.0,
+            }
@@ -2,14 +2,15 @@ import aiohttp
 import os
 
 from app.config.constants import IMAGE_EXPIRY_ICON, IMAGE_EXPIRY_MESSAGE
+from app.services.http_session_service import PooledHttpSession
 from ..utils.util_adaptive_cards import (
     spinning_wheel_adaptive_card_json,
     confirm_delete_adaptive_card_json,
     delete_message_adaptive_card_json,
     data_agreement_card_json,
     prompt_example_json,
-    image_prompt,
-    followup_prompt
+    IMAGE_CARD_TEMPLATE,
+    FOLLOWUP_CARD_TEMPLATE
 )
 
 from app.config.set_logger import set_logger
@@ -17,6 +18,10 @@ from app.config.set_logger import set_logger
 logger = set_logger(name=__name__)
 
 class TeamsMessagingService:
+    def __init__(self, http_session=None):
+        # shared with the other services talking HTTP, so connections to the serviceUrl are reused
+        self.http_session = http_session or PooledHttpSession()
+
     async def send_message(self, service_url, conversation_id, jwt_token, payload):
         endpoint = f"{service_url}/v3/conversations/{conversation_id}/activities"
         headers = {
@@ -24,19 +29,22 @@ class TeamsMessagingService:
             "Content-Type": "application/json",
         }
         logger.debug(f"Sending message to endpoint: {endpoint} with payload: {payload}")
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(endpoint, headers=headers, json=payload) as response:
-                    response_data = await response.json()
-                    logger.debug(f"Response from Teams: {response_data}")
-                    response.raise_for_status()
-                    return response_data.get("id")
-            except aiohttp.ClientResponseError as ex:
-                logger.error(f"Client response error while sending message: {ex}")
-                raise  # Re-raise the exception for the test to catch it
-            except Exception as ex:
-                logger.error(f"Unexpected error while sending message: {ex}")
-                raise  # Raising the exception to indicate failure in sending message
+
+        async def post(session):
+            async with session.post(endpoint, headers=headers, json=payload) as response:
+                response_data = await response.json()
+                logger.debug(f"Response from Teams: {response_data}")
+                response.raise_for_status()
+                return response_data.get("id")
+
+        try:
+            return await self.http_session.run(post)
+        except aiohttp.ClientResponseError as ex:
+            logger.error(f"Client response error while sending message: {ex}")
+            raise  # Re-raise the exception for the test to catch it
+        except Exception as ex:
+            logger.error(f"Unexpected error while sending message: {ex}")
+            raise  # Raising the exception to indicate failure in sending message
 
     async def update_message(self, service_url, conversation_id, activity_id, jwt_token, payload):
         endpoint = f"{service_url}/v3/conversations/{conversation_id}/activities/{activity_id}"
@@ -45,19 +53,22 @@ class TeamsMessagingService:
             "Content-Type": "application/json",
         }
         logger.debug(f"Updating message at endpoint: {endpoint} with payload: {payload}")
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.put(endpoint, headers=headers, json=payload) as response:
-                    response_data = await response.json()
-                    logger.debug(f"Response from Teams: {response_data}")
-                    response.raise_for_status()
-                    return response_data.get("id")
-            except aiohttp.ClientResponseError as ex:
-                logger.error(f"Client response error while updating message: {ex}")
-                raise  # Re-raise the exception for the test to catch it
-            except Exception as ex:
-                logger.error(f"Unexpected error while updating message: {ex}")
-                raise  # Raising the exception to indicate failure in updating message
+
+        async def put(session):
+            async with session.put(endpoint, headers=headers, json=payload) as response:
+                response_data = await response.json()
+                logger.debug(f"Response from Teams: {response_data}")
+                response.raise_for_status()
+                return response_data.get("id")
+
+        try:
+            return await self.http_session.run(put)
+        except aiohttp.ClientResponseError as ex:
+            logger.error(f"Client response error while updating message: {ex}")
+            raise  # Re-raise the exception for the test to catch it
+        except Exception as ex:
+            logger.error(f"Unexpected error while updating message: {ex}")
+            raise  # Raising the exception to indicate failure in updating message
 
     async def send_loading_message(self, service_url, conversation_id, jwt_token):
         logger.info(f"Sending loading message to conversation: {conversation_id}")
@@ -155,17 +166,20 @@ class TeamsMessagingService:
         headers = {
             "Authorization": f"Bearer {jwt_token}",
         }
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.delete(endpoint, headers=headers) as response:
-                    response.raise_for_status()
-                    logger.info(f"Successfully deleted conversation history for message: {message_id}")
-            except aiohttp.ClientResponseError as ex:
-                logger.error(f"Client response error while deleting message: {ex}")
-                raise  # Re-raise the exception for the test to catch it
-            except Exception as ex:
-                logger.error(f"Unexpected error while deleting message: {ex}")
-                raise  # Raising the exception to indicate failure in deleting message
+
+        async def delete(session):
+            async with session.delete(endpoint, headers=headers) as response:
+                response.raise_for_status()
+                logger.info(f"Successfully deleted conversation history for message: {message_id}")
+
+        try:
+            await self.http_session.run(delete)
+        except aiohttp.ClientResponseError as ex:
+            logger.error(f"Client response error while deleting message: {ex}")
+            raise  # Re-raise the exception for the test to catch it
+        except Exception as ex:
+            logger.error(f"Unexpected error while deleting message: {ex}")
+            raise  # Raising the exception to indicate failure in deleting message
 
     async def send_please_select_usecase_message(self, service_url, conversation_id, jwt_token):
         logger.info(f"Sending please select usecase message to conversation: {conversation_id}")
@@ -177,20 +191,20 @@ class TeamsMessagingService:
 
     async def send_image_card_response(self, service_url, conversation_id, activity_id, image_url, text, description, jwt_token):
         logger.info(f"Sending image card response to conversation: {conversation_id}")
-        image_prompt["body"][0]["items"][0]["url"] = image_url
-        image_prompt["body"][0]["items"][1]["value"] = text
-        if os.getenv(IMAGE_EXPIRY_ICON):
-            image_prompt["body"][0]["items"][2]["columns"][0]["items"][0]["url"] = os.getenv(IMAGE_EXPIRY_ICON)
-        if os.getenv(IMAGE_EXPIRY_MESSAGE):
-            image_prompt["body"][0]["items"][2]["columns"][1]["items"][0]["text"] = os.getenv(IMAGE_EXPIRY_MESSAGE)
-        image_prompt["actions"][0]["url"] = image_url
+        image_card = IMAGE_CARD_TEMPLATE.render(
+            image_url=image_url,
+            prompt=text,
+            expiry_icon=os.getenv(IMAGE_EXPIRY_ICON) or None,
+            expiry_message=os.getenv(IMAGE_EXPIRY_MESSAGE) or None,
+            download_url=image_url,
+        )
 
         payload = {
             "type": "message",
             "attachments": [
                 {
                     "contentType": "application/vnd.microsoft.card.adaptive",
-                    "content": image_prompt,
+                    "content": image_card,
                 }
             ],
         }
@@ -200,8 +214,8 @@ class TeamsMessagingService:
         logger.info(f"Sending follow up card response to conversation: {conversation_id}")
         logger.debug(f"The followup questions list looks like below: {followup_questions_list}")
         
-        for idx, question in enumerate(followup_questions_list):
-            followup_prompt["actions"].append({
+        actions = [
+            {
                 "type": "Action.Submit",
                 "title": question,
                 "data": {
@@ -209,14 +223,17 @@ class TeamsMessagingService:
                 },
                 "style": "positive",
                 "wrap": True
-            })
+            }
+            for question in followup_questions_list
+        ]
+        followup_card = FOLLOWUP_CARD_TEMPLATE.render(actions=actions)
 
         payload = {
             "type": "message",
             "attachments": [
                 {
                     "contentType": "application/vnd.microsoft.card.adaptive",
-                    "content": followup_prompt,
+                    "content": followup_card,
                 }
             ],
         }
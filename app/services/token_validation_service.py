@@ -1,38 +1,190 @@
+import asyncio
+import threading
+import time
+import jwt
 import requests
 from jwt.algorithms import RSAAlgorithm
 
+from app.utils.util_background_loop import io_loop
 from app.config.set_logger import set_logger
 
 logger = set_logger(name=__name__)
 
-class TokenValidationService:
-    def __init__(self, tenant_id):
-        self.tenant_id = tenant_id
+BOT_FRAMEWORK_JWKS_URL = "https://login.botframework.com/v1/.well-known/keys"
+BOT_FRAMEWORK_ISSUER = "https://api.botframework.com"
+
+
+def tenant_jwks_url(tenant_id):
+    return f"https://login.microsoftonline.com/{tenant_id}/discovery/v2.0/keys"
+
+
+class JWKSKeyStore:
+    """
+    Parsed public keys of a JWKS endpoint, indexed by `kid`.
+
+    Keys are parsed once per fetch, so a lookup is a dict access. `prefetch` loads them on a worker
+    thread at startup. Once the keys are older than `refresh_interval` they are refreshed in the
+    background while the cached keys keep being served. An unknown `kid` (e.g. after a key rotation)
+    triggers a refetch, at most once every `min_refetch_interval` seconds so tokens with made-up kids
+    cannot hammer the endpoint. `get_key_async` runs that refetch on a worker thread, so callers on an
+    event loop are not blocked; `get_key` runs it inline.
+
+    The channels a key is endorsed for (the Bot Framework `endorsements` of a JWK) are kept with it.
+    """
 
-    def fetch_azure_jkws(self):
-        oidc_config_url = f"https://login.microsoftonline.com/{self.tenant_id}/discovery/v2.0/keys"
-        logger.info(f"Fetching Azure JWKs from {oidc_config_url}")
+    def __init__(self, jwks_url, refresh_interval=86400, min_refetch_interval=300, event_loop=io_loop, clock=time.monotonic):
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.event_loop = event_loop
+        self.clock = clock
+        self._keys = {}
+        self._endorsements = {}
+        self._fetched_at = None
+        self._last_attempt_at = None
+        self._lock = threading.Lock()
+        self._background_refresh = None
+        self.fetch_count = 0
+        self.failed_fetch_count = 0
+        self.unknown_kid_count = 0
+
+    def fetch_jwks(self):
+        logger.info(f"Fetching JWKs from {self.jwks_url}")
+        response = requests.get(self.jwks_url, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def refresh(self):
+        """Fetches and parses the keys; keeps the cached keys if the fetch fails."""
+        self._last_attempt_at = self.clock()
         try:
-            response = requests.get(oidc_config_url)
-            response.raise_for_status()
-            logger.info("Successfully fetched Azure JWKs")
-            return response.json()
-        except requests.exceptions.RequestException as req_error:
-            logger.error(f"Request error while fetching JWT public keys: {req_error}")
-            raise
+            jwks = self.fetch_jwks()
         except Exception as error:
-            logger.error(f"Error in fetching JWT public keys: {error}")
-            raise
+            self.failed_fetch_count += 1
+            logger.error(f"Error in fetching JWT public keys from {self.jwks_url}: {error}")
+            return
+        keys = {}
+        endorsements = {}
+        for jwk in jwks.get("keys", []):
+            try:
+                keys[jwk["kid"]] = RSAAlgorithm.from_jwk(jwk)
+            except Exception as error:
+                logger.warning(f"Skipping unusable JWK {jwk.get('kid')}: {error}")
+                continue
+            endorsements[jwk["kid"]] = frozenset(jwk.get("endorsements", ()))
+        # endorsements first, so a key is never visible without them
+        self._endorsements = endorsements
+        self._keys = keys
+        self._fetched_at = self.clock()
+        self.fetch_count += 1
+        logger.info(f"Loaded {len(keys)} public keys from {self.jwks_url}")
 
-    def get_public_key(self, jwks, kid):
-        logger.info(f"Retrieving public key for kid: {kid}")
-        try:
-            for jwk in jwks['keys']:
-                if jwk['kid'] == kid:
-                    logger.info(f"Public key found for kid: {kid}")
-                    return RSAAlgorithm.from_jwk(jwk)
+    def _refresh_if_allowed(self, kid):
+        with self._lock:
+            if kid in self._keys:
+                return  # fetched by a concurrent caller while waiting for the lock
+            if self._last_attempt_at is not None and self.clock() - self._last_attempt_at < self.min_refetch_interval:
+                return
+            self.refresh()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._background_refresh is not None and not self._background_refresh.done():
+                return
+            self._background_refresh = self.event_loop.submit(asyncio.to_thread(self._refresh_stale_keys))
+
+    def _refresh_stale_keys(self):
+        with self._lock:
+            if self._fetched_at is None or self.clock() - self._fetched_at > self.refresh_interval:
+                self.refresh()
+
+    def prefetch(self):
+        """Starts fetching the keys in the background, so the first token finds them cached."""
+        self._refresh_in_background()
+
+    def _cached_key(self, kid):
+        key = self._keys.get(kid)
+        if key is None:
+            self.unknown_kid_count += 1
+        elif self.clock() - self._fetched_at > self.refresh_interval:
+            self._refresh_in_background()
+        return key
+
+    def _refetched_key(self, kid):
+        key = self._keys.get(kid)
+        if key is None:
             logger.warning(f"No public key found for kid: {kid}")
-            return None
-        except Exception as error:
-            logger.error(f"Error retrieving public key: {error}")
-            raise
+        return key
+
+    def get_key(self, kid):
+        """Returns the public key of `kid`, or None if the endpoint does not publish it."""
+        key = self._cached_key(kid)
+        if key is None:
+            self._refresh_if_allowed(kid)
+            key = self._refetched_key(kid)
+        return key
+
+    async def get_key_async(self, kid):
+        """Like `get_key`, but refetches an unknown `kid` on a worker thread."""
+        key = self._cached_key(kid)
+        if key is None:
+            await asyncio.to_thread(self._refresh_if_allowed, kid)
+            key = self._refetched_key(kid)
+        return key
+
+    def get_endorsements(self, kid):
+        """Returns the channel ids the key of `kid` is endorsed for."""
+        return self._endorsements.get(kid, frozenset())
+
+    def stats(self):
+        return {
+            "keys": len(self._keys),
+            "age_seconds": self.clock() - self._fetched_at if self._fetched_at is not None else None,
+            "fetches": self.fetch_count,
+            "failed_fetches": self.failed_fetch_count,
+            "unknown_kids": self.unknown_kid_count,
+        }
+
+
+class TokenValidationService:
+    """
+    Validates tokens against the signing keys of our tenant and of the Bot Framework, each held by a
+    `JWKSKeyStore`.
+    """
+
+    def __init__(self, tenant_id, bot_framework_key_store=None, tenant_key_store=None):
+        self.tenant_id = tenant_id
+        self.bot_framework_key_store = bot_framework_key_store or JWKSKeyStore(BOT_FRAMEWORK_JWKS_URL)
+        self.tenant_key_store = tenant_key_store or JWKSKeyStore(tenant_jwks_url(tenant_id))
+
+    def prefetch_keys(self):
+        self.tenant_key_store.prefetch()
+        self.bot_framework_key_store.prefetch()
+
+    def get_public_key(self, kid):
+        """Returns the tenant public key of `kid`, or None if the tenant does not publish it."""
+        logger.info(f"Retrieving public key for kid: {kid}")
+        return self.tenant_key_store.get_key(kid)
+
+    async def validate_bot_framework_token(self, authorization, app_id, service_url=None, channel_id=None):
+        """
+        Validates the bearer token the Bot Framework sends with an activity and returns its claims.
+
+        Raises jwt.InvalidTokenError if the header is missing, the signature, issuer, audience or
+        expiry do not check out, the token was issued for a different serviceUrl, or its signing key
+        is not endorsed for the activity's channelId.
+        """
+        if not authorization or not authorization.startswith("Bearer "):
+            raise jwt.InvalidTokenError("Missing bearer token")
+        token = authorization[len("Bearer "):]
+        kid = jwt.get_unverified_header(token).get("kid")
+        public_key = await self.bot_framework_key_store.get_key_async(kid)
+        if public_key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key: {kid}")
+        # the Bot Framework allows up to 5 minutes of clock skew
+        claims = jwt.decode(token, public_key, algorithms=["RS256"], audience=app_id, issuer=BOT_FRAMEWORK_ISSUER, leeway=300)
+        if service_url is not None and claims.get("serviceurl", claims.get("serviceUrl")) != service_url:
+            raise jwt.InvalidTokenError("Token was issued for a different serviceUrl")
+        if channel_id is not None and channel_id not in self.bot_framework_key_store.get_endorsements(kid):
+            raise jwt.InvalidTokenError(f"Signing key is not endorsed for channel {channel_id}")
+        return claims
@@ -1,13 +1,35 @@
+import asyncio
+import threading
 from flask import jsonify
 import msal
 import requests
+from cachetools import TTLCache
 
+from app.services.http_session_service import PooledHttpSession
+from app.utils.util_background_loop import io_loop
 from app.config.set_logger import set_logger
 
 logger = set_logger(name=__name__)
 
+# Microsoft Graph accepts at most 20 requests in one JSON batch
+GRAPH_BATCH_MAX_REQUESTS = 20
+
 class UserValidationService:
-    def __init__(self, tenant_id, client_id, client_secret):
+    """
+    Validates that the sender of a message is a user of our tenant.
+
+    `validate_user_async` answers from a cache of validated users (`valid_ttl` seconds) and of
+    users Graph does not know (`invalid_ttl` seconds, kept short so newly created users get in
+    quickly), so returning users are validated without network I/O. Concurrent lookups of the
+    same user share one Graph call, which runs on the pooled HTTP session on the background loop.
+    Errors other than 404 are not cached.
+
+    With a `batch_window` (seconds), lookups of different users started within the window are
+    resolved with one Graph `$batch` request of up to 20 users, which keeps bursts of first-time
+    users (broadcasts, meetings) from turning into one Graph call each.
+    """
+
+    def __init__(self, tenant_id, client_id, client_secret, valid_ttl=3600, invalid_ttl=60, cache_size=10000, batch_window=0, http_session=None, event_loop=io_loop):
         self.tenant_id = tenant_id
         self.client_id = client_id
         self.client_secret = client_secret
@@ -15,6 +37,19 @@ class UserValidationService:
         self.authority = f'https://login.microsoftonline.com/{self.tenant_id}'
         self.scope = ['https://graph.microsoft.com/.default']
         self.graph_api_endpoint = 'https://graph.microsoft.com/v1.0'
+        self.event_loop = event_loop
+        self._msal_app = None
+        self._msal_lock = threading.Lock()
+        # both caches and the in-flight lookups are only touched on the background loop
+        self.valid_users = TTLCache(maxsize=cache_size, ttl=valid_ttl)
+        self.invalid_users = TTLCache(maxsize=cache_size, ttl=invalid_ttl)
+        self._lookups = {}
+        self.batch_window = batch_window
+        self._batch = []
+        self._batch_timer = None
+        self._owns_http_session = http_session is None
+        self.http_session = http_session or PooledHttpSession(event_loop=event_loop)
+        self._counters = {"hits": 0, "misses": 0, "shared_lookups": 0, "graph_calls": 0, "graph_batches": 0, "errors": 0}
         logger.info(f"UserValidationService initialized with tenant_id: {tenant_id}")
 
     def validate_tenant_id(self, tenant_id):
@@ -39,13 +74,19 @@ class UserValidationService:
             logger.warning(f"User {user_aad_id} does not exist.")
         return user_exists
 
+    @property
+    def msal_app(self):
+        # one application per process, so MSAL's token cache serves the Graph token until it expires
+        with self._msal_lock:
+            if self._msal_app is None:
+                self._msal_app = msal.ConfidentialClientApplication(
+                    self.client_id, authority=self.authority,
+                    client_credential=self.client_secret)
+            return self._msal_app
+
     def get_access_token(self):
         logger.info("Acquiring access token from Azure AD")
-        app = msal.ConfidentialClientApplication(
-            self.client_id, authority=self.authority,
-            client_credential=self.client_secret)
-
-        result = app.acquire_token_for_client(scopes=self.scope)
+        result = self.msal_app.acquire_token_for_client(scopes=self.scope)
         if "access_token" in result:
             logger.info("Access token acquired successfully")
             return result['access_token']
@@ -71,3 +112,124 @@ class UserValidationService:
         else:
             logger.error(f"Error querying Graph API: {response.status_code}, {response.text}")
             return False
+
+    async def validate_user_async(self, user_aad_id):
+        return await self.event_loop.run(self._validate_user(user_aad_id))
+
+    async def _validate_user(self, user_aad_id):
+        if user_aad_id in self.valid_users:
+            self._counters["hits"] += 1
+            return True
+        if user_aad_id in self.invalid_users:
+            self._counters["hits"] += 1
+            logger.warning(f"User {user_aad_id} does not exist (cached).")
+            return False
+
+        lookup = self._lookups.get(user_aad_id)
+        if lookup is None:
+            self._counters["misses"] += 1
+            lookup = asyncio.get_running_loop().create_task(self._look_up_user(user_aad_id))
+            self._lookups[user_aad_id] = lookup
+            lookup.add_done_callback(lambda _: self._lookups.pop(user_aad_id, None))
+        else:
+            self._counters["shared_lookups"] += 1
+        return await asyncio.shield(lookup)
+
+    async def _look_up_user(self, user_aad_id):
+        logger.info(f"Validating user with AAD ID: {user_aad_id}")
+        try:
+            if self.batch_window > 0:
+                status = await self._fetch_status_in_batch(user_aad_id)
+            else:
+                status = await self._fetch_status([user_aad_id])
+                status = status[user_aad_id]
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Error validating user {user_aad_id}: {str(e)}")
+            return False
+        return self.record_user_status(user_aad_id, status)
+
+    def record_user_status(self, user_aad_id, status):
+        """Caches the Graph status code of a user lookup and returns whether the user exists."""
+        if status == 200:
+            logger.info(f"User {user_aad_id} found in Microsoft Graph")
+            self.valid_users[user_aad_id] = True
+            return True
+        if status == 404:
+            logger.warning(f"User {user_aad_id} not found in Microsoft Graph")
+            self.invalid_users[user_aad_id] = True
+            return False
+        self._counters["errors"] += 1
+        logger.error(f"Error querying Graph API for user {user_aad_id}: {status}")
+        return False
+
+    async def _fetch_status_in_batch(self, user_aad_id):
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((user_aad_id, future))
+        if len(self._batch) >= GRAPH_BATCH_MAX_REQUESTS:
+            self._flush_batch()
+        elif self._batch_timer is None:
+            self._batch_timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush_batch)
+        return await future
+
+    def _flush_batch(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._resolve_batch(batch))
+
+    async def _resolve_batch(self, batch):
+        try:
+            statuses = await self._fetch_status([user_aad_id for user_aad_id, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for user_aad_id, future in batch:
+            if not future.done():
+                future.set_result(statuses.get(user_aad_id))
+
+    async def _fetch_status(self, aad_ids):
+        """Returns the Graph status code per user, with a plain GET for one user and `$batch` otherwise."""
+        token = await asyncio.to_thread(self.get_access_token)
+        if not token:
+            raise ValueError("Could not get access token")
+        if len(aad_ids) == 1:
+            return {aad_ids[0]: await self.fetch_user_status(aad_ids[0], token)}
+        return await self.fetch_user_statuses(aad_ids, token)
+
+    async def fetch_user_status(self, aad_id, token):
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        }
+        self._counters["graph_calls"] += 1
+        async with self.http_session.get_session().get(f"{self.graph_api_endpoint}/users/{aad_id}?$select=id", headers=headers) as response:
+            return response.status
+
+    async def fetch_user_statuses(self, aad_ids, token):
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        }
+        payload = {"requests": [
+            {"id": str(index), "method": "GET", "url": f"/users/{aad_id}?$select=id"}
+            for index, aad_id in enumerate(aad_ids)
+        ]}
+        self._counters["graph_batches"] += 1
+        async with self.http_session.get_session().post(f"{self.graph_api_endpoint}/$batch", headers=headers, json=payload) as response:
+            response.raise_for_status()
+            result = await response.json()
+        logger.info(f"Validated {len(aad_ids)} users with one Graph batch request")
+        return {aad_ids[int(item["id"])]: item.get("status") for item in result.get("responses", [])}
+
+    def shutdown(self, timeout=5):
+        """Closes the HTTP session if this service created it; a shared one is closed by its owner."""
+        if self._owns_http_session:
+            self.http_session.shutdown(timeout)
+
+    def stats(self):
+        return dict(self._counters, valid_users=len(self.valid_users), invalid_users=len(self.invalid_users))
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import uuid
+
+from app.utils.util_background_loop import io_loop
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+# Cosmos DB accepts at most 100 operations in one transactional batch
+MAX_TRANSACTIONAL_BATCH_SIZE = 100
+
+
+def interaction_document_id(teams_message_id, kind):
+    """Derives a stable document id from the Teams message id, so a repeated write overwrites itself."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{kind}:{teams_message_id}"))
+
+
+class WriteBehindQueue:
+    """
+    Persists interaction records after the answer has been sent.
+
+    `enqueue` returns immediately; records are flushed every `flush_interval` seconds on the
+    background loop, grouped per container and partition (user id) into transactional batches of
+    upserts. Records are keyed by their id, so a record enqueued twice is written once and a
+    retried batch cannot create duplicates. Failed batches are retried up to `max_attempts` times.
+
+    Each partition has at most one write in flight. Records enqueued for it meanwhile stay queued
+    until that write (including its retries) is over, so a retried batch can never overwrite a
+    newer version of a document such as the rolling conversation history.
+    """
+
+    def __init__(self, cosmos_service, flush_interval=0.2, max_queue_size=10000, max_attempts=3,
+                 retry_backoff=0.5, event_loop=io_loop):
+        self.cosmos_service = cosmos_service
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.event_loop = event_loop
+        self._pending = {}
+        self._flush_scheduled = False
+        self._flush_tasks = set()
+        # (container, partition) -> task writing it; only touched on the background loop
+        self._writing = {}
+        self._lock = threading.Lock()
+        self._counters = {"enqueued": 0, "written": 0, "batches": 0, "failed": 0, "dropped": 0}
+
+    def enqueue(self, container_name, item):
+        """Queues an upsert of `item` into the given container. Returns False when the queue is full."""
+        key = (container_name, item["user_id"], item["id"])
+        with self._lock:
+            if key not in self._pending and len(self._pending) >= self.max_queue_size:
+                self._counters["dropped"] += 1
+                logger.error(f"Write-behind queue is full, dropping record {item['id']} for user_id {item['user_id']}")
+                return False
+            self._pending[key] = item
+            self._counters["enqueued"] += 1
+            schedule = not self._flush_scheduled
+            self._flush_scheduled = True
+        if schedule:
+            loop = self.event_loop.loop
+            loop.call_soon_threadsafe(loop.call_later, self.flush_interval, self._start_flush)
+        return True
+
+    def _start_flush(self):
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self):
+        """Writes every queued record of the partitions that have no write in flight."""
+        with self._lock:
+            pending = {key: item for key, item in self._pending.items() if key[:2] not in self._writing}
+            for key in pending:
+                del self._pending[key]
+            self._flush_scheduled = False
+        if not pending:
+            return
+
+        partitions = {}
+        for (container_name, partition_key, _), item in pending.items():
+            partitions.setdefault((container_name, partition_key), []).append(item)
+
+        tasks = []
+        for partition, items in partitions.items():
+            task = asyncio.get_running_loop().create_task(self._write_partition(*partition, items))
+            self._writing[partition] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+
+    async def _write_partition(self, container_name, partition_key, items):
+        try:
+            for start in range(0, len(items), MAX_TRANSACTIONAL_BATCH_SIZE):
+                await self._write_batch(container_name, partition_key, items[start:start + MAX_TRANSACTIONAL_BATCH_SIZE])
+        finally:
+            del self._writing[(container_name, partition_key)]
+            with self._lock:
+                # records held back while this partition was being written
+                schedule = not self._flush_scheduled and any(key[:2] == (container_name, partition_key) for key in self._pending)
+                self._flush_scheduled = self._flush_scheduled or schedule
+            if schedule:
+                asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    async def _write_batch(self, container_name, partition_key, items):
+        for attempt in range(self.max_attempts):
+            try:
+                await self.cosmos_service.upsert_items_batch(container_name, partition_key, items)
+                with self._lock:
+                    self._counters["written"] += len(items)
+                    self._counters["batches"] += 1
+                return
+            except Exception as e:
+                logger.warning(f"Write-behind batch of {len(items)} records for user_id {partition_key} failed on attempt {attempt + 1}: {str(e)}")
+                if attempt < self.max_attempts - 1:
+                    await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+        with self._lock:
+            self._counters["failed"] += len(items)
+        logger.error(f"Giving up on write-behind records {[item['id'] for item in items]} for user_id {partition_key}")
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    async def drain(self):
+        """Flushes the queue and waits for flushes already in progress."""
+        while True:
+            await self.flush()
+            in_progress = list(self._flush_tasks) + list(self._writing.values())
+            if not in_progress:
+                if self.queue_depth() == 0:
+                    return
+                continue
+            await asyncio.gather(*in_progress, return_exceptions=True)
+
+    def shutdown(self, timeout=10):
+        """Writes the remaining records from a synchronous context, e.g. at process exit."""
+        logger.info(f"Flushing {self.queue_depth()} write-behind records before shutdown")
+        self.event_loop.submit(self.drain()).result(timeout)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=len(self._pending))
@@ -1,5 +1,7 @@
 import json 
 
+from app.utils.util_card_templates import CardTemplate
+
 
 with open("app/resources/adaptive_cards/spinning_wheel.json", "r") as file:
     spinning_wheel_adaptive_card_json = json.load(file)
@@ -20,4 +22,16 @@ with open("app/resources/adaptive_cards/image_prompt.json", "r") as file:
     image_prompt = json.load(file)
 
 with open("app/resources/adaptive_cards/followup_prompt.json", "r") as file:
-    followup_prompt = json.load(file)
\ No newline at end of file
+    followup_prompt = json.load(file)
+
+IMAGE_CARD_TEMPLATE = CardTemplate(image_prompt, slots={
+    "image_url": ("body", 0, "items", 0, "url"),
+    "prompt": ("body", 0, "items", 1, "value"),
+    "expiry_icon": ("body", 0, "items", 2, "columns", 0, "items", 0, "url"),
+    "expiry_message": ("body", 0, "items", 2, "columns", 1, "items", 0, "text"),
+    "download_url": ("actions", 0, "url"),
+})
+
+FOLLOWUP_CARD_TEMPLATE = CardTemplate(followup_prompt, slots={
+    "actions": ("actions",),
+})
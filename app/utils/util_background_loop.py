@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+from app.config.set_logger import set_logger
+
+logger = set_logger(name=__name__)
+
+
+class BackgroundEventLoop:
+    """
+    Runs an asyncio event loop on a daemon thread.
+
+    Flask executes every async view on a short-lived event loop of its own, so work that must
+    outlive the request (queued interactions, long-lived async clients) is scheduled here instead.
+    """
+
+    def __init__(self, name="background-loop"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        self.start()
+        return self._loop
+
+    def start(self):
+        with self._lock:
+            if self._loop is not None and self._thread.is_alive():
+                return
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+            thread = threading.Thread(target=self._run_forever, args=(loop, started), name=self.name, daemon=True)
+            thread.start()
+            started.wait()
+            self._loop = loop
+            self._thread = thread
+            logger.info(f"Background event loop '{self.name}' started")
+
+    def _run_forever(self, loop, started):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        try:
+            loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+
+    def is_current(self):
+        try:
+            return self._loop is not None and asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coroutine):
+        """Schedules a coroutine on the background loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def run(self, coroutine):
+        """Awaits a coroutine on the background loop from any other event loop."""
+        if self.is_current():
+            return await coroutine
+        return await asyncio.wrap_future(self.submit(coroutine))
+
+    def stop(self, timeout=5):
+        with self._lock:
+            if self._loop is None:
+                return
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        logger.info(f"Background event loop '{self.name}' stopped")
+
+
+# Process-wide loop shared by queued interactions and long-lived async clients
+io_loop = BackgroundEventLoop("io-loop")
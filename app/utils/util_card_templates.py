@@ -0,0 +1,54 @@
+import copy
+
+
+class CardTemplate:
+    """
+    Immutable adaptive card template with named slots.
+
+    The card is deep-copied once when the template is built and never modified afterwards. `render`
+    returns a new card in which only the containers on the path of a filled slot are copied; all
+    other parts are shared with the template, so rendering cost and payload size do not depend on
+    how often the template was rendered before. Rendered cards must be treated as read-only.
+    """
+
+    def __init__(self, card, slots):
+        self._card = copy.deepcopy(card)
+        self._slots = {name: tuple(path) for name, path in slots.items()}
+        for name, path in self._slots.items():
+            self._check_path(name, path)
+
+    def _check_path(self, name, path):
+        node = self._card
+        try:
+            for key in path:
+                node = node[key]
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"Slot {name} points to a missing card element: {path}")
+
+    @property
+    def slots(self):
+        return tuple(self._slots)
+
+    def render(self, **values):
+        """Returns the card with the given slots filled; slots left out or set to None keep the template value."""
+        unknown = set(values) - set(self._slots)
+        if unknown:
+            raise KeyError(f"Unknown card slots: {sorted(unknown)}")
+
+        card = copy.copy(self._card)
+        copied = {(): card}
+        for name, value in values.items():
+            if value is None:
+                continue
+            path = self._slots[name]
+            node = card
+            for depth in range(len(path) - 1):
+                prefix = path[:depth + 1]
+                child = copied.get(prefix)
+                if child is None:
+                    child = copy.copy(node[path[depth]])
+                    node[path[depth]] = child
+                    copied[prefix] = child
+                node = child
+            node[path[-1]] = value
+        return card
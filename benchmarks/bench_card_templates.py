@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of adaptive card rendering.
+
+Compares the former approach of mutating the module-level card dicts with rendering from the
+immutable templates, over many consecutive follow-up and image cards. Run from the repository
+root (the card JSON files are loaded relative to it):
+
+    python -m benchmarks.bench_card_templates --calls 5000
+"""
+import argparse
+import copy
+import json
+import time
+
+from app.utils.util_adaptive_cards import (
+    FOLLOWUP_CARD_TEMPLATE,
+    IMAGE_CARD_TEMPLATE,
+    followup_prompt,
+    image_prompt,
+)
+
+QUESTIONS = ["What is the travel policy?", "Who approves expenses?", "Where are the templates stored?"]
+IMAGE_URL = "https://example.blob.core.windows.net/images/image.png?sig=signature"
+
+
+def followup_actions(questions):
+    return [
+        {"type": "Action.Submit", "title": question, "data": {"follow_up_question": question}, "style": "positive", "wrap": True}
+        for question in questions
+    ]
+
+
+def legacy_followup_card(card, questions):
+    card["actions"].extend(followup_actions(questions))
+    return card
+
+
+def legacy_image_card(card, image_url, text):
+    card["body"][0]["items"][0]["url"] = image_url
+    card["body"][0]["items"][1]["value"] = text
+    card["actions"][0]["url"] = image_url
+    return card
+
+
+def measure(name, render, calls):
+    sizes = []
+    start = time.perf_counter()
+    for index in range(calls):
+        card = render(index)
+        if index in (0, calls // 2, calls - 1):
+            sizes.append(len(json.dumps(card)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {elapsed / calls * 1e6:>10.2f} us/call   payload bytes (first/middle/last): {sizes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    legacy_followup = copy.deepcopy(followup_prompt)
+    legacy_image = copy.deepcopy(image_prompt)
+
+    measure("legacy followup", lambda index: legacy_followup_card(legacy_followup, QUESTIONS), args.calls)
+    measure("template followup", lambda index: FOLLOWUP_CARD_TEMPLATE.render(actions=followup_actions(QUESTIONS)), args.calls)
+    measure("legacy image", lambda index: legacy_image_card(legacy_image, IMAGE_URL, f"prompt {index % 10}"), args.calls)
+    measure("template image", lambda index: IMAGE_CARD_TEMPLATE.render(image_url=IMAGE_URL, prompt=f"prompt {index % 10}", download_url=IMAGE_URL), args.calls)
+
+
+if __name__ == "__main__":
+    main()
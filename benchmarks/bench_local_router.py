@@ -0,0 +1,73 @@
+"""
+Compares the local query router with the LLM router on labelled queries.
+
+The labels are the routes logged by route_question (or JSON lines, see tools/train_local_router.py),
+so they are the LLM router's own decisions. The local router is timed on every query; with
+--llm-calls the LLM router is also called live on that many queries, which needs the Azure
+OpenAI settings of the app. Run from the repository root:
+
+    python -m benchmarks.bench_local_router app.log --model local_router_model.json --llm-calls 20
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app.services.query_router_service import LocalQueryRouter
+from tools.train_local_router import read_route_files
+
+
+def bench_local(router, samples, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        routes = [router.classify(query) for query, _ in samples]
+    elapsed_us = (time.perf_counter() - start) / (repeat * len(samples)) * 1e6
+    by_source = {"rules": [0, 0], "classifier": [0, 0], "fallback": [0, 0]}
+    for (route, source), (_, datasource) in zip(routes, samples):
+        by_source[source][0] += 1
+        by_source[source][1] += int(route == datasource)
+    print(f"{'local router':<14} {elapsed_us:>10.1f} us/query")
+    for source in ("rules", "classifier"):
+        count, correct = by_source[source]
+        print(f"  {source:<12} {count / len(samples):>7.1%} of queries, accuracy {correct / count if count else 0.0:.1%}")
+    print(f"  {'fallback':<12} {by_source['fallback'][0] / len(samples):>7.1%} of queries sent to the LLM")
+
+
+async def bench_llm(samples):
+    from app.agents.agent_retrieval import AgentRetrieval
+
+    chain = AgentRetrieval().query_type_finder()
+    latencies, correct = [], 0
+    for query, datasource in samples:
+        start = time.perf_counter()
+        response = await chain.ainvoke({"rephrased_query": query})
+        latencies.append(time.perf_counter() - start)
+        correct += int(response.get("datasource") == datasource)
+    latencies.sort()
+    print(
+        f"{'llm router':<14} {sum(latencies) / len(latencies) * 1e6:>10.1f} us/query "
+        f"(p50 {latencies[len(latencies) // 2] * 1000:.0f} ms), agreement with labels {correct / len(samples):.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="log files or JSON lines with labelled queries")
+    parser.add_argument("--model", default="local_router_model.json", help="rules only when the file does not exist")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--llm-calls", type=int, default=0)
+    args = parser.parse_args()
+
+    # duplicates are dropped like in training, so frequent queries do not dominate the accuracy
+    samples = list(dict.fromkeys(read_route_files(args.logs)))
+    if not samples:
+        parser.exit(1, "No labelled queries found\n")
+    router = LocalQueryRouter.from_file(args.model) if os.path.exists(args.model) else LocalQueryRouter()
+    print(f"{len(samples)} labelled queries")
+    bench_local(router, samples, args.repeat)
+    if args.llm_calls:
+        asyncio.run(bench_llm(samples[:args.llm_calls]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from langchain_core.documents import Document
+
+from app.agents import agent_state
+from app.agents.agent_retrieval import DocumentGrade, DocumentGradeBatch
+from app.config.constants import QUERY_ROUTE_LOG_PREFIX
+from app.services.llm_cache_service import chain_version
+
+
+def make_document(source, score=2.0):
+    return Document(page_content=f"content of {source}", metadata={"source": source, "url": "", "score": score})
+
+
+class TestGradeDocuments(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.documents = [make_document("doc-a"), make_document("doc-b"), make_document("doc-c")]
+        self.state = {"rephrased_query": "How do I reset my password?", "vector_doc": self.documents}
+        self.batch_grader = MagicMock()
+        self.batch_grader.ainvoke = AsyncMock(return_value=DocumentGradeBatch(grades=[
+            DocumentGrade(index=0, score="yes", assessment="direct answer", name="Password guide"),
+            DocumentGrade(index=1, score="no", assessment="unrelated", name="Canteen menu"),
+            DocumentGrade(index=2, score="maybe", assessment="related system", name="SAP overview"),
+        ]))
+        self.single_grader = MagicMock()
+        self.single_grader.ainvoke = AsyncMock(return_value={"score": "yes", "assessment": "ok", "name": "Doc"})
+        self.agent_retrieval = MagicMock()
+        self.agent_retrieval.retrieved_documents_batch_grader.return_value = self.batch_grader
+        self.agent_retrieval.retrieved_documents_grader.return_value = self.single_grader
+        patcher = patch.object(agent_state, "agent_retrieval", self.agent_retrieval)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(agent_state, "GRADE_DOCUMENTS_BATCH_MODE", True)
+    async def test_batch_mode_grades_all_documents_in_one_call(self):
+        result = await agent_state.grade_documents(self.state)
+
+        self.batch_grader.ainvoke.assert_awaited_once()
+        self.single_grader.ainvoke.assert_not_awaited()
+        prompt_documents = self.batch_grader.ainvoke.await_args.args[0]["vector_doc"]
+        self.assertIn("[Document 2]", prompt_documents)
+        self.assertEqual(result["vector_doc"], [self.documents[0], self.documents[2]])
+        self.assertEqual(result["filenames"], ["Password guide", "SAP overview"])
+        self.assertEqual(result["assessment"], ["direct answer", "unrelated", "related system"])
+        self.assertTrue(result["awaiting_user_input"])
+        self.assertFalse(result["error_occurred"])
+
+    @patch.object(agent_state, "GRADE_DOCUMENTS_BATCH_MODE", True)
+    async def test_batch_mode_sends_document_metadata(self):
+        await agent_state.grade_documents(self.state)
+
+        vector_doc = self.batch_grader.ainvoke.await_args.args[0]["vector_doc"]
+        self.assertIn("[Document 1]\nMetadata: {'source': 'doc-b', 'url': '', 'score': 2.0}\ncontent of doc-b", vector_doc)
+
+    @patch.object(agent_state, "GRADE_DOCUMENTS_BATCH_MODE", True)
+    async def test_batch_mode_keeps_documents_missing_from_the_response(self):
+        self.batch_grader.ainvoke.return_value = DocumentGradeBatch(grades=[
+            DocumentGrade(index=0, score="yes", assessment="direct answer", name="Password guide"),
+        ])
+
+        result = await agent_state.grade_documents(self.state)
+
+        self.assertEqual(result["vector_doc"], self.documents)
+        self.assertEqual(result["filenames"], ["Password guide", "doc-b", "doc-c"])
+
+    @patch.object(agent_state, "GRADE_DOCUMENTS_BATCH_MODE", True)
+    async def test_batch_mode_propagates_llm_errors(self):
+        self.batch_grader.ainvoke.side_effect = ValueError("boom")
+
+        result = await agent_state.grade_documents(self.state)
+
+        self.assertTrue(result["error_occurred"])
+
+    @patch.object(agent_state, "GRADE_DOCUMENTS_BATCH_MODE", False)
+    async def test_default_mode_grades_each_document(self):
+        result = await agent_state.grade_documents(self.state)
+
+        self.assertEqual(self.single_grader.ainvoke.await_count, 3)
+        self.batch_grader.ainvoke.assert_not_awaited()
+        self.assertEqual(result["vector_doc"], self.documents)
+
+    @patch.object(agent_state, "RERANKER_SCORE_BANDS_ENABLED", True)
+    @patch.object(agent_state, "GRADE_DOCUMENTS_BATCH_MODE", False)
+    async def test_score_bands_only_grade_the_uncertain_documents(self):
+        self.state["vector_doc"] = [make_document("high", 3.5), make_document("middle", 2.0), make_document("low", 0.4)]
+
+        result = await agent_state.grade_documents(self.state)
+
+        self.assertEqual(self.single_grader.ainvoke.await_count, 1)
+        self.assertEqual(self.single_grader.ainvoke.await_args.args[0]["vector_doc"].metadata["source"], "middle")
+        self.assertEqual([d.metadata["source"] for d in result["vector_doc"]], ["high", "middle"])
+        self.assertEqual(result["filenames"], ["high", "Doc"])
+        self.assertTrue(result["awaiting_user_input"])
+        self.assertEqual(result["assessment"][0], "Accepted by semantic reranker score 3.50")
+
+    @patch.object(agent_state, "RERANKER_SCORE_BANDS_ENABLED", True)
+    @patch.object(agent_state, "GRADE_DOCUMENTS_BATCH_MODE", True)
+    async def test_score_bands_skip_the_batch_grader_when_nothing_is_uncertain(self):
+        self.state["vector_doc"] = [make_document("high", 3.5), make_document("low", 0.4)]
+
+        result = await agent_state.grade_documents(self.state)
+
+        self.batch_grader.ainvoke.assert_not_awaited()
+        self.assertEqual([d.metadata["source"] for d in result["vector_doc"]], ["high"])
+
+    def test_documents_without_reranker_score_are_graded(self):
+        document = Document(page_content="content", metadata={"source": "a"})
+
+        self.assertEqual(agent_state.reranker_band(document, 3.0, 1.0), "grade")
+        self.assertEqual(agent_state.reranker_band(make_document("a", 3.0), 3.0, 1.0), "accept")
+        self.assertEqual(agent_state.reranker_band(make_document("a", 1.0), 3.0, 1.0), "grade")
+
+
+class TestRobustLLMCall(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.chain = MagicMock()
+        self.chain.ainvoke = AsyncMock(return_value={"datasource": "vectorstore"})
+        self.services = MagicMock()
+        self.services.llm_cache.is_cached_chain.return_value = True
+        self.services.llm_cache.get.return_value = None
+        patcher = patch.object(agent_state, "services", self.services)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(agent_state, "LLM_CACHE_ENABLED", True)
+    async def test_cached_response_skips_the_chain(self):
+        self.services.llm_cache.get.return_value = {"datasource": "web_search"}
+
+        result = await agent_state.robust_llm_call(self.chain, {"rephrased_query": "hi"}, cache_name="route_question")
+
+        self.assertEqual(result, {"success": True, "response": {"datasource": "web_search"}, "cached": True})
+        self.chain.ainvoke.assert_not_awaited()
+
+    @patch.object(agent_state, "LLM_CACHE_ENABLED", True)
+    async def test_miss_stores_the_response(self):
+        result = await agent_state.robust_llm_call(self.chain, {"rephrased_query": "hi"}, cache_name="route_question")
+
+        self.assertEqual(result["response"], {"datasource": "vectorstore"})
+        self.services.llm_cache.set.assert_called_once_with(
+            "route_question", {"rephrased_query": "hi"}, {"datasource": "vectorstore"}, chain_version(self.chain)
+        )
+
+    @patch.object(agent_state, "LLM_CACHE_ENABLED", True)
+    async def test_calls_without_cache_name_are_not_cached(self):
+        await agent_state.robust_llm_call(self.chain, {"rephrased_query": "hi"})
+
+        self.services.llm_cache.get.assert_not_called()
+        self.services.llm_cache.set.assert_not_called()
+
+    @patch.object(agent_state, "LLM_CACHE_ENABLED", True)
+    async def test_bypassed_calls_are_not_cached(self):
+        with agent_state.bypass_caches():
+            await agent_state.robust_llm_call(self.chain, {"rephrased_query": "hi"}, cache_name="route_question")
+
+        self.services.llm_cache.get.assert_not_called()
+        self.services.llm_cache.set.assert_not_called()
+
+
+class TestSemanticCacheLookup(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.state = {"rephrased_query": "How do I reset my password?", "allowed_index": ["dev"]}
+        self.services = MagicMock()
+        self.services.embedding_cache.aembed_query = AsyncMock(return_value=[0.1, 0.2])
+        patcher = patch.object(agent_state, "services", self.services)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(agent_state, "SEMANTIC_CACHE_ENABLED", True)
+    async def test_hit_returns_cached_answer(self):
+        self.services.semantic_cache.lookup.return_value = {
+            "answer": "Reset it in the portal.", "sources": ["Password guide"], "similarity": 0.97
+        }
+
+        result = await agent_state.semantic_cache_lookup(self.state)
+
+        self.services.semantic_cache.lookup.assert_called_once_with([0.1, 0.2], ["dev"])
+        self.assertTrue(result["cache_hit"])
+        self.assertEqual(result["final_answer"], "Reset it in the portal.")
+        self.assertEqual(result["filenames"], ["Password guide"])
+        self.assertEqual(agent_state.route_semantic_cache(result), "hit")
+
+    @patch.object(agent_state, "SEMANTIC_CACHE_ENABLED", True)
+    async def test_miss_keeps_embedding_for_storing(self):
+        self.services.semantic_cache.lookup.return_value = None
+
+        result = await agent_state.semantic_cache_lookup(self.state)
+
+        self.assertEqual(result, {"query_embedding": [0.1, 0.2], "cache_hit": False})
+        self.assertEqual(agent_state.route_semantic_cache(result), "miss")
+
+    @patch.object(agent_state, "SEMANTIC_CACHE_ENABLED", True)
+    async def test_lookup_failure_is_a_miss(self):
+        self.services.embedding_cache.aembed_query.side_effect = RuntimeError("timeout")
+
+        result = await agent_state.semantic_cache_lookup(self.state)
+
+        self.assertEqual(result, {"cache_hit": False})
+
+    @patch.object(agent_state, "SEMANTIC_CACHE_ENABLED", False)
+    async def test_disabled_cache_skips_embedding(self):
+        result = await agent_state.semantic_cache_lookup(self.state)
+
+        self.services.embedding_cache.aembed_query.assert_not_awaited()
+        self.assertFalse(result["cache_hit"])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestAnalyzeQuery(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.state = {"raw_query": "What about for SAP?", "chat_history": [{"prompt": "How do I reset my password?"}]}
+        self.chain = MagicMock()
+        self.agent_retrieval = MagicMock()
+        self.agent_retrieval.query_analyzer.return_value = self.chain
+        patcher = patch.object(agent_state, "agent_retrieval", self.agent_retrieval)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_returns_rephrased_query_and_route_from_one_call(self):
+        self.chain.ainvoke = AsyncMock(return_value={
+            "rephrased_query": "How do I reset my SAP password?", "ambiguity_status": "proceed",
+            "datasource": "vectorstore", "followup_question": "",
+        })
+
+        result = await agent_state.analyze_query(self.state)
+
+        self.assertEqual(result, {
+            "rephrased_query": "How do I reset my SAP password?", "ambiguity_status": "proceed",
+            "datasource": "vectorstore", "error_occurred": False,
+        })
+        self.chain.ainvoke.assert_awaited_once()
+
+    async def test_ambiguous_query_carries_the_followup_question(self):
+        self.chain.ainvoke = AsyncMock(return_value={
+            "rephrased_query": "SAP", "ambiguity_status": "ambiguous",
+            "datasource": "vectorstore", "followup_question": "What would you like to know about SAP?",
+        })
+
+        result = await agent_state.analyze_query(self.state)
+
+        self.assertEqual(result["ambiguity_status"], "ambiguous")
+        self.assertEqual(result["final_answer"], "What would you like to know about SAP?")
+
+    async def test_invalid_datasource_is_an_error(self):
+        self.chain.ainvoke = AsyncMock(return_value={"rephrased_query": "SAP", "datasource": "database"})
+
+        result = await agent_state.analyze_query(self.state)
+
+        self.assertTrue(result["error_occurred"])
+
+
+class TestSpeculativeRetrieval(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.services = MagicMock()
+        self.services.speculative_retrieval.start.return_value = "speculation-1"
+        self.services.speculative_retrieval.claim = AsyncMock(return_value=["speculative doc"])
+        self.agent_retrieval = MagicMock()
+        for target, value in (("services", self.services), ("agent_retrieval", self.agent_retrieval)):
+            patcher = patch.object(agent_state, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.state = {"raw_query": "reset my password", "chat_history": [], "allowed_index": ["dev"]}
+
+    @patch.object(agent_state, "SPECULATIVE_RETRIEVAL_ENABLED", True)
+    async def test_analysis_keeps_the_speculation_for_the_vector_store(self):
+        self.agent_retrieval.query_analyzer().ainvoke = AsyncMock(return_value={
+            "rephrased_query": "How do I reset my password?", "ambiguity_status": "proceed", "datasource": "vectorstore",
+        })
+
+        result = await agent_state.analyze_query(self.state)
+
+        self.assertEqual(result["speculation_id"], "speculation-1")
+        self.services.speculative_retrieval.start.assert_called_once_with("reset my password", ["dev"])
+        self.services.speculative_retrieval.discard.assert_not_called()
+
+    @patch.object(agent_state, "SPECULATIVE_RETRIEVAL_ENABLED", True)
+    async def test_analysis_discards_the_speculation_for_other_routes(self):
+        self.agent_retrieval.query_analyzer().ainvoke = AsyncMock(return_value={
+            "rephrased_query": "Draw a cat", "ambiguity_status": "proceed", "datasource": "image_processing",
+        })
+
+        result = await agent_state.analyze_query(self.state)
+
+        self.assertNotIn("speculation_id", result)
+        self.services.speculative_retrieval.discard.assert_called_once_with("speculation-1", "route")
+
+    async def test_route_question_discards_the_speculation_for_web_search(self):
+        self.agent_retrieval.query_type_finder().ainvoke = AsyncMock(return_value={"datasource": "web_search"})
+
+        await agent_state.route_question(dict(self.state, rephrased_query="Write a poem", speculation_id="speculation-1"))
+
+        self.services.speculative_retrieval.discard.assert_called_once_with("speculation-1", "route")
+
+    async def test_vector_retrieve_uses_the_claimed_documents(self):
+        with patch.object(agent_state, "semantic_logic_multi_index_retrieval", AsyncMock()) as retrieval:
+            result = await agent_state.vector_retrieve(
+                dict(self.state, user_id="a", rephrased_query="reset my password", speculation_id="speculation-1")
+            )
+
+        self.assertEqual(result["vector_doc"], ["speculative doc"])
+        self.services.speculative_retrieval.claim.assert_awaited_once_with("speculation-1", "reset my password")
+        retrieval.assert_not_awaited()
+
+    async def test_vector_retrieve_searches_again_on_a_miss(self):
+        self.services.speculative_retrieval.claim.return_value = None
+        with patch.object(agent_state, "semantic_logic_multi_index_retrieval", AsyncMock(return_value=["doc"])) as retrieval:
+            result = await agent_state.vector_retrieve(
+                dict(self.state, user_id="a", rephrased_query="reset my SAP password", speculation_id="speculation-1")
+            )
+
+        self.assertEqual(result["vector_doc"], ["doc"])
+        retrieval.assert_awaited_once()
+
+
+class TestLocalRouting(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.services = MagicMock()
+        self.agent_retrieval = MagicMock()
+        self.agent_retrieval.query_type_finder().ainvoke = AsyncMock(return_value={"datasource": "vectorstore"})
+        for target, value in (("services", self.services), ("agent_retrieval", self.agent_retrieval)):
+            patcher = patch.object(agent_state, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch.object(agent_state, "LOCAL_ROUTER_ENABLED", True)
+    async def test_local_route_skips_the_llm(self):
+        self.services.local_router.route.return_value = "image_processing"
+
+        result = await agent_state.route_question({"rephrased_query": "Draw a cat", "speculation_id": "s"})
+
+        self.assertEqual(result, {"datasource": "image_processing", "error_occurred": False})
+        self.agent_retrieval.query_type_finder().ainvoke.assert_not_awaited()
+        self.services.speculative_retrieval.discard.assert_called_once_with("s", "route")
+
+    @patch.object(agent_state, "LOCAL_ROUTER_ENABLED", True)
+    async def test_unconfident_local_router_falls_back_to_the_llm(self):
+        self.services.local_router.route.return_value = None
+
+        result = await agent_state.route_question({"rephrased_query": "Who is Kirill?"})
+
+        self.assertEqual(result["datasource"], "vectorstore")
+        self.agent_retrieval.query_type_finder().ainvoke.assert_awaited_once()
+
+    @patch.object(agent_state, "LLM_CACHE_ENABLED", True)
+    async def test_cached_routes_are_not_logged_again(self):
+        self.services.llm_cache.is_cached_chain.return_value = True
+        self.services.llm_cache.get.side_effect = [None, {"datasource": "vectorstore"}]
+
+        with patch.object(agent_state, "logger") as logger:
+            for _ in range(2):
+                await agent_state.route_question({"rephrased_query": "Who approves travel expenses?"})
+
+        route_logs = [call for call in logger.info.call_args_list if call.args[:2] == ("%s%s", QUERY_ROUTE_LOG_PREFIX)]
+        self.assertEqual(len(route_logs), 1)
+
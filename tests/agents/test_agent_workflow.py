@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app.agents import agent_state
+
+from app.agents.agent_workflow_registry import (
+    DEFAULT_WORKFLOW,
+    FUSED_WORKFLOW,
+    WARM_UP_INPUTS,
+    WORKFLOW_DEFINITIONS,
+    compile_agent_workflow,
+    get_agent_workflow,
+    stub_agent_retrieval,
+    warm_up_agent_workflow,
+)
+
+
+class TestFusedWorkflow(unittest.IsolatedAsyncioTestCase):
+
+    def test_every_topology_compiles(self):
+        for name in WORKFLOW_DEFINITIONS:
+            compile_agent_workflow(name)
+
+    async def test_routed_query_needs_one_call_before_answering(self):
+        # a single gpt4o response: the analysis, with no separate rephrase and routing calls
+        result = await warm_up_agent_workflow(FUSED_WORKFLOW)
+
+        self.assertEqual(result["datasource"], "web_search")
+        self.assertEqual(result["final_answer"], "warm up")
+
+    async def test_warm_up_bypasses_the_caches(self):
+        services = MagicMock()
+        with patch.object(agent_state, "services", services), \
+                patch.object(agent_state, "LLM_CACHE_ENABLED", True), \
+                patch.object(agent_state, "SEMANTIC_CACHE_ENABLED", True):
+            await warm_up_agent_workflow(FUSED_WORKFLOW)
+
+        services.llm_cache.get.assert_not_called()
+        services.llm_cache.set.assert_not_called()
+        services.semantic_cache.lookup.assert_not_called()
+
+    async def test_warm_up_bypasses_the_local_router(self):
+        services = MagicMock()
+        services.local_router.route.return_value = "web_search"
+        with patch.object(agent_state, "services", services), patch.object(agent_state, "LOCAL_ROUTER_ENABLED", True):
+            result = await warm_up_agent_workflow(DEFAULT_WORKFLOW)
+
+        services.local_router.route.assert_not_called()
+        self.assertEqual(result["final_answer"], "warm up")
+
+    async def test_stubs_do_not_reach_concurrent_runs(self):
+        stubs_active = asyncio.Event()
+        seen = {}
+
+        async def concurrent_request():
+            await stubs_active.wait()
+            seen["retrieval"] = agent_state.get_agent_retrieval()
+
+        request = asyncio.get_running_loop().create_task(concurrent_request())
+        with stub_agent_retrieval(["warm up"], ["warm up"]):
+            self.assertIsNot(agent_state.get_agent_retrieval(), agent_state.agent_retrieval)
+            stubs_active.set()
+            await request
+
+        self.assertIs(seen["retrieval"], agent_state.agent_retrieval)
+
+    async def test_ambiguous_query_ends_with_the_followup_question(self):
+        analysis = '{"rephrased_query": "SAP", "ambiguity_status": "ambiguous", "datasource": "vectorstore", "followup_question": "What about SAP?"}'
+        inputs = dict(WARM_UP_INPUTS, raw_query="SAP")
+
+        with stub_agent_retrieval([analysis], []):
+            result = await get_agent_workflow(FUSED_WORKFLOW).ainvoke(inputs, {"recursion_limit": 8})
+
+        self.assertEqual(result["final_answer"], "What about SAP?")
+        self.assertFalse(result["error_occurred"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,288 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceExistsError, CosmosResourceNotFoundError
+
+from app.services.async_cosmos_service import AsyncCosmosService, append_history_turn, history_document_id
+from app.utils.util_background_loop import BackgroundEventLoop
+
+
+class FakeItemPaged:
+    def __init__(self, items):
+        self.items = list(items)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for item in self.items:
+            yield item
+
+
+def make_container():
+    container = MagicMock()
+    container.query_items.return_value = FakeItemPaged([])
+    container.read_item = AsyncMock(side_effect=CosmosResourceNotFoundError(message="Not found"))
+    container.create_item = AsyncMock()
+    container.upsert_item = AsyncMock()
+    container.delete_item = AsyncMock()
+    container.delete_all_items_by_partition_key = AsyncMock()
+    container.execute_item_batch = AsyncMock(return_value=[])
+    return container
+
+
+class FakeDocumentStore:
+    """In-memory documents with Cosmos-style etags for the conditional history writes."""
+
+    def __init__(self, container):
+        self.documents = {}
+        self.versions = 0
+        container.read_item = AsyncMock(side_effect=self.read_item)
+        container.create_item = AsyncMock(side_effect=self.create_item)
+        container.replace_item = AsyncMock(side_effect=self.replace_item)
+
+    def store(self, body):
+        self.versions += 1
+        self.documents[body["id"]] = dict(body, _etag=f"etag-{self.versions}")
+        return dict(self.documents[body["id"]])
+
+    async def read_item(self, item, partition_key):
+        if item not in self.documents:
+            raise CosmosResourceNotFoundError(message="Not found")
+        return dict(self.documents[item])
+
+    async def create_item(self, body):
+        if body["id"] in self.documents:
+            raise CosmosResourceExistsError(message="Conflict")
+        return self.store(body)
+
+    async def replace_item(self, item, body, etag, match_condition):
+        if self.documents[item]["_etag"] != etag:
+            raise CosmosAccessConditionFailedError(message="Precondition failed")
+        return self.store(body)
+
+
+class TestAsyncCosmosService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-cosmos-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.containers = {
+            "interactions": make_container(),
+            "images": make_container(),
+            "reply_to_id": make_container(),
+        }
+        self.mock_client = MagicMock()
+        self.mock_client.__aenter__ = AsyncMock(return_value=self.mock_client)
+        self.mock_client.close = AsyncMock()
+        self.mock_client.get_database_client.return_value.get_container_client.side_effect = \
+            lambda name: self.containers[name]
+        patcher = patch("app.services.async_cosmos_service.CosmosClient", return_value=self.mock_client)
+        self.MockCosmosClient = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cosmos_service = AsyncCosmosService(
+            endpoint="dummy_endpoint",
+            key="dummy_key",
+            database_name="dummy_database",
+            user_interactions_container_name="interactions",
+            images_info_container_name="images",
+            reply_to_id_container_name="reply_to_id",
+            event_loop=self.event_loop,
+        )
+
+    async def test_get_interaction_state_reads_the_profile_document(self):
+        self.containers["interactions"].read_item.side_effect = None
+        self.containers["interactions"].read_item.return_value = {
+            "id": "test_user", "state_of_welcome_message_sent": "sent", "state_of_data_agreement": "accepted"
+        }
+
+        state = await self.cosmos_service.get_interaction_state("test_user")
+        agreement = await self.cosmos_service.get_data_agreement_state("test_user")
+
+        self.assertEqual((state, agreement), ("sent", "accepted"))
+        self.containers["interactions"].read_item.assert_awaited_once_with(item="test_user", partition_key="test_user")
+        self.containers["interactions"].query_items.assert_not_called()
+
+    async def test_profile_is_created_from_legacy_interaction_document(self):
+        self.containers["interactions"].query_items.return_value = FakeItemPaged([
+            {"conversation_id": "c", "state_of_welcome_message_sent": "sent", "state_of_data_agreement": "pending"}
+        ])
+
+        state = await self.cosmos_service.get_data_agreement_state("test_user")
+
+        self.assertEqual(state, "pending")
+        profile = self.containers["interactions"].upsert_item.await_args.kwargs["body"]
+        self.assertEqual((profile["id"], profile["doc_type"]), ("test_user", "profile"))
+
+    async def test_unknown_user_has_no_state(self):
+        self.assertIsNone(await self.cosmos_service.get_interaction_state("new_user"))
+        self.containers["interactions"].upsert_item.assert_not_awaited()
+
+    async def test_upserted_profile_is_served_from_cache(self):
+        await self.cosmos_service.upsert_user_profile({
+            "user_id": "a", "state_of_welcome_message_sent": "sent", "state_of_data_agreement": "pending"
+        })
+
+        self.assertEqual(await self.cosmos_service.get_data_agreement_state("a"), "pending")
+        self.containers["interactions"].read_item.assert_not_awaited()
+        body = self.containers["interactions"].upsert_item.await_args.kwargs["body"]
+        self.assertEqual((body["id"], body["doc_type"]), ("a", "profile"))
+
+    async def test_delete_conversation_invalidates_the_profile(self):
+        await self.cosmos_service.upsert_user_profile({"user_id": "a", "state_of_welcome_message_sent": "sent"})
+
+        await self.cosmos_service.delete_conversation("a")
+
+        self.assertIsNone(await self.cosmos_service.get_interaction_state("a"))
+        self.containers["interactions"].delete_all_items_by_partition_key.assert_awaited_once_with("a")
+
+    async def test_history_query_excludes_profile_and_history_documents(self):
+        await self.cosmos_service.get_latest_conversations("a", top_n=2)
+
+        query = self.containers["interactions"].query_items.call_args.args[0]
+        self.assertIn("NOT IS_DEFINED(c.doc_type)", query)
+
+    async def test_conversation_history_is_a_point_read(self):
+        self.containers["interactions"].read_item.side_effect = None
+        self.containers["interactions"].read_item.return_value = {
+            "id": history_document_id("c"), "user_id": "a", "turns": [
+                {"prompt": "p1", "response": "r1"}, {"prompt": "p2", "response": "r2"}, {"prompt": "p3", "response": "r3"}
+            ]
+        }
+
+        history = await self.cosmos_service.get_conversation_history("a", "c", top_n=2)
+        await self.cosmos_service.get_conversation_history("a", "c", top_n=2)
+
+        self.assertEqual(history, [{"prompt": "p3", "response": "r3"}, {"prompt": "p2", "response": "r2"}])
+        self.containers["interactions"].read_item.assert_awaited_once_with(item=history_document_id("c"), partition_key="a")
+        self.containers["interactions"].query_items.assert_not_called()
+
+    async def test_conversation_history_is_seeded_from_legacy_interactions(self):
+        self.containers["interactions"].query_items.return_value = FakeItemPaged([
+            {"prompt": "p2", "response": "r2"}, {"prompt": "p1", "response": "r1"}
+        ])
+
+        history = await self.cosmos_service.get_conversation_history("a", "c", top_n=1)
+
+        self.assertEqual(history, [{"prompt": "p2", "response": "r2"}])
+        query_call = self.containers["interactions"].query_items.call_args
+        self.assertIn("c.conversation_id = @conversation_id", query_call.args[0])
+        self.assertIn({"name": "@conversation_id", "value": "c"}, query_call.kwargs["parameters"])
+
+    async def test_seeded_history_is_not_queried_again_after_the_cache_expires(self):
+        await self.cosmos_service.get_conversation_history("a", "c")
+        self.cosmos_service.history_cache.clear()
+
+        self.assertEqual(await self.cosmos_service.get_conversation_history("a", "c"), [])
+        self.assertEqual(self.containers["interactions"].query_items.call_count, 1)
+
+    async def test_add_conversation_turn_keeps_a_rolling_window(self):
+        store = FakeDocumentStore(self.containers["interactions"])
+        self.cosmos_service.history_max_turns = 2
+        self.cosmos_service.history_max_response_chars = 5
+
+        for index in range(3):
+            document = await self.cosmos_service.add_conversation_turn("a", "c", f"p{index}", f"response {index}")
+
+        self.assertEqual(document["id"], history_document_id("c"))
+        self.assertEqual(document["user_id"], "a")
+        self.assertEqual(document["turns"], [{"prompt": "p1", "response": "respo"}, {"prompt": "p2", "response": "respo"}])
+        self.assertEqual(store.documents[history_document_id("c")]["turns"], document["turns"])
+        self.assertEqual(await self.cosmos_service.get_conversation_history("a", "c", top_n=3), list(reversed(document["turns"])))
+
+    async def test_concurrent_writer_turns_are_not_overwritten(self):
+        store = FakeDocumentStore(self.containers["interactions"])
+        await self.cosmos_service.add_conversation_turn("a", "c", "p1", "r1")
+        # another pod appends a turn after this one has cached the document
+        other = dict(store.documents[history_document_id("c")])
+        store.store(dict(other, turns=other["turns"] + [{"prompt": "p2", "response": "r2"}]))
+        real_replace = store.replace_item
+
+        async def replace_after_concurrent_update(item, body, etag, match_condition):
+            if store.versions == 2:
+                # yet another turn lands between this pod's read and its write
+                current = store.documents[item]
+                store.store(dict(current, turns=current["turns"] + [{"prompt": "p3", "response": "r3"}]))
+            return await real_replace(item, body, etag, match_condition)
+
+        self.containers["interactions"].replace_item.side_effect = replace_after_concurrent_update
+
+        document = await self.cosmos_service.add_conversation_turn("a", "c", "p4", "r4")
+
+        self.assertEqual([turn["prompt"] for turn in document["turns"]], ["p1", "p2", "p3", "p4"])
+        self.assertEqual(self.containers["interactions"].replace_item.await_count, 2)
+
+    async def test_add_conversation_turn_gives_up_after_repeated_conflicts(self):
+        self.cosmos_service.history_write_attempts = 2
+        self.containers["interactions"].create_item.side_effect = CosmosResourceExistsError(message="Conflict")
+
+        self.assertIsNone(await self.cosmos_service.add_conversation_turn("a", "c", "p", "r"))
+        self.assertEqual(self.containers["interactions"].create_item.await_count, 2)
+
+    def test_append_history_turn_handles_missing_response(self):
+        self.assertEqual(append_history_turn([], "p", None, 3, 10), [{"prompt": "p", "response": ""}])
+
+    async def test_client_is_opened_once_for_concurrent_calls(self):
+        await asyncio.gather(
+            self.cosmos_service.get_data_agreement_state("a"),
+            self.cosmos_service.get_latest_conversations("a", top_n=2),
+            self.cosmos_service.get_message_ids("b"),
+        )
+
+        self.MockCosmosClient.assert_called_once_with("dummy_endpoint", "dummy_key")
+        self.mock_client.__aenter__.assert_awaited_once()
+
+    async def test_calls_run_on_the_background_loop(self):
+        loops = []
+
+        async def create_item(body):
+            loops.append(asyncio.get_running_loop())
+
+        self.containers["interactions"].create_item.side_effect = create_item
+
+        self.assertTrue(await self.cosmos_service.insert_prompt_response_info({"user_id": "a"}))
+        self.assertEqual(loops, [self.event_loop.loop])
+
+    async def test_upsert_items_batch(self):
+        items = [{"id": "1", "user_id": "a"}, {"id": "2", "user_id": "a"}]
+
+        await self.cosmos_service.upsert_items_batch("interactions_container", "a", items)
+
+        self.containers["interactions"].execute_item_batch.assert_awaited_once_with(
+            [("upsert", (items[0],)), ("upsert", (items[1],))], partition_key="a"
+        )
+
+    async def test_insert_failure_returns_false(self):
+        self.containers["images"].create_item.side_effect = Exception("Insert failed")
+
+        self.assertFalse(await self.cosmos_service.insert_generated_image_info({"user_id": "a"}))
+
+    async def test_update_data_agreement_state(self):
+        self.containers["interactions"].read_item.side_effect = None
+        self.containers["interactions"].read_item.return_value = {"id": "a", "user_id": "a", "state_of_data_agreement": "pending"}
+        await self.cosmos_service.get_data_agreement_state("a")
+
+        await self.cosmos_service.update_data_agreement_state("a", accepted=True)
+
+        body = self.containers["interactions"].upsert_item.await_args.kwargs["body"]
+        self.assertEqual(body["state_of_data_agreement"], "accepted")
+        self.assertEqual(await self.cosmos_service.get_data_agreement_state("a"), "accepted")
+        self.assertEqual(self.containers["interactions"].read_item.await_count, 2)
+
+    async def test_delete_reply_to_id(self):
+        self.containers["reply_to_id"].query_items.return_value = FakeItemPaged([{"id": "reply-1"}])
+
+        self.assertTrue(await self.cosmos_service.delete_reply_to_id("r", "a"))
+        self.containers["reply_to_id"].delete_item.assert_awaited_once_with(item="reply-1", partition_key="a")
+
+    async def test_shutdown_closes_the_client(self):
+        await self.cosmos_service.get_interaction_state("a")
+
+        await asyncio.to_thread(self.cosmos_service.shutdown)
+
+        self.mock_client.close.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,8 @@ from datetime import datetime, timedelta
 import requests
 
 from app.services.authentication_service import AuthenticationService
+from app.utils.util_background_loop import BackgroundEventLoop
+from tests.util import FakeClock
 
 class TestAuthenticationService(unittest.TestCase):
 
@@ -31,7 +33,7 @@ class TestAuthenticationService(unittest.TestCase):
         result = self.auth_service.is_jwt_token_expired(token)
         
         self.assertFalse(result)
-        self.mock_token_validation_service.get_public_key.assert_called_once_with(self.mock_token_validation_service.fetch_azure_jkws(), 'valid_kid')
+        self.mock_token_validation_service.get_public_key.assert_called_once_with('valid_kid')
         mock_decode.assert_called_once_with(token, 'public_key', algorithms=["RS256"], audience="https://api.botframework.com")
     
     @patch('jwt.decode')
@@ -102,5 +104,81 @@ class TestAuthenticationService(unittest.TestCase):
         
         self.assertEqual(self.auth_service.get_current_token(), new_token)
 
+
+TOKEN_URL = "https://login.microsoftonline.com/tenant_id/oauth2/v2.0/token"
+
+
+class TestTokenRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.event_loop = BackgroundEventLoop("test-auth-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.mock_token_validation_service = MagicMock()
+        # injected instead of patching requests.post, which the log exporter thread also calls
+        self.mock_post = MagicMock()
+        self.auth_service = AuthenticationService("tenant_id", "app_id", "app_secret", self.mock_token_validation_service,
+                                                  refresh_margin_seconds=300, event_loop=self.event_loop, clock=self.clock,
+                                                  http_post=self.mock_post)
+        self.tokens = iter(["token_1", "token_2", "token_3"])
+        self.mock_post.side_effect = lambda *args, **kwargs: self.token_response(next(self.tokens))
+
+    def token_requests(self):
+        return [call for call in self.mock_post.call_args_list if call.args[0] == TOKEN_URL]
+
+    @staticmethod
+    def token_response(token, expires_in=3600):
+        response_mock = MagicMock()
+        response_mock.json.return_value = {'access_token': token, 'expires_in': expires_in}
+        response_mock.raise_for_status.return_value = None
+        return response_mock
+
+    def test_token_is_stored_with_expiry_from_response(self):
+        self.auth_service.refresh_token_if_needed()
+
+        self.assertEqual(self.auth_service.get_current_token(), "token_1")
+        self.assertEqual(self.auth_service.get_token_expiry(), 4600.0)
+
+    def test_valid_token_is_not_refreshed_or_verified(self):
+        self.auth_service.refresh_token_if_needed()
+        self.clock.now += 3000
+
+        self.auth_service.refresh_token_if_needed()
+
+        self.assertEqual(len(self.token_requests()), 1)
+        self.mock_token_validation_service.get_public_key.assert_not_called()
+
+    def test_expiring_token_is_refreshed_once_in_the_background(self):
+        self.auth_service.refresh_token_if_needed()
+        self.clock.now += 3400
+
+        self.auth_service.refresh_token_if_needed()
+        self.auth_service.refresh_token_if_needed()
+        self.assertIn(self.auth_service.get_current_token(), ("token_1", "token_2"))
+        self.auth_service._background_refresh.result(5)
+
+        self.assertEqual(self.auth_service.get_current_token(), "token_2")
+        self.assertEqual(len(self.token_requests()), 2)
+
+    def test_expired_token_is_refreshed_inline(self):
+        self.auth_service.refresh_token_if_needed()
+        self.clock.now += 4000
+
+        self.auth_service.refresh_token_if_needed()
+
+        self.assertEqual(self.auth_service.get_current_token(), "token_2")
+
+    @patch('jwt.decode')
+    def test_expiry_falls_back_to_unverified_claim(self, mock_decode):
+        mock_decode.return_value = {'exp': 2000}
+        self.mock_post.side_effect = None
+        self.mock_post.return_value = self.token_response("token_1", expires_in=None)
+
+        self.auth_service.refresh_token_if_needed()
+
+        self.assertEqual(self.auth_service.get_token_expiry(), 2000)
+        mock_decode.assert_called_once_with("token_1", options={"verify_signature": False})
+
+
 if __name__ == '__main__':
     unittest.main()
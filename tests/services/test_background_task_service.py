@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import unittest
+
+from app.services.background_task_service import BackgroundTaskService
+from app.utils.util_background_loop import BackgroundEventLoop
+
+
+class TestBackgroundTaskService(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-loop")
+        self.service = BackgroundTaskService(concurrency=2, max_queue_size=1, event_loop=self.event_loop)
+
+    def tearDown(self):
+        self.event_loop.stop()
+
+    def wait_for(self, condition, timeout=2):
+        done = threading.Event()
+        for _ in range(int(timeout / 0.01)):
+            if condition():
+                return True
+            done.wait(0.01)
+        return condition()
+
+    def test_submit_runs_task_in_background(self):
+        finished = threading.Event()
+        received = []
+
+        async def task(value, extra=None):
+            received.append((value, extra))
+            finished.set()
+
+        self.assertTrue(self.service.submit(task, "value", extra="extra"))
+        self.assertTrue(finished.wait(2))
+        self.assertEqual(received, [("value", "extra")])
+        self.assertTrue(self.wait_for(lambda: self.service.stats()["processed"] == 1))
+
+    def test_concurrency_is_bounded_and_queue_depth_is_reported(self):
+        release = threading.Event()
+
+        async def blocking_task():
+            while not release.is_set():
+                await asyncio.sleep(0.01)
+
+        self.assertTrue(self.service.submit(blocking_task))
+        self.assertTrue(self.service.submit(blocking_task))
+        self.assertTrue(self.wait_for(lambda: self.service.stats()["active"] == 2))
+
+        self.assertTrue(self.service.submit(blocking_task))
+        self.assertEqual(self.service.queue_depth(), 1)
+        self.assertFalse(self.service.submit(blocking_task))
+        self.assertEqual(self.service.stats()["rejected"], 1)
+
+        release.set()
+        self.assertTrue(self.wait_for(lambda: self.service.stats()["processed"] == 3))
+        self.assertEqual(self.service.queue_depth(), 0)
+
+    def test_failed_task_is_counted(self):
+        async def failing_task():
+            raise ValueError("boom")
+
+        self.assertTrue(self.service.submit(failing_task))
+        self.assertTrue(self.wait_for(lambda: self.service.stats()["failed"] == 1))
+        self.assertEqual(self.service.stats()["active"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+from app.services.embedding_batch_service import MicroBatchingEmbeddings
+from app.utils.util_background_loop import BackgroundEventLoop
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+        self.error = None
+
+    async def aembed_documents(self, texts):
+        self.calls.append(list(texts))
+        if self.error:
+            raise self.error
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class TestMicroBatchingEmbeddings(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-embedding-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.embeddings = FakeEmbeddings()
+        self.batcher = MicroBatchingEmbeddings(
+            self.embeddings, max_batch_size=3, max_delay=0.05, event_loop=self.event_loop
+        )
+
+    async def test_concurrent_queries_share_one_call(self):
+        vectors = await asyncio.gather(
+            self.batcher.aembed_query("a"), self.batcher.aembed_query("bb")
+        )
+
+        self.assertEqual(vectors, [[1.0, 1.0], [2.0, 1.0]])
+        self.assertEqual(self.embeddings.calls, [["a", "bb"]])
+        self.assertEqual(self.batcher.stats()["batch_sizes"], {2: 1})
+
+    async def test_full_batch_is_sent_without_waiting(self):
+        self.batcher.max_delay = 60
+
+        vectors = await asyncio.wait_for(asyncio.gather(
+            *(self.batcher.aembed_query(text) for text in ("a", "bb", "ccc"))
+        ), timeout=5)
+
+        self.assertEqual(len(vectors), 3)
+        self.assertEqual(self.embeddings.calls, [["a", "bb", "ccc"]])
+
+    async def test_identical_texts_are_embedded_once(self):
+        vectors = await asyncio.gather(
+            self.batcher.aembed_query("same"), self.batcher.aembed_query("same")
+        )
+
+        self.assertEqual(vectors[0], vectors[1])
+        self.assertEqual(self.embeddings.calls, [["same"]])
+        stats = self.batcher.stats()
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["embedded_texts"], 1)
+
+    async def test_failure_is_raised_to_every_caller(self):
+        self.embeddings.error = RuntimeError("429")
+
+        results = await asyncio.gather(
+            self.batcher.aembed_query("a"), self.batcher.aembed_query("b"), return_exceptions=True
+        )
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    def test_sync_calls_are_delegated(self):
+        embeddings = MagicMock()
+        embeddings.embed_query.return_value = [0.1]
+        batcher = MicroBatchingEmbeddings(embeddings, event_loop=self.event_loop)
+
+        self.assertEqual(batcher.embed_query("a"), [0.1])
+
+
+if __name__ == '__main__':
+    unittest.main()
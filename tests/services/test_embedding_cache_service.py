@@ -0,0 +1,135 @@
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from langchain_core.documents import Document
+
+from app.services import sharepoint_service
+from app.services.embedding_cache_service import DiskEmbeddingStore, EmbeddingCacheService
+from tests.util import FakeClock
+
+
+class TestDiskEmbeddingStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_vectors_survive_reopening(self):
+        store = DiskEmbeddingStore(self.directory.name, capacity=4)
+        store.put("a", [1.0, 2.0])
+        store.put("b", [3.0, 4.0])
+        store.flush()
+
+        reopened = DiskEmbeddingStore(self.directory.name, capacity=4)
+
+        self.assertEqual(reopened.get("a").tolist(), [1.0, 2.0])
+        self.assertEqual(reopened.get("b").tolist(), [3.0, 4.0])
+        self.assertIsNone(reopened.get("c"))
+
+    def test_oldest_rows_are_reused_when_full(self):
+        store = DiskEmbeddingStore(self.directory.name, capacity=2)
+        for key, value in (("a", 1.0), ("b", 2.0), ("c", 3.0)):
+            store.put(key, [value, value])
+        store.flush()
+
+        reopened = DiskEmbeddingStore(self.directory.name, capacity=2)
+
+        self.assertIsNone(reopened.get("a"))
+        self.assertEqual(reopened.get("c").tolist(), [3.0, 3.0])
+        self.assertEqual(len(reopened), 2)
+        reopened.put("d", [4.0, 4.0])
+        self.assertIsNone(reopened.get("b"))
+
+    def test_key_log_is_compacted(self):
+        store = DiskEmbeddingStore(self.directory.name, capacity=2)
+        for index in range(20):
+            store.put(str(index), [float(index)])
+        store.flush()
+
+        with open(f"{self.directory.name}/embeddings.keys") as keys_file:
+            self.assertLessEqual(len(keys_file.readlines()), 8)
+        reopened = DiskEmbeddingStore(self.directory.name, capacity=2)
+        self.assertEqual(reopened.get("19").tolist(), [19.0])
+        reopened.put("20", [20.0])
+        self.assertIsNone(reopened.get("18"))
+
+    def test_keys_are_buffered_until_the_flush_interval(self):
+        clock = FakeClock()
+        store = DiskEmbeddingStore(self.directory.name, capacity=4, flush_interval=5, clock=clock)
+        store.put("a", [1.0, 2.0])
+        store.put("b", [3.0, 4.0])
+
+        self.assertEqual(len(DiskEmbeddingStore(self.directory.name, capacity=4)), 0)
+        self.assertEqual(store.get("b").tolist(), [3.0, 4.0])
+
+        clock.now += 5
+        store.put("c", [5.0, 6.0])
+
+        reopened = DiskEmbeddingStore(self.directory.name, capacity=4)
+        self.assertEqual(reopened.get("c").tolist(), [5.0, 6.0])
+        self.assertEqual(len(reopened), 3)
+
+
+class TestEmbeddingCacheService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.embeddings = MagicMock()
+        self.embeddings.aembed_query = AsyncMock(return_value=[0.5, 0.25])
+
+    async def test_repeated_query_is_embedded_once(self):
+        cache = EmbeddingCacheService(self.embeddings, namespace="embedding-large")
+
+        first = await cache.aembed_query("reset password")
+        second = await cache.aembed_query("reset password")
+
+        self.assertEqual(first, [0.5, 0.25])
+        self.assertEqual(second, first)
+        self.embeddings.aembed_query.assert_awaited_once_with("reset password")
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+
+    async def test_disk_store_is_used_after_restart(self):
+        cache = EmbeddingCacheService(self.embeddings, disk_store=DiskEmbeddingStore(self.directory.name))
+        await cache.aembed_query("reset password")
+        cache.shutdown()
+
+        restarted = EmbeddingCacheService(self.embeddings, disk_store=DiskEmbeddingStore(self.directory.name))
+        vector = await restarted.aembed_query("reset password")
+
+        self.assertEqual(vector, [0.5, 0.25])
+        self.embeddings.aembed_query.assert_awaited_once()
+        self.assertEqual(restarted.stats()["disk_hits"], 1)
+
+    async def test_namespaces_do_not_share_vectors(self):
+        self.assertNotEqual(EmbeddingCacheService(self.embeddings, namespace="small").make_key("hi"),
+                            EmbeddingCacheService(self.embeddings, namespace="large").make_key("hi"))
+
+
+class TestMultiIndexRetrieval(unittest.IsolatedAsyncioTestCase):
+
+    async def test_query_is_embedded_once_for_all_indexes(self):
+        services = MagicMock()
+        services.embedding_cache.aembed_query = AsyncMock(return_value=[0.5, 0.25])
+        services.search_index_catalog.get_indexes = AsyncMock(return_value={"dev": {}, "dev-common": {}})
+        vector_store = MagicMock()
+        vector_store.content_semantic_hybrid_search_with_score_and_rerank = AsyncMock(return_value=[
+            Document(page_content="content", metadata={"source": "doc", "score": 2.0})
+        ])
+
+        with patch.object(sharepoint_service, "services", services), \
+                patch.object(sharepoint_service, "set_vector_store", return_value=vector_store):
+            documents = await sharepoint_service.semantic_logic_multi_index_retrieval(
+                query="reset password", data_sources=["dev", "dev-common"], upload_index=True
+            )
+
+        services.embedding_cache.aembed_query.assert_awaited_once_with("reset password")
+        calls = vector_store.content_semantic_hybrid_search_with_score_and_rerank.await_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(all(call.kwargs["vector"] == [0.5, 0.25] for call in calls))
+        self.assertEqual(len(documents), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.services.http_session_service import PooledHttpSession
+from app.utils.util_background_loop import BackgroundEventLoop
+
+
+class TestPooledHttpSession(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-http-session-loop")
+        self.addCleanup(self.event_loop.stop)
+        app = web.Application()
+        app.router.add_post("/v3/conversations/{conversation_id}/activities", self.post_activity)
+        app.router.add_get("/missing", self.missing)
+        self.server = TestServer(app)
+        self.event_loop.submit(self.server.start_server()).result(5)
+        self.addCleanup(lambda: self.event_loop.submit(self.server.close()).result(5))
+        self.http_session = PooledHttpSession(limit_per_host=4, event_loop=self.event_loop)
+        self.addCleanup(self.http_session.shutdown)
+        self.origin = str(self.server.make_url("/").origin())
+
+    async def post_activity(self, request):
+        return web.json_response({"id": request.match_info["conversation_id"]})
+
+    async def missing(self, request):
+        return web.Response(status=404)
+
+    def post(self, conversation_id):
+        async def request(session):
+            async with session.post(self.server.make_url(f"/v3/conversations/{conversation_id}/activities"), json={}) as response:
+                response.raise_for_status()
+                return (await response.json())["id"]
+
+        return self.http_session.run(request)
+
+    async def test_sequential_requests_reuse_the_connection(self):
+        for conversation_id in ("a", "b", "c"):
+            self.assertEqual(await self.post(conversation_id), conversation_id)
+
+        stats = self.http_session.stats()["origins"][self.origin]
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["new_connections"], 1)
+        self.assertEqual(stats["reused_connections"], 2)
+        self.assertGreater(stats["avg_latency_ms"], 0)
+
+    async def test_session_is_shared_across_caller_loops(self):
+        await self.post("a")
+        session = self.http_session._session
+
+        await asyncio.to_thread(asyncio.run, self.post("b"))
+
+        self.assertIs(self.http_session._session, session)
+        self.assertEqual(self.http_session.stats()["origins"][self.origin]["reused_connections"], 1)
+
+    async def test_error_responses_are_counted(self):
+        async def request(session):
+            async with session.get(self.server.make_url("/missing")) as response:
+                return response.status
+
+        self.assertEqual(await self.http_session.run(request), 404)
+        self.assertEqual(self.http_session.stats()["origins"][self.origin]["errors"], 1)
+
+    async def test_shutdown_closes_the_session(self):
+        await self.post("a")
+        session = self.http_session._session
+
+        await asyncio.to_thread(self.http_session.shutdown)
+
+        self.assertTrue(session.closed)
+        self.assertIsNone(self.http_session._session)
+
+
+if __name__ == '__main__':
+    unittest.main()
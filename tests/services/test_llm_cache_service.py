@@ -0,0 +1,139 @@
+import itertools
+import unittest
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+from app.services.llm_cache_service import (
+    InMemoryLLMCacheBackend,
+    chain_version,
+    LLMCacheService,
+    SQLiteLLMCacheBackend,
+    parse_chain_ttls,
+)
+from tests.util import FakeClock
+
+
+class LLMCacheServiceTests:
+    """Shared cases run against every backend."""
+
+    def create_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.cache = LLMCacheService(
+            self.create_backend(), {"route_question": 60, "rephrase_query": 10}, max_entries=2, clock=self.clock
+        )
+
+    def test_identical_input_hits(self):
+        self.cache.set("route_question", {"rephrased_query": "reset password"}, {"datasource": "vectorstore"})
+
+        self.assertEqual(self.cache.get("route_question", {"rephrased_query": "reset password"}),
+                         {"datasource": "vectorstore"})
+        self.assertIsNone(self.cache.get("route_question", {"rephrased_query": "reset pin"}))
+        self.assertEqual(self.cache.stats()["chains"]["route_question"],
+                         {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_chains_do_not_share_entries(self):
+        self.cache.set("route_question", {"raw_query": "hi"}, {"datasource": "web_search"})
+
+        self.assertIsNone(self.cache.get("rephrase_query", {"raw_query": "hi"}))
+
+    def test_chain_versions_do_not_share_entries(self):
+        self.cache.set("route_question", {"raw_query": "hi"}, {"datasource": "web_search"}, version="old-prompt")
+
+        self.assertIsNone(self.cache.get("route_question", {"raw_query": "hi"}, version="new-prompt"))
+        self.assertEqual(self.cache.get("route_question", {"raw_query": "hi"}, version="old-prompt"),
+                         {"datasource": "web_search"})
+
+    def test_entries_expire_after_chain_ttl(self):
+        self.cache.set("rephrase_query", {"raw_query": "hi"}, {"output": "hi"})
+        self.clock.now += 11
+
+        self.assertIsNone(self.cache.get("rephrase_query", {"raw_query": "hi"}))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_unconfigured_chain_is_not_cached(self):
+        self.cache.set("web_based_answer", {"raw_query": "hi"}, "hello")
+
+        self.assertFalse(self.cache.is_cached_chain("web_based_answer"))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_size_is_bounded(self):
+        for query in ("a", "b", "c"):
+            self.cache.set("route_question", {"rephrased_query": query}, {"datasource": "vectorstore"})
+
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertIsNone(self.cache.get("route_question", {"rephrased_query": "a"}))
+
+
+class TestInMemoryLLMCache(LLMCacheServiceTests, unittest.TestCase):
+
+    def create_backend(self):
+        return InMemoryLLMCacheBackend()
+
+
+class TestSQLiteLLMCache(LLMCacheServiceTests, unittest.TestCase):
+
+    def create_backend(self):
+        return SQLiteLLMCacheBackend(":memory:")
+
+    def test_hits_do_not_write_to_the_database(self):
+        self.cache.set("route_question", {"rephrased_query": "a"}, {"datasource": "vectorstore"})
+        statements = []
+        self.cache.backend._connection.set_trace_callback(statements.append)
+
+        self.cache.get("route_question", {"rephrased_query": "a"})
+
+        self.assertEqual([statement.split()[0] for statement in statements], ["SELECT"])
+
+    def test_access_times_are_written_before_eviction(self):
+        with patch("app.services.llm_cache_service.time.time", side_effect=itertools.count(1)):
+            for query in ("a", "b"):
+                self.cache.set("route_question", {"rephrased_query": query}, {"datasource": "vectorstore"})
+            self.cache.get("route_question", {"rephrased_query": "a"})
+            self.cache.set("route_question", {"rephrased_query": "c"}, {"datasource": "vectorstore"})
+
+        self.assertIsNotNone(self.cache.get("route_question", {"rephrased_query": "a"}))
+        self.assertIsNone(self.cache.get("route_question", {"rephrased_query": "b"}))
+
+    def test_shutdown_writes_access_times(self):
+        self.cache.set("route_question", {"rephrased_query": "a"}, {"datasource": "vectorstore"})
+        with patch("app.services.llm_cache_service.time.time", return_value=5000.0):
+            self.cache.get("route_question", {"rephrased_query": "a"})
+
+        self.cache.shutdown()
+
+        last_accessed = self.cache.backend._connection.execute("SELECT last_accessed FROM llm_cache").fetchone()[0]
+        self.assertEqual(last_accessed, 5000.0)
+
+
+class TestChainVersion(unittest.TestCase):
+
+    @staticmethod
+    def make_chain(template, model):
+        llm = FakeListChatModel(responses=["ok"])
+        # FakeListChatModel has no deployment; set the field the Azure client carries
+        object.__setattr__(llm, "deployment_name", model)
+        return PromptTemplate.from_template(template) | llm | StrOutputParser()
+
+    def test_version_changes_with_prompt_and_model(self):
+        version = chain_version(self.make_chain("Route {query}", "gpt-4o"))
+
+        self.assertEqual(version, chain_version(self.make_chain("Route {query}", "gpt-4o")))
+        self.assertNotEqual(version, chain_version(self.make_chain("Route the query {query}", "gpt-4o")))
+        self.assertNotEqual(version, chain_version(self.make_chain("Route {query}", "gpt-4o-2024-08-06")))
+
+
+class TestParseChainTtls(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_chain_ttls("rephrase_query=600, route_question=3600,"),
+                         {"rephrase_query": 600, "route_question": 3600})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from app.services.message_stream_service import ThrottledMessageUpdater
+from tests.util import FakeClock
+
+
+class TestThrottledMessageUpdater(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.send_update = AsyncMock()
+        self.updater = ThrottledMessageUpdater(self.send_update, min_interval=1.0, min_chars=5, clock=self.clock)
+
+    async def test_first_update_is_sent_immediately(self):
+        await self.updater.push("Hello world")
+        await self.updater.close()
+
+        self.send_update.assert_awaited_once_with("Hello world")
+
+    async def test_updates_are_throttled_by_interval_and_size(self):
+        await self.updater.push("Hello world")
+        await asyncio.sleep(0)
+        await self.updater.push("Hello world, how")
+        self.clock.now = 0.5
+        await self.updater.push("Hello world, how are")
+        self.clock.now = 1.5
+        await self.updater.push("Hello world, how are y")
+        await self.updater.push("Hello world, how are you")
+        await self.updater.close()
+
+        self.assertEqual([call.args[0] for call in self.send_update.await_args_list],
+                         ["Hello world", "Hello world, how are y"])
+
+    async def test_text_is_coalesced_while_an_update_is_in_flight(self):
+        release = asyncio.Event()
+
+        async def slow_send(text):
+            await release.wait()
+
+        self.updater.send_update = AsyncMock(side_effect=slow_send)
+        await self.updater.push("Hello world")
+        self.clock.now = 5
+        await self.updater.push("Hello world, how are you")
+        release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.clock.now = 10
+        await self.updater.push("Hello world, how are you doing")
+        await self.updater.close()
+
+        self.assertEqual([call.args[0] for call in self.updater.send_update.await_args_list],
+                         ["Hello world", "Hello world, how are you doing"])
+
+    async def test_no_updates_after_close(self):
+        await self.updater.close()
+        await self.updater.push("Hello world")
+
+        self.send_update.assert_not_awaited()
+
+    async def test_failed_update_disables_streaming(self):
+        self.send_update.side_effect = RuntimeError("429")
+        await self.updater.push("Hello world")
+        await asyncio.sleep(0)
+        self.clock.now = 5
+        await self.updater.push("Hello world, how are you")
+        await self.updater.close()
+
+        self.send_update.assert_awaited_once()
+        self.assertEqual(self.updater.updates_sent, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
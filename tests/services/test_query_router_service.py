@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from app.services.query_router_service import LocalQueryRouter, hash_features, save_router_model, train_centroids
+
+TRAINING_QUERIES = [
+    ("What is the travel expense policy?", "vectorstore"),
+    ("How many vacation days do employees get?", "vectorstore"),
+    ("Who approves travel expenses in SAP?", "vectorstore"),
+    ("What is the policy for home office equipment?", "vectorstore"),
+    ("Thank you so much for your help", "web_search"),
+    ("Thanks, have a great day", "web_search"),
+    ("Say thank you to the team for the great work", "web_search"),
+]
+
+
+class TestLocalQueryRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = LocalQueryRouter(train_centroids(TRAINING_QUERIES, dimensions=512), dimensions=512)
+
+    def test_rules_route_obvious_requests(self):
+        cases = {
+            "Draw a picture of a cat on a bike": "image_processing",
+            "Please generate an image of our headquarters": "image_processing",
+            "Remove the background of this image": "image_processing",
+            "Translate the travel policy into German": "web_search",
+            "Übersetze das bitte auf Englisch": "web_search",
+            "Can you translate this into French?": "web_search",
+            "Write an email to my team about the offsite": "web_search",
+        }
+        for query, route in cases.items():
+            self.assertEqual(self.router.classify(query), (route, "rules"), query)
+
+    def test_rules_ignore_questions_mentioning_a_request(self):
+        for query in (
+            "What is our translation vendor policy?",
+            "Who do I ask to translate contracts?",
+            "Draft a proposal for the new travel policy",
+            "Write a message to HR about my parental leave",
+        ):
+            self.assertNotEqual(LocalQueryRouter().classify(query)[1], "rules", query)
+
+    def test_classifier_routes_queries_close_to_a_centroid(self):
+        self.assertEqual(self.router.classify("What is the expense policy for travel?"), ("vectorstore", "classifier"))
+        self.assertEqual(self.router.classify("Thank you for the help"), ("web_search", "classifier"))
+
+    def test_unclear_queries_fall_back_to_the_llm(self):
+        self.assertIsNone(self.router.route("Kirill Smorchkov"))
+
+        stats = self.router.stats()
+        self.assertEqual((stats["requests"], stats["fallback"], stats["local_rate"]), (1, 1, 0.0))
+
+    def test_router_without_model_only_uses_rules(self):
+        router = LocalQueryRouter()
+
+        self.assertEqual(router.route("Draw a cat"), "image_processing")
+        self.assertIsNone(router.route("What is the travel expense policy?"))
+
+    def test_saved_model_routes_like_the_trained_one(self):
+        path = os.path.join(tempfile.mkdtemp(), "model.json")
+        save_router_model(path, train_centroids(TRAINING_QUERIES, dimensions=512), 512)
+
+        router = LocalQueryRouter.from_file(path)
+
+        self.assertEqual(router.routes, self.router.routes)
+        self.assertEqual(router.classify("Thanks a lot"), self.router.classify("Thanks a lot"))
+
+    def test_features_are_stable_and_normalised(self):
+        features = hash_features("Travel  expense POLICY", 256)
+
+        np.testing.assert_array_equal(features, hash_features("travel expense policy", 256))
+        self.assertAlmostEqual(float(np.linalg.norm(features)), 1.0, places=5)
+        self.assertFalse(hash_features("", 256).any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.search_client_pool_service import SearchClientPool
+from app.services.sharepoint_service import CustomAzureSearch
+from app.utils.util_background_loop import BackgroundEventLoop
+
+
+class FakeResults:
+    def __init__(self, results):
+        self._results = list(results)
+
+    async def get_answers(self):
+        return []
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for result in self._results:
+            yield result
+
+
+class FakeSearchClient:
+    def __init__(self, index_name):
+        self.index_name = index_name
+        self.loops = []
+        self.search_kwargs = []
+        self.close = AsyncMock()
+
+    async def search(self, **kwargs):
+        self.loops.append(asyncio.get_running_loop())
+        self.search_kwargs.append(kwargs)
+        return FakeResults([
+            {"content": "Reset it in the portal.", "header": "Password", "filename": "guide.pdf",
+             "url": "https://sharepoint/guide.pdf", "@search.reranker_score": 2.5},
+        ])
+
+
+class TestSearchClientPool(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-search-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.clients = []
+        self.pool = SearchClientPool("https://search", "key", event_loop=self.event_loop,
+                                     client_factory=self.create_client)
+
+    def create_client(self, index_name):
+        client = FakeSearchClient(index_name)
+        self.clients.append(client)
+        return client
+
+    def create_vector_store(self, index_name):
+        return CustomAzureSearch(
+            azure_search_endpoint="https://search",
+            azure_search_key="key",
+            content_index_name=index_name,
+            embedding_function=MagicMock(),
+            select_fields=["content", "header", "filename", "url"],
+            search_client_pool=self.pool,
+        )
+
+    async def test_client_is_reused_across_searches(self):
+        for _ in range(3):
+            documents = await self.create_vector_store("dev").content_semantic_hybrid_search_with_score_and_rerank(
+                query="reset password", vector=[0.1, 0.2]
+            )
+
+        self.assertEqual(len(self.clients), 1)
+        self.assertEqual(self.pool.stats(), {"clients": 1, "searches": {"dev": 3}})
+        self.assertEqual(documents[0].metadata, {"source": "guide.pdf", "url": "https://sharepoint/guide.pdf", "score": 2.5})
+
+    async def test_searches_run_on_the_background_loop_with_selected_fields(self):
+        await self.create_vector_store("dev").content_semantic_hybrid_search_with_score_and_rerank(
+            query="reset password", vector=[0.1, 0.2]
+        )
+
+        client = self.clients[0]
+        self.assertIs(client.loops[0], self.event_loop.loop)
+        self.assertEqual(client.search_kwargs[0]["select"], ["content", "header", "filename", "url"])
+        self.assertEqual(client.search_kwargs[0]["scoring_profile"], None)
+
+    async def test_shutdown_closes_every_client(self):
+        await self.create_vector_store("dev").content_semantic_hybrid_search_with_score_and_rerank(vector=[0.1])
+        await self.create_vector_store("hr").content_semantic_hybrid_search_with_score_and_rerank(vector=[0.1])
+
+        await asyncio.to_thread(self.pool.shutdown)
+
+        for client in self.clients:
+            client.close.assert_awaited_once()
+        self.assertEqual(self.pool.stats()["clients"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+from azure.search.documents.indexes.models import (
+    ScoringProfile,
+    SearchIndex,
+    SemanticConfiguration,
+    SemanticPrioritizedFields,
+    SemanticSearch,
+    SimpleField,
+)
+
+from app.services import sharepoint_service
+from app.services.search_index_catalog_service import SearchIndexCatalog, describe_index
+from app.utils.util_background_loop import BackgroundEventLoop
+from tests.util import FakeClock
+
+
+def make_index(name, scoring_profiles=(), semantic_configurations=(), default_semantic_configuration=None):
+    return SearchIndex(
+        name=name,
+        fields=[SimpleField(name="id", type="Edm.String", key=True)],
+        scoring_profiles=[ScoringProfile(name=profile) for profile in scoring_profiles],
+        semantic_search=SemanticSearch(
+            default_configuration_name=default_semantic_configuration,
+            configurations=[
+                SemanticConfiguration(name=configuration, prioritized_fields=SemanticPrioritizedFields())
+                for configuration in semantic_configurations
+            ],
+        ),
+    )
+
+
+class FakeIndexClient:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def list_indexes(self):
+        self.owner.calls += 1
+        await asyncio.sleep(0.01)
+        if self.owner.error:
+            raise self.owner.error
+        for index in self.owner.indexes:
+            yield index
+
+
+class FakeIndexService:
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.calls = 0
+        self.error = None
+
+    def __call__(self):
+        return FakeIndexClient(self)
+
+
+class TestDescribeIndex(unittest.TestCase):
+
+    def test_settings_named_after_the_index_are_preferred(self):
+        index = make_index("dev", ["dev-score", "other"], ["other", "dev"], "other")
+
+        self.assertEqual(describe_index(index), {
+            "name": "dev", "scoring_profile": "dev-score", "semantic_configuration": "dev", "fields": ["id"],
+        })
+
+    def test_defaults_are_used_otherwise(self):
+        index = make_index("dev", ["other"], ["other"], "other")
+
+        description = describe_index(index)
+
+        self.assertIsNone(description["scoring_profile"])
+        self.assertEqual(description["semantic_configuration"], "other")
+
+
+class TestSearchIndexCatalog(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-catalog-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.service = FakeIndexService([make_index("dev", ["dev-score"], ["dev"])])
+        self.clock = FakeClock()
+        self.catalog = SearchIndexCatalog("https://search", "key", ttl_seconds=60, retry_seconds=10,
+                                          event_loop=self.event_loop, index_client_factory=self.service,
+                                          clock=self.clock)
+
+    async def wait_for_refreshes(self, count):
+        for _ in range(100):
+            if self.catalog.refresh_count + self.catalog.failed_refresh_count >= count:
+                return
+            await asyncio.sleep(0.01)
+        self.fail("refresh did not complete")
+
+    async def test_concurrent_first_calls_share_one_load(self):
+        results = await asyncio.gather(self.catalog.get_indexes(), self.catalog.get_indexes())
+
+        self.assertEqual(list(results[0]), ["dev"])
+        self.assertEqual(self.service.calls, 1)
+
+    async def test_fresh_catalog_is_served_from_cache(self):
+        await self.catalog.get_indexes()
+        self.clock.now = 30
+        await self.catalog.get_indexes()
+
+        self.assertEqual(self.service.calls, 1)
+
+    async def test_stale_catalog_is_served_while_revalidating(self):
+        await self.catalog.get_indexes()
+        self.service.indexes = [make_index("dev"), make_index("hr")]
+        self.clock.now = 61
+
+        stale = await self.catalog.get_indexes()
+        await self.wait_for_refreshes(2)
+
+        self.assertEqual(list(stale), ["dev"])
+        self.assertEqual(list(await self.catalog.get_indexes()), ["dev", "hr"])
+
+    async def test_failed_refresh_keeps_the_old_catalog(self):
+        await self.catalog.get_indexes()
+        self.service.error = RuntimeError("503")
+        self.clock.now = 61
+
+        await self.catalog.get_indexes()
+        await self.wait_for_refreshes(2)
+        indexes = await self.catalog.get_indexes()
+
+        self.assertEqual(list(indexes), ["dev"])
+        self.assertEqual(self.catalog.failed_refresh_count, 1)
+        self.assertEqual(self.service.calls, 2)
+
+    async def test_failed_first_load_raises(self):
+        self.service.error = RuntimeError("503")
+
+        with self.assertRaises(RuntimeError):
+            await self.catalog.get_indexes()
+
+
+@patch.object(sharepoint_service, "services", MagicMock())
+@patch.object(sharepoint_service, "AZURE_SEARCH_SERVICE_ENDPOINT", "https://search")
+@patch.object(sharepoint_service, "AZURE_SEARCH_ADMIN_KEY", "key")
+class TestSetVectorStore(unittest.TestCase):
+
+    def test_catalog_settings_are_used_for_search(self):
+        vector_store = sharepoint_service.set_vector_store(
+            "dev", index_metadata={"scoring_profile": None, "semantic_configuration": "default"}
+        )
+
+        self.assertIsNone(vector_store.scoring_profile)
+        self.assertEqual(vector_store.semantic_configuration_name, "default")
+
+    def test_settings_default_to_the_index_name(self):
+        vector_store = sharepoint_service.set_vector_store("dev")
+
+        self.assertEqual(vector_store.scoring_profile, "dev-score")
+        self.assertEqual(vector_store.semantic_configuration_name, "dev")
+
+
+if __name__ == '__main__':
+    unittest.main()
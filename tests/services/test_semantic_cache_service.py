@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app.services.semantic_cache_service import (
+    InMemorySemanticCacheBackend,
+    SemanticCacheService,
+    SQLiteSemanticCacheBackend,
+)
+from tests.util import FakeClock
+
+
+class SemanticCacheServiceTests:
+    """Shared cases run against every backend."""
+
+    def create_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.cache = SemanticCacheService(
+            self.create_backend(), similarity_threshold=0.9, ttl_seconds=60, max_entries=2, clock=self.clock
+        )
+
+    def test_similar_query_hits(self):
+        self.cache.store([1.0, 0.0, 0.0], "Reset it in the portal.", ["Password guide"], ["dev"])
+
+        cached = self.cache.lookup([0.99, 0.05, 0.0], ["dev", "dev-common"])
+
+        self.assertEqual(cached["answer"], "Reset it in the portal.")
+        self.assertEqual(cached["sources"], ["Password guide"])
+        self.assertGreater(cached["similarity"], 0.9)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_dissimilar_query_misses(self):
+        self.cache.store([1.0, 0.0, 0.0], "Reset it in the portal.", [], ["dev"])
+
+        self.assertIsNone(self.cache.lookup([0.0, 1.0, 0.0], ["dev"]))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_entry_from_disallowed_index_misses(self):
+        self.cache.store([1.0, 0.0, 0.0], "Reset it in the portal.", [], ["dev", "hr"])
+
+        self.assertIsNone(self.cache.lookup([1.0, 0.0, 0.0], ["dev"]))
+
+    def test_expired_entry_is_removed(self):
+        self.cache.store([1.0, 0.0, 0.0], "Reset it in the portal.", [], ["dev"])
+        self.clock.now += 61
+
+        self.assertIsNone(self.cache.lookup([1.0, 0.0, 0.0], ["dev"]))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.store([1.0, 0.0, 0.0], "first", [], ["dev"])
+        self.clock.now += 1
+        self.cache.store([0.0, 1.0, 0.0], "second", [], ["dev"])
+        self.clock.now += 1
+        self.cache.lookup([1.0, 0.0, 0.0], ["dev"])
+        self.clock.now += 1
+        self.cache.store([0.0, 0.0, 1.0], "third", [], ["dev"])
+
+        self.assertIsNone(self.cache.lookup([0.0, 1.0, 0.0], ["dev"]))
+        self.assertEqual(self.cache.lookup([1.0, 0.0, 0.0], ["dev"])["answer"], "first")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+
+class TestInMemorySemanticCache(SemanticCacheServiceTests, unittest.TestCase):
+
+    def create_backend(self):
+        return InMemorySemanticCacheBackend()
+
+
+class TestSQLiteSemanticCache(SemanticCacheServiceTests, unittest.TestCase):
+
+    def create_backend(self):
+        return SQLiteSemanticCacheBackend(":memory:")
+
+    def test_entries_are_loaded_from_the_database_at_startup(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "semantic_cache.db")
+        cache = SemanticCacheService(SQLiteSemanticCacheBackend(path), similarity_threshold=0.9, clock=self.clock)
+        cache.store([1.0, 0.0, 0.0], "Reset it in the portal.", [], ["dev"])
+
+        restarted = SemanticCacheService(SQLiteSemanticCacheBackend(path), similarity_threshold=0.9, clock=self.clock)
+
+        self.assertEqual(restarted.lookup([1.0, 0.0, 0.0], ["dev"])["answer"], "Reset it in the portal.")
+
+    def test_lookups_do_not_touch_the_database(self):
+        self.cache.store([1.0, 0.0, 0.0], "Reset it in the portal.", [], ["dev"])
+
+        with patch.object(self.cache.backend, "_connection") as connection:
+            self.cache.lookup([1.0, 0.0, 0.0], ["dev"])
+            self.cache.lookup([0.0, 1.0, 0.0], ["dev"])
+
+        connection.execute.assert_not_called()
+        connection.executemany.assert_not_called()
+        connection.commit.assert_not_called()
+
+    def test_access_times_of_hits_are_written_at_shutdown(self):
+        entry_id = self.cache.store([1.0, 0.0, 0.0], "Reset it in the portal.", [], ["dev"])
+        self.clock.now += 5
+        self.cache.lookup([1.0, 0.0, 0.0], ["dev"])
+
+        self.cache.shutdown()
+
+        stored = {entry["id"]: entry for entry in self.cache.backend.load()}
+        self.assertEqual(stored[entry_id]["last_accessed"], 1005.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
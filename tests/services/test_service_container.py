@@ -0,0 +1,82 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from app.services.service_container import ServiceContainer, services
+
+
+class TestServiceContainer(unittest.TestCase):
+
+    def setUp(self):
+        self.cosmos_factory = MagicMock(side_effect=lambda container: object())
+        self.auth_factory = MagicMock(side_effect=lambda container: ("auth", container.token_validation_service))
+        self.token_factory = MagicMock(side_effect=lambda container: "token_validation")
+        self.container = ServiceContainer({
+            "cosmos_service": self.cosmos_factory,
+            "authentication_service": self.auth_factory,
+            "token_validation_service": self.token_factory,
+        })
+
+    def test_services_are_created_lazily(self):
+        self.cosmos_factory.assert_not_called()
+        self.assertFalse(self.container.is_initialized("cosmos_service"))
+
+        self.container.cosmos_service
+
+        self.cosmos_factory.assert_called_once_with(self.container)
+        self.assertTrue(self.container.is_initialized("cosmos_service"))
+        self.auth_factory.assert_not_called()
+
+    def test_same_instance_is_shared(self):
+        self.assertIs(self.container.cosmos_service, self.container.get("cosmos_service"))
+        self.cosmos_factory.assert_called_once()
+
+    def test_dependencies_are_resolved_through_the_container(self):
+        self.assertEqual(self.container.authentication_service, ("auth", "token_validation"))
+        self.token_factory.assert_called_once()
+        self.container.token_validation_service
+        self.token_factory.assert_called_once()
+
+    def test_concurrent_access_builds_once(self):
+        threads = [threading.Thread(target=lambda: self.container.cosmos_service) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.cosmos_factory.assert_called_once()
+
+    def test_unknown_service_raises_attribute_error(self):
+        with self.assertRaises(AttributeError):
+            self.container.unknown_service
+
+    def test_register_overrides_factory(self):
+        replacement = MagicMock()
+        self.container.register("cosmos_service", replacement)
+        self.assertIs(self.container.cosmos_service, replacement)
+        self.cosmos_factory.assert_not_called()
+
+    def test_shutdown_stops_constructed_services(self):
+        service = MagicMock()
+        self.container.register("cosmos_service", service)
+        self.container.token_validation_service
+
+        self.container.shutdown()
+
+        service.shutdown.assert_called_once()
+        self.auth_factory.assert_not_called()
+
+    def test_initialize_reports_startup_time_per_service(self):
+        report = self.container.initialize()
+
+        self.assertEqual(set(report), {"cosmos_service", "authentication_service", "token_validation_service"})
+        self.assertTrue(all(elapsed_ms >= 0 for elapsed_ms in report.values()))
+
+    def test_default_container_registers_all_services(self):
+        for name in ("cosmos_service", "token_validation_service", "authentication_service", "user_validation_service",
+                     "team_messaging_service", "azure_blob_service", "openai_service", "dalle3_service",
+                     "llm_gpt4o", "llm_gpt4o_mini", "embeddings"):
+            self.assertIn(name, services._factories)
+
+
+if __name__ == '__main__':
+    unittest.main()
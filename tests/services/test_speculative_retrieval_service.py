@@ -0,0 +1,116 @@
+import asyncio
+import unittest
+
+from app.services.speculative_retrieval_service import SpeculativeRetrievalService, query_similarity
+from app.utils.util_background_loop import BackgroundEventLoop
+from tests.util import FakeClock
+
+
+class FakeRetriever:
+    def __init__(self, clock, duration=2.0):
+        self.clock = clock
+        self.duration = duration
+        self.calls = []
+        self.release = None
+        self.cancelled = False
+
+    async def __call__(self, query, data_sources):
+        self.calls.append((query, data_sources))
+        if self.release is not None:
+            try:
+                await self.release.wait()
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        self.clock.now += self.duration
+        return [f"doc for {query}"]
+
+
+class TestSpeculativeRetrievalService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-speculation-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.clock = FakeClock(100.0)
+        self.retriever = FakeRetriever(self.clock)
+        self.service = SpeculativeRetrievalService(
+            self.retriever, min_similarity=0.9, max_pending=2, ttl_seconds=60, event_loop=self.event_loop, clock=self.clock
+        )
+
+    async def test_matching_query_claims_the_speculative_documents(self):
+        speculation_id = self.service.start("  How do I reset   my password ", ["dev"])
+        await asyncio.sleep(0.05)
+        self.clock.now += 3
+
+        documents = await self.service.claim(speculation_id, "how do I reset my password?")
+
+        self.assertEqual(documents, ["doc for How do I reset my password"])
+        self.assertEqual(self.retriever.calls, [("How do I reset my password", ["dev"])])
+        stats = self.service.stats()
+        self.assertEqual((stats["hits"], stats["hit_rate"], stats["pending"]), (1, 1.0, 0))
+        # the retrieval had already finished, so its whole duration was saved
+        self.assertAlmostEqual(stats["saved_ms_total"], 2000.0)
+
+    async def test_saved_latency_is_capped_by_the_claim_time(self):
+        self.retriever.release = asyncio.Event()
+        speculation_id = self.service.start("reset password", ["dev"])
+        self.clock.now += 0.5
+
+        claim = asyncio.ensure_future(self.service.claim(speculation_id, "reset password"))
+        await asyncio.sleep(0.05)
+        self.event_loop.loop.call_soon_threadsafe(self.retriever.release.set)
+
+        self.assertEqual(await claim, ["doc for reset password"])
+        self.assertAlmostEqual(self.service.stats()["saved_ms_per_hit"], 500.0)
+
+    async def test_mismatching_query_is_cancelled(self):
+        self.retriever.release = asyncio.Event()
+        speculation_id = self.service.start("what about it", ["dev"])
+        await asyncio.sleep(0.05)
+
+        self.assertIsNone(await self.service.claim(speculation_id, "What is the travel expense policy for SAP?"))
+        await asyncio.sleep(0.05)
+
+        self.assertTrue(self.retriever.cancelled)
+        self.assertEqual(self.service.stats()["misses"], {"mismatch": 1})
+
+    async def test_discard_records_the_reason(self):
+        speculation_id = self.service.start("draw a cat", ["dev"])
+
+        self.service.discard(speculation_id, "route")
+        self.service.discard(speculation_id, "route")
+
+        stats = self.service.stats()
+        self.assertEqual((stats["misses"], stats["hit_rate"]), ({"route": 1}, 0.0))
+        self.assertIsNone(await self.service.claim(speculation_id, "draw a cat"))
+
+    async def test_failed_retrieval_is_a_miss(self):
+        async def failing_retrieve(query, data_sources):
+            raise RuntimeError("search unavailable")
+
+        self.service.retrieve = failing_retrieve
+        speculation_id = self.service.start("reset password", ["dev"])
+
+        self.assertIsNone(await self.service.claim(speculation_id, "reset password"))
+        self.assertEqual(self.service.stats()["misses"], {"failed": 1})
+
+    def test_pending_speculations_are_bounded_and_expire(self):
+        self.retriever.release = asyncio.Event()
+        self.assertIsNotNone(self.service.start("first", ["dev"]))
+        self.assertIsNotNone(self.service.start("second", ["dev"]))
+        self.assertIsNone(self.service.start("third", ["dev"]))
+
+        self.clock.now += 61
+
+        self.assertIsNotNone(self.service.start("fourth", ["dev"]))
+        stats = self.service.stats()
+        self.assertEqual((stats["started"], stats["skipped"], stats["pending"]), (3, 1, 1))
+        self.assertEqual(stats["misses"], {"expired": 2})
+
+    def test_query_similarity_ignores_case_and_whitespace(self):
+        self.assertEqual(query_similarity(" Reset  my PASSWORD", "reset my password"), 1.0)
+        self.assertLess(query_similarity("reset my password", "book a meeting room"), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,10 @@ import os
 import unittest
 from unittest import mock
 from unittest.mock import AsyncMock, patch, MagicMock
+from app.services.http_session_service import PooledHttpSession
 from app.services.team_messaging_service import TeamsMessagingService
+from app.utils.util_adaptive_cards import image_prompt as image_prompt_template, followup_prompt as followup_prompt_template
+from app.utils.util_background_loop import BackgroundEventLoop
 
 # Mock the utility functions imported from util_adaptive_cards
 spinning_wheel_adaptive_card_json = MagicMock()
@@ -17,7 +20,9 @@ image_prompt = MagicMock()
 class TestTeamsMessagingService(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.service = TeamsMessagingService()
+        self.event_loop = BackgroundEventLoop("test-teams-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.service = TeamsMessagingService(PooledHttpSession(event_loop=self.event_loop))
         self.service_url = "https://dummy_service_url"
         self.conversation_id = "dummy_conversation_id"
         self.jwt_token = "dummy_jwt_token"
@@ -28,22 +33,21 @@ class TestTeamsMessagingService(unittest.IsolatedAsyncioTestCase):
         self.description = "dummy_description"
         self.payload = {"type": "message", "text": self.message_text}
 
-    @patch('aiohttp.ClientSession')
-    async def test_send_message_success(self, MockClientSession):
+    async def test_send_message_success(self):
         # Arrange
         mock_session = MagicMock()
         mock_response = MagicMock()
         mock_response.json = AsyncMock(return_value={"id": "123"})
         mock_response.raise_for_status = MagicMock()
         mock_session.post.return_value.__aenter__.return_value = mock_response
-        MockClientSession.return_value.__aenter__.return_value = mock_session
 
         # Act
-        result = await self.service.send_message(self.service_url, self.conversation_id, self.jwt_token, self.payload)
+        with patch.object(self.service.http_session, 'get_session', return_value=mock_session) as mock_get_session:
+            result = await self.service.send_message(self.service_url, self.conversation_id, self.jwt_token, self.payload)
 
         # Assert
         self.assertEqual(result, "123")
-        MockClientSession.assert_called_once()
+        mock_get_session.assert_called_once()
         mock_session.post.assert_called_once_with(
             f"{self.service_url}/v3/conversations/{self.conversation_id}/activities",
             headers={"Authorization": f"Bearer {self.jwt_token}", "Content-Type": "application/json"},
@@ -208,20 +212,19 @@ class TestTeamsMessagingService(unittest.IsolatedAsyncioTestCase):
             }
         )
 
-    @patch('aiohttp.ClientSession')
-    async def test_delete_conversation_history_success(self, MockClientSession):
+    async def test_delete_conversation_history_success(self):
         # Arrange
         mock_session = MagicMock()
         mock_response = MagicMock()
         mock_response.raise_for_status = MagicMock()
         mock_session.delete.return_value.__aenter__.return_value = mock_response
-        MockClientSession.return_value.__aenter__.return_value = mock_session
 
         # Act
-        await self.service.delete_conversation_history(self.service_url, self.conversation_id, self.activity_id, self.jwt_token)
+        with patch.object(self.service.http_session, 'get_session', return_value=mock_session) as mock_get_session:
+            await self.service.delete_conversation_history(self.service_url, self.conversation_id, self.activity_id, self.jwt_token)
 
         # Assert
-        MockClientSession.assert_called_once()
+        mock_get_session.assert_called_once()
         mock_session.delete.assert_called_once_with(
             f"{self.service_url}/v3/conversations/{self.conversation_id}/activities/{self.activity_id}",
             headers={"Authorization": f"Bearer {self.jwt_token}"}
@@ -245,25 +248,11 @@ class TestTeamsMessagingService(unittest.IsolatedAsyncioTestCase):
             }
         )
 
-    @patch('app.services.team_messaging_service.image_prompt', new=image_prompt)
+    @patch.dict(os.environ, {"IMAGE_EXPIRY_MESSAGE": "expires soon"})
     @patch.object(TeamsMessagingService, 'update_message', new_callable=AsyncMock)
     async def test_send_image_card_response(self, mock_update_message):
         # Arrange
         mock_update_message.return_value = "message_id"
-        image_prompt["body"][0]["url"] = self.image_url
-        image_prompt["body"][1]["text"] = self.description
-        image_prompt["body"][2]["value"] = self.text
-        image_prompt["actions"][0]["url"] = self.image_url
-
-        payload = {
-            "type": "message",
-            "attachments": [
-                {
-                    "contentType": "application/vnd.microsoft.card.adaptive",
-                    "content": image_prompt,
-                }
-            ],
-        }
 
         # Act
         result = await self.service.send_image_card_response(
@@ -272,9 +261,26 @@ class TestTeamsMessagingService(unittest.IsolatedAsyncioTestCase):
 
         # Assert
         self.assertEqual(result, "message_id")
-        mock_update_message.assert_called_once_with(
-            self.service_url, self.conversation_id, self.activity_id, self.jwt_token, payload
-        )
+        payload = mock_update_message.call_args.args[4]
+        card = payload["attachments"][0]["content"]
+        self.assertEqual(card["body"][0]["items"][0]["url"], self.image_url)
+        self.assertEqual(card["body"][0]["items"][1]["value"], self.text)
+        self.assertEqual(card["body"][0]["items"][2]["columns"][1]["items"][0]["text"], "expires soon")
+        self.assertEqual(card["actions"][0]["url"], self.image_url)
+        self.assertNotEqual(image_prompt_template["actions"][0]["url"], self.image_url)
+
+    @patch.object(TeamsMessagingService, 'update_message', new_callable=AsyncMock)
+    async def test_followup_card_does_not_grow_across_calls(self, mock_update_message):
+        # Act
+        for questions in (["q1", "q2"], ["q3", "q4"], ["q5"]):
+            await self.service.send_followup_card_response(
+                self.service_url, self.conversation_id, self.activity_id, questions, self.jwt_token
+            )
+
+        # Assert
+        cards = [call.args[4]["attachments"][0]["content"] for call in mock_update_message.call_args_list]
+        self.assertEqual([[action["title"] for action in card["actions"]] for card in cards], [["q1", "q2"], ["q3", "q4"], ["q5"]])
+        self.assertEqual(followup_prompt_template["actions"], [])
 
 if __name__ == '__main__':
     unittest.main()
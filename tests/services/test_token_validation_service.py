@@ -1,53 +1,179 @@
+import asyncio
 import os
+import threading
 import unittest
 from unittest import mock
 from unittest.mock import patch, MagicMock
+import json
+import time
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
 from jwt.algorithms import RSAAlgorithm
-from app.services.token_validation_service import TokenValidationService
+from app.services.token_validation_service import BOT_FRAMEWORK_ISSUER, JWKSKeyStore, TokenValidationService
+from app.utils.util_background_loop import BackgroundEventLoop
+from tests.util import FakeClock
 
 
 class TestTokenValidationService(unittest.TestCase):
 
-    @patch('requests.get')
-    def test_fetch_azure_jkws_success(self, mock_get):
-        # Mocking the requests.get method
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {'keys': [{'kid': 'test_kid', 'kty': 'RSA', 'n': 'test_n', 'e': 'AQAB'}]}
-        mock_get.return_value = mock_response
-
-        # Setting up the test
+    def test_tenant_keys_come_from_the_tenant_jwks_endpoint(self):
         service = TokenValidationService(tenant_id='test_tenant_id')
-        jwks = service.fetch_azure_jkws()
 
-        # Assertions
-        self.assertIsNotNone(jwks)
-        self.assertIn('keys', jwks)
-        self.assertEqual(len(jwks['keys']), 1)
-        self.assertEqual(jwks['keys'][0]['kid'], 'test_kid')
+        self.assertEqual(service.tenant_key_store.jwks_url, "https://login.microsoftonline.com/test_tenant_id/discovery/v2.0/keys")
 
-    # def test_get_public_key_found(self):
-    #     # Setting up a mock JWKS and kid
-    #     mock_jwks = {'keys': [{'kid': 'test_kid', 'kty': 'RSA', 'n': 'test_n', 'e': 'AQAB'}]}
-    #     service = TokenValidationService(tenant_id='test_tenant_id')
+    def test_get_public_key_uses_the_tenant_key_store(self):
+        tenant_key_store = MagicMock()
+        tenant_key_store.get_key.side_effect = lambda kid: 'public_key' if kid == 'test_kid' else None
+        service = TokenValidationService(tenant_id='test_tenant_id', tenant_key_store=tenant_key_store)
 
-    #     # Calling the method
-    #     public_key = service.get_public_key(mock_jwks, 'test_kid')
+        self.assertEqual(service.get_public_key('test_kid'), 'public_key')
+        self.assertIsNone(service.get_public_key('non_existent_kid'))
 
-    #     # Assertions
-    #     self.assertIsInstance(public_key, RSAAlgorithm)
-    #     self.assertEqual(public_key.kid, 'test_kid')
+    def test_prefetch_keys_prefetches_both_key_stores(self):
+        tenant_key_store, bot_framework_key_store = MagicMock(), MagicMock()
+        service = TokenValidationService('test_tenant_id', bot_framework_key_store=bot_framework_key_store,
+                                         tenant_key_store=tenant_key_store)
 
-    def test_get_public_key_not_found(self):
-        # Setting up a mock JWKS and a non-existent kid
-        mock_jwks = {'keys': [{'kid': 'test_kid', 'kty': 'RSA', 'n': 'test_n', 'e': 'AQAB'}]}
-        service = TokenValidationService(tenant_id='test_tenant_id')
+        service.prefetch_keys()
+
+        tenant_key_store.prefetch.assert_called_once_with()
+        bot_framework_key_store.prefetch.assert_called_once_with()
+
+
+def make_signing_key(kid, endorsements=None):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk["kid"] = kid
+    if endorsements is not None:
+        jwk["endorsements"] = endorsements
+    return private_key, jwk
+
+
+class TestJWKSKeyStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key_1, cls.jwk_1 = make_signing_key("kid_1")
+        cls.private_key_2, cls.jwk_2 = make_signing_key("kid_2")
+
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.event_loop = BackgroundEventLoop("test-jwks-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.key_store = JWKSKeyStore("https://keys", refresh_interval=3600, min_refetch_interval=60,
+                                      event_loop=self.event_loop, clock=self.clock)
+        self.published = {"keys": [self.jwk_1]}
+        self.key_store.fetch_jwks = MagicMock(side_effect=lambda: self.published)
+
+    def test_keys_are_fetched_once_and_indexed_by_kid(self):
+        key = self.key_store.get_key("kid_1")
+        self.assertIs(self.key_store.get_key("kid_1"), key)
+
+        self.assertEqual(self.key_store.fetch_jwks.call_count, 1)
+        self.assertEqual(key.public_numbers(), self.private_key_1.public_key().public_numbers())
+
+    def test_unknown_kid_refetches_after_rotation(self):
+        self.key_store.get_key("kid_1")
+        self.published = {"keys": [self.jwk_1, self.jwk_2]}
+        self.clock.now += 61
+
+        self.assertIsNotNone(self.key_store.get_key("kid_2"))
+        self.assertEqual(self.key_store.fetch_jwks.call_count, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        self.key_store.get_key("kid_1")
+
+        for _ in range(5):
+            self.assertIsNone(self.key_store.get_key("made_up_kid"))
+
+        self.assertEqual(self.key_store.fetch_jwks.call_count, 1)
+        self.assertEqual(self.key_store.stats()["unknown_kids"], 6)
+
+    def test_stale_keys_are_served_while_refreshing_in_background(self):
+        key = self.key_store.get_key("kid_1")
+        self.clock.now += 3601
+
+        self.assertIs(self.key_store.get_key("kid_1"), key)
+        self.key_store._background_refresh.result(5)
+
+        self.assertEqual(self.key_store.fetch_jwks.call_count, 2)
+
+    def test_prefetch_loads_the_keys_in_the_background(self):
+        self.key_store.prefetch()
+        self.key_store._background_refresh.result(5)
+
+        self.assertIsNotNone(self.key_store.get_key("kid_1"))
+        self.assertEqual(self.key_store.fetch_jwks.call_count, 1)
+
+    def test_unknown_kid_is_refetched_off_the_event_loop(self):
+        fetch_threads = []
+        self.key_store.fetch_jwks.side_effect = lambda: fetch_threads.append(threading.current_thread()) or self.published
+
+        key = asyncio.run(self.key_store.get_key_async("kid_1"))
+
+        self.assertIsNotNone(key)
+        self.assertIsNot(fetch_threads[0], threading.current_thread())
+
+    def test_endorsements_are_kept_per_key(self):
+        _, jwk = make_signing_key("kid_3", endorsements=["msteams"])
+        self.published = {"keys": [self.jwk_1, jwk]}
+        self.key_store.refresh()
+
+        self.assertEqual(self.key_store.get_endorsements("kid_3"), {"msteams"})
+        self.assertEqual(self.key_store.get_endorsements("kid_1"), set())
+
+    def test_failed_fetch_keeps_cached_keys(self):
+        key = self.key_store.get_key("kid_1")
+        self.key_store.fetch_jwks.side_effect = Exception("unavailable")
+
+        self.key_store.refresh()
+
+        self.assertIs(self.key_store.get_key("kid_1"), key)
+        self.assertEqual(self.key_store.stats()["failed_fetches"], 1)
+
+
+class TestBotFrameworkTokenValidation(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key, cls.jwk = make_signing_key("bot_kid", endorsements=["msteams"])
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-bot-jwks-loop")
+        self.addCleanup(self.event_loop.stop)
+        key_store = JWKSKeyStore("https://keys", event_loop=self.event_loop)
+        key_store.fetch_jwks = MagicMock(return_value={"keys": [self.jwk]})
+        self.service = TokenValidationService("test_tenant_id", bot_framework_key_store=key_store,
+                                              tenant_key_store=MagicMock())
+
+    def make_token(self, kid="bot_kid", **claims):
+        payload = {"iss": BOT_FRAMEWORK_ISSUER, "aud": "app_id", "exp": int(time.time()) + 600,
+                   "serviceurl": "https://smba.example/"}
+        payload.update(claims)
+        return "Bearer " + jwt.encode(payload, self.private_key, algorithm="RS256", headers={"kid": kid})
+
+    async def test_valid_token_returns_claims(self):
+        claims = await self.service.validate_bot_framework_token(self.make_token(), "app_id", "https://smba.example/", "msteams")
+
+        self.assertEqual(claims["aud"], "app_id")
+
+    async def test_invalid_tokens_are_rejected(self):
+        invalid = [
+            None,
+            self.make_token(aud="other_app"),
+            self.make_token(iss="https://attacker.example"),
+            self.make_token(exp=int(time.time()) - 3600),
+            self.make_token(kid="unknown_kid"),
+            self.make_token(serviceurl="https://other.example/"),
+        ]
+        for authorization in invalid:
+            with self.assertRaises(jwt.InvalidTokenError):
+                await self.service.validate_bot_framework_token(authorization, "app_id", "https://smba.example/", "msteams")
 
-        # Calling the method with a non-existent kid
-        public_key = service.get_public_key(mock_jwks, 'non_existent_kid')
+    async def test_key_not_endorsed_for_the_channel_is_rejected(self):
+        with self.assertRaises(jwt.InvalidTokenError):
+            await self.service.validate_bot_framework_token(self.make_token(), "app_id", "https://smba.example/", "webchat")
 
-        # Assertions
-        self.assertIsNone(public_key)
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,13 @@
+import asyncio
 import os
 import unittest
 from unittest import mock
 import requests
 from unittest.mock import patch, MagicMock
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 from app.services.user_validation_service import UserValidationService
+from app.utils.util_background_loop import BackgroundEventLoop
 
 class TestUserValidationService(unittest.TestCase):
     def setUp(self):
@@ -137,6 +141,162 @@ class TestUserValidationService(unittest.TestCase):
 
     # Additional test cases can be added to cover more edge cases, such as malformed URL, network errors, etc.
 
+
+class FakeGraph:
+    """Minimal Microsoft Graph serving /v1.0/users/{id} and /v1.0/$batch on a local port."""
+
+    def __init__(self, event_loop, users):
+        self.event_loop = event_loop
+        self.users = set(users)
+        self.requests = []
+        self.batches = []
+        self.status_override = None
+        self.delay = 0
+        app = web.Application()
+        app.router.add_get("/v1.0/users/{user_id}", self.get_user)
+        app.router.add_post("/v1.0/$batch", self.batch)
+        self.server = TestServer(app)
+        self.event_loop.submit(self.server.start_server()).result(5)
+
+    @property
+    def endpoint(self):
+        return str(self.server.make_url("/v1.0"))
+
+    async def get_user(self, request):
+        self.requests.append(request.match_info["user_id"])
+        await asyncio.sleep(self.delay)
+        if self.status_override:
+            return web.Response(status=self.status_override)
+        if request.match_info["user_id"] in self.users:
+            return web.json_response({"id": request.match_info["user_id"]})
+        return web.json_response({"error": {"code": "Request_ResourceNotFound"}}, status=404)
+
+    async def batch(self, request):
+        body = await request.json()
+        if len(body["requests"]) > 20:
+            return web.json_response({"error": {"code": "BadRequest"}}, status=400)
+        user_ids = [item["url"].split("/")[2].split("?")[0] for item in body["requests"]]
+        self.batches.append(user_ids)
+        if self.status_override:
+            return web.Response(status=self.status_override)
+        return web.json_response({"responses": [
+            {"id": item["id"], "status": 200 if user_id in self.users else 404}
+            for item, user_id in zip(body["requests"], user_ids)
+        ]})
+
+    def close(self):
+        self.event_loop.submit(self.server.close()).result(5)
+
+
+class TestCachedUserValidation(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-user-validation-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.graph = FakeGraph(self.event_loop, users={"known_user"})
+        self.addCleanup(self.graph.close)
+        patcher = patch.object(UserValidationService, 'get_access_token', return_value='mock_access_token')
+        self.mock_get_access_token = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = UserValidationService('mock_tenant_id', 'mock_client_id', 'mock_client_secret',
+                                             valid_ttl=3600, invalid_ttl=60, event_loop=self.event_loop)
+        self.service.graph_api_endpoint = self.graph.endpoint
+        self.addCleanup(self.service.shutdown)
+
+    async def test_returning_user_is_validated_from_cache(self):
+        self.assertTrue(await self.service.validate_user_async("known_user"))
+        self.assertTrue(await self.service.validate_user_async("known_user"))
+
+        self.assertEqual(self.graph.requests, ["known_user"])
+        self.assertEqual(self.service.stats()["hits"], 1)
+
+    async def test_unknown_user_is_cached_as_invalid(self):
+        self.assertFalse(await self.service.validate_user_async("unknown_user"))
+        self.assertFalse(await self.service.validate_user_async("unknown_user"))
+
+        self.assertEqual(self.graph.requests, ["unknown_user"])
+        self.assertIn("unknown_user", self.service.invalid_users)
+
+    async def test_concurrent_lookups_share_one_call(self):
+        self.graph.delay = 0.05
+
+        results = await asyncio.gather(*(self.service.validate_user_async("known_user") for _ in range(5)))
+
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(self.graph.requests, ["known_user"])
+        self.assertEqual(self.service.stats()["shared_lookups"], 4)
+
+    async def test_graph_errors_are_not_cached(self):
+        self.graph.status_override = 503
+        self.assertFalse(await self.service.validate_user_async("known_user"))
+
+        self.graph.status_override = None
+        self.assertTrue(await self.service.validate_user_async("known_user"))
+        self.assertEqual(len(self.graph.requests), 2)
+
+    def test_msal_app_is_reused(self):
+        with patch('msal.ConfidentialClientApplication') as mock_app:
+            self.assertIs(self.service.msal_app, self.service.msal_app)
+
+        mock_app.assert_called_once()
+
+
+class TestBatchedUserValidation(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-user-batch-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.users = {f"user_{index}" for index in range(30)}
+        self.graph = FakeGraph(self.event_loop, users=self.users)
+        self.addCleanup(self.graph.close)
+        patcher = patch.object(UserValidationService, 'get_access_token', return_value='mock_access_token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = UserValidationService('mock_tenant_id', 'mock_client_id', 'mock_client_secret',
+                                             batch_window=0.02, event_loop=self.event_loop)
+        self.service.graph_api_endpoint = self.graph.endpoint
+        self.addCleanup(self.service.shutdown)
+
+    async def validate_together(self, user_ids):
+        async def burst():
+            # started together on the service's loop, all lookups join a batch within one loop
+            # iteration, before the window timer can fire, however slow the machine is
+            return await asyncio.gather(*(self.service.validate_user_async(user_id) for user_id in user_ids))
+
+        return await self.event_loop.run(burst())
+
+    async def test_burst_is_resolved_with_batches_of_twenty(self):
+        results = await self.validate_together(sorted(self.users) + ["unknown_user"])
+
+        self.assertEqual(results, [True] * 30 + [False])
+        self.assertEqual(sorted(len(batch) for batch in self.graph.batches), [11, 20])
+        self.assertEqual(self.graph.requests, [])
+
+    async def test_batch_results_feed_the_cache(self):
+        await self.validate_together(["user_1", "unknown_user"])
+
+        self.assertTrue(await self.service.validate_user_async("user_1"))
+        self.assertFalse(await self.service.validate_user_async("unknown_user"))
+        self.assertEqual(len(self.graph.batches), 1)
+        self.assertIn("user_1", self.service.valid_users)
+        self.assertIn("unknown_user", self.service.invalid_users)
+
+    async def test_single_lookup_in_window_uses_plain_request(self):
+        self.assertTrue(await self.service.validate_user_async("user_1"))
+
+        self.assertEqual(self.graph.requests, ["user_1"])
+        self.assertEqual(self.graph.batches, [])
+
+    async def test_failed_batch_is_not_cached(self):
+        self.graph.status_override = 503
+
+        results = await self.validate_together(["user_1", "user_2"])
+
+        self.assertEqual(results, [False, False])
+        self.assertNotIn("user_1", self.service.invalid_users)
+        self.assertEqual(self.service.stats()["errors"], 2)
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.write_behind_service import WriteBehindQueue, interaction_document_id
+from app.utils.util_background_loop import BackgroundEventLoop
+
+
+def make_record(user_id, message_id, response="answer"):
+    return {"id": interaction_document_id(message_id, "prompt_response"), "user_id": user_id, "response": response}
+
+
+class TestWriteBehindQueue(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.event_loop = BackgroundEventLoop("test-write-behind-loop")
+        self.addCleanup(self.event_loop.stop)
+        self.cosmos_service = MagicMock()
+        self.cosmos_service.upsert_items_batch = AsyncMock()
+        self.queue = WriteBehindQueue(self.cosmos_service, flush_interval=0.01, max_queue_size=3,
+                                      retry_backoff=0, event_loop=self.event_loop)
+
+    async def wait_until_written(self, count):
+        for _ in range(200):
+            if self.queue.stats()["written"] + self.queue.stats()["failed"] >= count:
+                return
+            await asyncio.sleep(0.01)
+        self.fail("records were not written")
+
+    def test_document_id_is_stable_per_message(self):
+        self.assertEqual(interaction_document_id("m1", "prompt_response"), interaction_document_id("m1", "prompt_response"))
+        self.assertNotEqual(interaction_document_id("m1", "prompt_response"), interaction_document_id("m1", "generated_image"))
+
+    async def test_records_are_batched_per_partition(self):
+        self.queue.enqueue("interactions_container", make_record("a", "m1"))
+        self.queue.enqueue("interactions_container", make_record("a", "m2"))
+        self.queue.enqueue("images_info_container", make_record("a", "m3"))
+
+        await self.wait_until_written(3)
+
+        calls = sorted((call.args[0], call.args[1], len(call.args[2]))
+                       for call in self.cosmos_service.upsert_items_batch.await_args_list)
+        self.assertEqual(calls, [("images_info_container", "a", 1), ("interactions_container", "a", 2)])
+        self.assertEqual(self.queue.stats()["batches"], 2)
+
+    async def test_record_enqueued_twice_is_written_once(self):
+        self.queue.enqueue("interactions_container", make_record("a", "m1", "first"))
+        self.queue.enqueue("interactions_container", make_record("a", "m1", "second"))
+
+        await self.wait_until_written(1)
+
+        items = self.cosmos_service.upsert_items_batch.await_args.args[2]
+        self.assertEqual([item["response"] for item in items], ["second"])
+
+    async def test_failed_batch_is_retried(self):
+        self.cosmos_service.upsert_items_batch.side_effect = [RuntimeError("429"), None]
+
+        self.queue.enqueue("interactions_container", make_record("a", "m1"))
+        await self.wait_until_written(1)
+
+        self.assertEqual(self.cosmos_service.upsert_items_batch.await_count, 2)
+        self.assertEqual(self.queue.stats()["failed"], 0)
+
+    async def test_retry_does_not_overwrite_a_newer_version(self):
+        self.queue.flush_interval = 60
+        self.queue.retry_backoff = 0.05
+        written = []
+        first_attempt_failed = asyncio.Event()
+
+        async def upsert_items_batch(container_name, partition_key, items):
+            if not written and not first_attempt_failed.is_set():
+                first_attempt_failed.set()
+                raise RuntimeError("429")
+            written.extend(item["response"] for item in items)
+
+        self.cosmos_service.upsert_items_batch.side_effect = upsert_items_batch
+
+        async def scenario():
+            self.queue.enqueue("interactions_container", make_record("a", "history", "turn 1"))
+            first_flush = asyncio.get_running_loop().create_task(self.queue.flush())
+            await first_attempt_failed.wait()
+            # a second flush lands while the first batch is backing off
+            self.queue.enqueue("interactions_container", make_record("a", "history", "turns 1-2"))
+            await self.queue.flush()
+            await first_flush
+            await self.queue.drain()
+
+        await self.event_loop.run(scenario())
+
+        self.assertEqual(written, ["turn 1", "turns 1-2"])
+        self.assertEqual(self.queue.stats()["pending"], 0)
+
+    async def test_full_queue_drops_records(self):
+        self.queue.flush_interval = 60
+        results = [self.queue.enqueue("interactions_container", make_record("a", f"m{index}")) for index in range(4)]
+
+        self.assertEqual(results, [True, True, True, False])
+        self.assertEqual(self.queue.stats()["dropped"], 1)
+
+    async def test_shutdown_flushes_pending_records(self):
+        self.queue.flush_interval = 60
+        self.queue.enqueue("interactions_container", make_record("a", "m1"))
+
+        await asyncio.to_thread(self.queue.shutdown)
+
+        self.cosmos_service.upsert_items_batch.assert_awaited_once()
+        self.assertEqual(self.queue.stats()["pending"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from app.config.constants import DOCUMENT_GRADE_LOG_PREFIX
+from tools.calibrate_reranker_bands import band_report, read_graded_scores, suggest_thresholds
+
+
+def grade_line(score, grade, band="grade"):
+    record = json.dumps({"reranker_score": score, "grade": grade, "band": band})
+    return f"2026-10-01 12:00:00 INFO agent_state {DOCUMENT_GRADE_LOG_PREFIX}{record}\n"
+
+
+class TestCalibrateRerankerBands(unittest.TestCase):
+
+    def test_reads_only_llm_graded_documents(self):
+        lines = [
+            grade_line(2.5, "maybe"),
+            grade_line(3.8, "yes", band="accept"),
+            "2026-10-01 12:00:00 INFO unrelated line\n",
+            grade_line(None, "yes"),
+            grade_line(0.5, "no"),
+        ]
+
+        self.assertEqual(read_graded_scores(lines), [(2.5, True), (0.5, False)])
+
+    def test_suggests_bands_around_the_uncertain_scores(self):
+        samples = (
+            [(0.2 + index * 0.01, False) for index in range(30)]
+            + [(1.5, True), (1.6, False), (2.0, True), (2.2, False)]
+            + [(3.0 + index * 0.01, True) for index in range(30)]
+        )
+
+        reject_score, accept_score = suggest_thresholds(samples, precision=0.99, min_support=10)
+
+        self.assertEqual((reject_score, accept_score), (1.5, 3.0))
+        self.assertEqual(
+            band_report(samples, reject_score, accept_score),
+            {"accepted": 30, "rejected": 30, "graded": 4, "irrelevant_accepted": 0, "relevant_rejected": 0},
+        )
+
+    def test_no_threshold_without_enough_support(self):
+        self.assertEqual(suggest_thresholds([(3.5, True), (0.5, False)], min_support=5), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import json
+import unittest
+
+from app.config.constants import QUERY_ROUTE_LOG_PREFIX
+from app.services.query_router_service import LocalQueryRouter
+from tools.train_local_router import evaluate, read_logged_routes
+
+
+class TestTrainLocalRouter(unittest.TestCase):
+
+    def test_reads_route_log_lines_and_json_lines(self):
+        lines = [
+            f"2026-10-01 INFO agent_state {QUERY_ROUTE_LOG_PREFIX}" + json.dumps({"query": "Travel policy?", "datasource": "vectorstore"}),
+            json.dumps({"query": "Thanks!", "datasource": "web_search"}),
+            json.dumps({"query": "Unknown route", "datasource": "database"}),
+            "2026-10-01 INFO unrelated line",
+        ]
+
+        self.assertEqual(read_logged_routes(lines), [("Travel policy?", "vectorstore"), ("Thanks!", "web_search")])
+
+    def test_evaluate_reports_local_rate_and_accuracy(self):
+        samples = [("Draw a cat", "image_processing"), ("Translate this", "vectorstore"), ("Who is Kirill?", "vectorstore")]
+
+        self.assertEqual(
+            evaluate(LocalQueryRouter(), samples),
+            {"samples": 3, "local_rate": 2 / 3, "local_accuracy": 0.5},
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
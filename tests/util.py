@@ -6,4 +6,13 @@ class ResponseFunctionDictionary:
         if name in self.response_dict:
             return self.response_dict[name]
         else:
-            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
\ No newline at end of file
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+class FakeClock:
+    """Callable clock for services that take a `clock`; tests advance it by setting `now`."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
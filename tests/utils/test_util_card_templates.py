@@ -0,0 +1,59 @@
+import json
+import unittest
+
+from app.utils.util_card_templates import CardTemplate
+
+
+CARD = {
+    "type": "AdaptiveCard",
+    "body": [
+        {"type": "Image", "url": "https://template"},
+        {"type": "TextBlock", "text": "static"},
+    ],
+    "actions": [],
+}
+
+
+class TestCardTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.template = CardTemplate(CARD, slots={"image_url": ("body", 0, "url"), "actions": ("actions",)})
+
+    def test_render_fills_slots_without_touching_the_template(self):
+        card = self.template.render(image_url="https://image", actions=[{"title": "q"}])
+
+        self.assertEqual(card["body"][0]["url"], "https://image")
+        self.assertEqual(card["actions"], [{"title": "q"}])
+        self.assertEqual(self.template.render(), CARD)
+
+    def test_unchanged_parts_are_shared(self):
+        first = self.template.render(image_url="https://first")
+        second = self.template.render(image_url="https://second")
+
+        self.assertIs(first["body"][1], second["body"][1])
+        self.assertIsNot(first["body"][0], second["body"][0])
+
+    def test_payload_size_is_constant_across_renders(self):
+        sizes = {len(json.dumps(self.template.render(actions=[{"title": f"q{index:03d}"}]))) for index in range(100)}
+
+        self.assertEqual(len(sizes), 1)
+
+    def test_template_is_independent_of_the_source_card(self):
+        source = json.loads(json.dumps(CARD))
+        template = CardTemplate(source, slots={"actions": ("actions",)})
+        source["actions"].append({"title": "leaked"})
+
+        self.assertEqual(template.render()["actions"], [])
+
+    def test_none_keeps_the_template_value(self):
+        self.assertEqual(self.template.render(image_url=None)["body"][0]["url"], "https://template")
+
+    def test_invalid_slots_are_rejected(self):
+        with self.assertRaises(ValueError):
+            CardTemplate(CARD, slots={"missing": ("body", 5, "url")})
+        with self.assertRaises(KeyError):
+            self.template.render(unknown="value")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Suggests RERANKER_ACCEPT_SCORE and RERANKER_REJECT_SCORE from logged document grades.
+
+grade_documents logs the semantic reranker score and the LLM grade of every document it grades.
+Only documents that went to the LLM grader are used, so collect the logs with the score bands
+disabled (or wide) for an unbiased sample. Run from the repository root:
+
+    python -m tools.calibrate_reranker_bands app.log --precision 0.95 --min-support 20
+
+The accept score is the lowest score above which at least `precision` of the documents were
+graded relevant ("yes" or "maybe"); the reject score is the highest score below which at least
+`precision` were graded irrelevant.
+"""
+import argparse
+import json
+
+from app.config.constants import DOCUMENT_GRADE_LOG_PREFIX
+
+RELEVANT_GRADES = ("yes", "maybe")
+
+
+def read_graded_scores(lines):
+    """Returns (reranker_score, relevant) for every LLM-graded document in the log lines."""
+    samples = []
+    for line in lines:
+        _, prefix, record = line.partition(DOCUMENT_GRADE_LOG_PREFIX)
+        if not prefix:
+            continue
+        try:
+            record = json.loads(record)
+        except json.JSONDecodeError:
+            continue
+        if record.get("band", "grade") != "grade" or record.get("reranker_score") is None:
+            continue
+        samples.append((float(record["reranker_score"]), record.get("grade") in RELEVANT_GRADES))
+    return samples
+
+
+def suggest_thresholds(samples, precision=0.95, min_support=20):
+    """
+    Returns (reject_score, accept_score); either is None when no threshold reaches the precision
+    with at least `min_support` documents on its side.
+    """
+    scores = sorted({score for score, _ in samples})
+
+    accept_score = None
+    for threshold in scores:
+        above = [relevant for score, relevant in samples if score >= threshold]
+        if len(above) >= min_support and sum(above) / len(above) >= precision:
+            accept_score = threshold
+            break
+
+    reject_score = None
+    for threshold in reversed(scores):
+        if accept_score is not None and threshold > accept_score:
+            continue
+        below = [relevant for score, relevant in samples if score < threshold]
+        if len(below) >= min_support and 1 - sum(below) / len(below) >= precision:
+            reject_score = threshold
+            break
+    return reject_score, accept_score
+
+
+def band_report(samples, reject_score, accept_score):
+    """Counts how the sampled documents would have been split by the suggested bands."""
+    report = {"accepted": 0, "rejected": 0, "graded": 0, "irrelevant_accepted": 0, "relevant_rejected": 0}
+    for score, relevant in samples:
+        if accept_score is not None and score >= accept_score:
+            report["accepted"] += 1
+            report["irrelevant_accepted"] += int(not relevant)
+        elif reject_score is not None and score < reject_score:
+            report["rejected"] += 1
+            report["relevant_rejected"] += int(relevant)
+        else:
+            report["graded"] += 1
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="log files containing the document grade lines")
+    parser.add_argument("--precision", type=float, default=0.95)
+    parser.add_argument("--min-support", type=int, default=20)
+    args = parser.parse_args()
+
+    samples = []
+    for path in args.logs:
+        with open(path, encoding="utf-8", errors="replace") as log_file:
+            samples.extend(read_graded_scores(log_file))
+    if not samples:
+        parser.exit(1, "No graded documents found in the logs\n")
+
+    reject_score, accept_score = suggest_thresholds(samples, args.precision, args.min_support)
+    report = band_report(samples, reject_score, accept_score)
+    print(f"graded documents: {len(samples)}, relevant: {sum(relevant for _, relevant in samples)}")
+    print(f"RERANKER_ACCEPT_SCORE={accept_score if accept_score is not None else '(not enough evidence)'}")
+    print(f"RERANKER_REJECT_SCORE={reject_score if reject_score is not None else '(not enough evidence)'}")
+    print(f"would skip grading for {report['accepted'] + report['rejected']} of {len(samples)} documents: {report}")
+
+
+if __name__ == "__main__":
+    main()
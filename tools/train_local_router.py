@@ -0,0 +1,87 @@
+"""
+Trains the centroid model of the local query router from logged LLM routes.
+
+route_question logs the rephrased query and the datasource chosen by the LLM router for every
+query the local router left to it. Labelled queries can also be given as JSON lines of the form
+{"query": ..., "datasource": ...}. Run from the repository root:
+
+    python -m tools.train_local_router app.log --output local_router_model.json
+
+Every `--holdout`-th query is kept out of training and used to report how many queries the
+local router would answer and how often it agrees with the LLM.
+"""
+import argparse
+import json
+
+from app.config.constants import QUERY_ROUTE_LOG_PREFIX
+from app.services.query_router_service import ROUTES, LocalQueryRouter, save_router_model, train_centroids
+
+
+def read_logged_routes(lines):
+    """Returns (query, datasource) for every route log line or JSON line with a known route."""
+    samples = []
+    for line in lines:
+        _, prefix, record = line.partition(QUERY_ROUTE_LOG_PREFIX)
+        try:
+            record = json.loads(record if prefix else line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(record, dict) and record.get("query") and record.get("datasource") in ROUTES:
+            samples.append((record["query"], record["datasource"]))
+    return samples
+
+
+def read_route_files(paths):
+    samples = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as route_file:
+            samples.extend(read_logged_routes(route_file))
+    return samples
+
+
+def evaluate(router, samples):
+    """Returns the share of samples routed locally and the accuracy of those local routes."""
+    local, correct = 0, 0
+    for query, datasource in samples:
+        route, _ = router.classify(query)
+        if route is not None:
+            local += 1
+            correct += int(route == datasource)
+    return {
+        "samples": len(samples),
+        "local_rate": local / len(samples) if samples else 0.0,
+        "local_accuracy": correct / local if local else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="log files or JSON lines with labelled queries")
+    parser.add_argument("--output", default="local_router_model.json")
+    parser.add_argument("--dimensions", type=int, default=4096)
+    parser.add_argument("--holdout", type=int, default=5, help="keep every n-th query for evaluation, 0 to train on all")
+    parser.add_argument("--min-similarity", type=float, default=0.3)
+    parser.add_argument("--min-margin", type=float, default=0.1)
+    args = parser.parse_args()
+
+    samples = list(dict.fromkeys(read_route_files(args.logs)))
+    if not samples:
+        parser.exit(1, "No labelled queries found\n")
+    if args.holdout:
+        train = [sample for index, sample in enumerate(samples) if index % args.holdout]
+        holdout = samples[::args.holdout]
+    else:
+        train, holdout = samples, []
+
+    centroids = train_centroids(train, args.dimensions)
+    router = LocalQueryRouter(centroids, args.dimensions, args.min_similarity, args.min_margin)
+    counts = {route: sum(datasource == route for _, datasource in train) for route in ROUTES}
+    print(f"trained on {len(train)} queries: {counts}")
+    if holdout:
+        print(f"holdout: {evaluate(router, holdout)}")
+    save_router_model(args.output, centroids, args.dimensions)
+    print(f"model written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()